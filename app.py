@@ -2,6 +2,8 @@ import pandas as pd
 from helper import *
 from backtesting import BacktestStrategy
 from web_socket_utility import WebSocketHandler
+from candle_store import is_store, load_frame
+import logging
 import time
 
 
@@ -20,6 +22,13 @@ def process_data(csv_path):
         "taker_buy_quote_volume",
         "ignore",
     ]
+    if is_store(csv_path):
+        # Binary candle store: columns are memory-mapped, no text parsing needed
+        df = load_frame(csv_path)
+        print(
+            f"DataFrame loaded successfully with {df.shape[0]} rows and {df.shape[1]} columns."
+        )
+        return df
     try:
         df = pd.read_csv(csv_path)
         # Drop the unnamed column if it exists
@@ -42,6 +51,8 @@ def process_data(csv_path):
 
 
 if __name__ == "__main__":
+    # Trade messages from the backtest go through logging; INFO shows them
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # Initialize the WebSocketHandler only once
     ws_handler = WebSocketHandler()
 
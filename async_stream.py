@@ -0,0 +1,235 @@
+import asyncio
+import json
+import time
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+from websockets.asyncio.client import connect
+
+from configs.config import FUTURES, STREAM_LIMITS
+
+try:
+    # Optional: several times faster than json for the small kline payloads
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(payload):
+        return orjson.dumps(payload).decode()
+
+except ImportError:
+    loads = json.loads
+    dumps = json.dumps
+
+Kline = namedtuple(
+    "Kline",
+    [
+        "symbol",
+        "interval",
+        "open_time",
+        "close_time",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "quote_volume",
+        "count",
+        "taker_buy_volume",
+        "taker_buy_quote_volume",
+        "closed",
+        "event_time",
+        # perf_counter_ns() when the message was read off the socket, if known
+        "received_ns",
+    ],
+    defaults=[None],
+)
+
+
+def parse_kline(event, received_ns=None) -> Kline:
+    k = event["k"]
+    return Kline(
+        event["s"],
+        k["i"],
+        k["t"],
+        k["T"],
+        float(k["o"]),
+        float(k["h"]),
+        float(k["l"]),
+        float(k["c"]),
+        float(k["v"]),
+        float(k["q"]),
+        k["n"],
+        float(k["V"]),
+        float(k["Q"]),
+        k["x"],
+        event["E"],
+        received_ns,
+    )
+
+
+def stream_name(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+class KlineConsumer:
+    # Bounded queue for one consumer. "drop_oldest" keeps the socket reader moving
+    # and counts what was lost; "block" pushes back on the connection instead.
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        policy: str = "drop_oldest",
+        closed_only: bool = False,
+        symbols: Optional[Iterable[str]] = None,
+    ):
+        if policy not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.closed_only = closed_only
+        self.symbols = {symbol.upper() for symbol in symbols} if symbols else None
+        self.delivered = 0
+        self.dropped = 0
+
+    def wants(self, kline: Kline) -> bool:
+        if self.closed_only and not kline.closed:
+            return False
+        return self.symbols is None or kline.symbol in self.symbols
+
+    async def put(self, kline: Kline):
+        if self.policy == "block":
+            await self.queue.put(kline)
+        else:
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(kline)
+        self.delivered += 1
+
+    async def get(self) -> Kline:
+        return await self.queue.get()
+
+
+class KlineStreamClient:
+    # Many symbol@kline_interval streams multiplexed over a few combined-stream
+    # connections on one event loop, fanned out to bounded consumer queues
+    def __init__(
+        self,
+        streams: Iterable[str],
+        url: Optional[str] = None,
+        streams_per_connection: Optional[int] = None,
+        subscribe_batch: int = 100,
+    ):
+        self.streams = list(dict.fromkeys(streams))
+        self.url = url or FUTURES["combined_stream"]
+        self.streams_per_connection = (
+            streams_per_connection or STREAM_LIMITS["streams_per_connection"]
+        )
+        self.subscribe_batch = subscribe_batch
+        self.consumers: List[KlineConsumer] = []
+        self.keep_running = True
+        self.id = 1
+        self.connected = 0
+        self.messages = 0
+        self.parse_errors = 0
+        self.reconnects = 0
+        self._tasks = []
+
+    @classmethod
+    def for_symbols(cls, symbols: Iterable[str], interval: str = "1m", **kwargs):
+        return cls([stream_name(symbol, interval) for symbol in symbols], **kwargs)
+
+    def add_consumer(self, **kwargs) -> KlineConsumer:
+        consumer = KlineConsumer(**kwargs)
+        self.consumers.append(consumer)
+        return consumer
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connected,
+            "messages": self.messages,
+            "parse_errors": self.parse_errors,
+            "reconnects": self.reconnects,
+            "delivered": [consumer.delivered for consumer in self.consumers],
+            "dropped": [consumer.dropped for consumer in self.consumers],
+        }
+
+    def _groups(self):
+        size = self.streams_per_connection
+        return [
+            self.streams[start : start + size]
+            for start in range(0, len(self.streams), size)
+        ]
+
+    async def _subscribe(self, websocket, streams):
+        # One SUBSCRIBE per batch of streams, paced under the incoming message limit
+        delay = 1 / STREAM_LIMITS["messages_per_second"]
+        for start in range(0, len(streams), self.subscribe_batch):
+            payload = {
+                "method": "SUBSCRIBE",
+                "params": streams[start : start + self.subscribe_batch],
+                "id": self.id,
+            }
+            self.id += 1
+            await websocket.send(dumps(payload))
+            await asyncio.sleep(delay)
+
+    async def _dispatch(self, message):
+        received_ns = time.perf_counter_ns()
+        try:
+            payload = loads(message)
+            # Combined streams wrap the event as {"stream": ..., "data": ...}
+            event = payload.get("data", payload)
+            if event.get("e") != "kline":
+                return
+            kline = parse_kline(event, received_ns)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.parse_errors += 1
+            return
+        self.messages += 1
+        for consumer in self.consumers:
+            if consumer.wants(kline):
+                await consumer.put(kline)
+
+    async def _connection(self, streams):
+        reconnect_delay = 1
+        while self.keep_running:
+            try:
+                async with connect(self.url) as websocket:
+                    self.connected += 1
+                    try:
+                        await self._subscribe(websocket, streams)
+                        reconnect_delay = 1  # Reset delay after successful connection
+                        async for message in websocket:
+                            await self._dispatch(message)
+                            if not self.keep_running:
+                                break
+                    finally:
+                        self.connected -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"WebSocket error: {e}")
+            if self.keep_running:
+                self.reconnects += 1
+                await asyncio.sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, 60)
+
+    async def run(self):
+        self.keep_running = True
+        self._tasks = [
+            asyncio.create_task(self._connection(streams)) for streams in self._groups()
+        ]
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            if self.keep_running:
+                raise
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    def stop(self):
+        self.keep_running = False
+        for task in self._tasks:
+            task.cancel()
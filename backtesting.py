@@ -1,61 +1,90 @@
+import logging
+import numpy as np
 import pandas as pd
-import ta
 import matplotlib.pyplot as plt
 from typing import Optional, Dict
+from configs.config import INTERVAL_MS
+from engine import (
+    MAINTENANCE_MARGIN,
+    RESULT_COLUMNS,
+    SIDE_NAMES,
+    candle_columns,
+    entry_signals,
+    ledger_from_columns,
+    simulate,
+    simulate_intrabar,
+    win_rate,
+    total_profit_loss,
+)
+from export import append_to_dataset, check_format, format_for, write_frame
+from helper import find_candle_files, load_candles
+from indicators import IndicatorCache, ema, macd, rsi
+from instrumentation import RunReport, profiled
+from metrics import equity_curve, risk_metrics
+from plotting import DEFAULT_WIDTH, plot_backtest
+from strategies import Dataset, Strategy
 
+logger = logging.getLogger(__name__)
 
-class BacktestStrategy:
-    def __init__(
-        self, data, tp_percent: int, sl_percent: int, leverage: int, initial_margin: int
-    ):
-        self.data = data
-        self.tp_percent = tp_percent / 100  # Convert to decimal
-        self.sl_percent = sl_percent / 100  # Convert to decimal
-        self.leverage = leverage  # Leverage factor (e.g., 10 for 10x leverage)
-        self.initial_margin = initial_margin  # Initial margin allocated per trade
-        self.maintenance_margin = 0.8  # Liquidation if margin falls below 80%
-        # Calculate EMA
-        self.data["EMA"] = ta.trend.EMAIndicator(
-            self.data["close"], window=200
-        ).ema_indicator()
-        # Calculate MACD
-        macd = ta.trend.MACD(self.data["close"])
-        self.data["MACD"] = macd.macd()
-        self.data["Signal_Line"] = macd.macd_signal()
-        # Calculate RSI
-        self.data["RSI"] = ta.momentum.RSIIndicator(self.data["close"], window=14).rsi()
-        # Drop rows with NaN values
-        self.data.dropna(inplace=True)
 
-
-import pandas as pd
-import ta
-import matplotlib.pyplot as plt
-from typing import Optional, Dict
+def _to_ms(values):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    return values.to_numpy(dtype=np.int64)
 
 
 class BacktestStrategy:
     def __init__(
-        self, data, tp_percent: int, sl_percent: int, leverage: int, initial_margin: int
+        self,
+        data,
+        tp_percent: int,
+        sl_percent: int,
+        leverage: int,
+        initial_margin: int,
+        indicator_cache: Optional[IndicatorCache] = None,
+        symbol: Optional[str] = None,
+        interval: Optional[str] = None,
+        report: Optional[RunReport] = None,
     ):
         self.data = data
         self.tp_percent = tp_percent / 100  # Convert to decimal
         self.sl_percent = sl_percent / 100  # Convert to decimal
         self.leverage = leverage  # Leverage factor (e.g., 10 for 10x leverage)
         self.initial_margin = initial_margin  # Initial margin allocated per trade
-        self.maintenance_margin = 0.8  # Liquidation if margin falls below 80%
-        # Calculate EMA
-        self.data["EMA"] = ta.trend.EMAIndicator(
-            self.data["close"], window=200
-        ).ema_indicator()
-        # Calculate MACD
-        macd = ta.trend.MACD(self.data["close"])
-        self.data["MACD"] = macd.macd()
-        self.data["Signal_Line"] = macd.macd_signal()
-        # Calculate RSI
-        self.data["RSI"] = ta.momentum.RSIIndicator(self.data["close"], window=14).rsi()
-        # Drop rows with NaN values
-        self.data.dropna(inplace=True)
+        self.maintenance_margin = MAINTENANCE_MARGIN
+        # Indicators are memoized by data fingerprint and window, so repeated runs
+        # over the same candles reuse them (symbol/interval only label disk entries)
+        self.indicator_cache = indicator_cache
+        self.symbol = symbol
+        self.interval = interval
+        self.strategy = None
+        # Typed trade ledger written by the array engines (engine.LEDGER_DTYPE)
+        self.ledger = None
+        # Stage timings and counters of the runs (see instrumentation.RunReport)
+        self.report = report or RunReport()
+        with self.report.stage("indicators"):
+            close = self.data["close"]
+            # Calculate EMA
+            self.data["EMA"] = ema(close, 200, **self._cache_args())
+            # Calculate MACD
+            self.data["MACD"], self.data["Signal_Line"] = macd(
+                close, **self._cache_args()
+            )
+            # Calculate RSI
+            self.data["RSI"] = rsi(close, 14, **self._cache_args())
+            # Drop rows with NaN values
+            self.data.dropna(inplace=True)
+        # Stages recorded so far (loading, default indicators) are kept across
+        # runs; each run_backtest replaces the stages of the previous one
+        self._setup_stages = len(self.report.stages)
+
+    def _cache_args(self):
+        return {
+            "cache": self.indicator_cache,
+            "symbol": self.symbol,
+            "interval": self.interval,
+        }
 
     def calculate_indicators(
         self,
@@ -63,21 +92,21 @@ class BacktestStrategy:
         MACD_DAYS: Optional[Dict[str, int]] = None,
         RSI_DAYS: Optional[int] = None,
     ):
-        self.data["EMA"] = ta.trend.EMAIndicator(
-            self.data["close"], window=EMA_DAYS if EMA_DAYS else 200
-        ).ema_indicator()
-        self.data["RSI"] = ta.momentum.RSIIndicator(
-            self.data["close"], window=RSI_DAYS if RSI_DAYS else 14
-        ).rsi()
+        close = self.data["close"]
+        self.data["EMA"] = ema(
+            close, EMA_DAYS if EMA_DAYS else 200, **self._cache_args()
+        )
+        self.data["RSI"] = rsi(
+            close, RSI_DAYS if RSI_DAYS else 14, **self._cache_args()
+        )
         if MACD_DAYS:
-            macd = ta.trend.MACD(
-                self.data["close"],
+            self.data["MACD"], self.data["Signal_Line"] = macd(
+                close,
                 window_fast=MACD_DAYS.get("window_fast", 12),
                 window_slow=MACD_DAYS.get("window_slow", 26),
                 window_sign=MACD_DAYS.get("window_sign", 9),
+                **self._cache_args(),
             )
-            self.data["MACD"] = macd.macd()
-            self.data["Signal_Line"] = macd.macd_signal()
 
     def calculate_liquidation(self, buy_price: int, side: str):
         liquidation_price = 0
@@ -100,10 +129,226 @@ class BacktestStrategy:
         EMA_DAYS: Optional[int] = None,
         MACD_DAYS: Optional[Dict[str, int]] = None,
         RSI_DAYS: Optional[int] = None,
+        engine: str = "vectorized",
+        fill_model: str = "close",
+        fine_data: Optional[pd.DataFrame] = None,
+        strategy: Optional[Strategy] = None,
+        candle_columns: bool = False,
+        export: Optional[str] = "ledger",
+        output_path: str = "backtest_results.csv",
+        output_format: Optional[str] = None,
+        dataset_path: Optional[str] = None,
+        profile: Optional[str] = None,
+        profile_output: Optional[str] = None,
+    ):
+        if engine not in ("legacy", "vectorized"):
+            raise ValueError(f"Unknown backtest engine: {engine}")
+        if fill_model not in ("close", "intrabar"):
+            raise ValueError(f"Unknown fill model: {fill_model}")
+        if export not in ("ledger", "candles", None):
+            raise ValueError(f"Unknown export mode: {export}")
+        if export and not dataset_path:
+            # Fail before the run rather than after it
+            check_format(output_format or format_for(output_path))
+        del self.report.stages[self._setup_stages :]
+        # Result columns of an earlier run (or another engine) describe other
+        # trades; only this run's are kept or exported
+        self.data.drop(columns=RESULT_COLUMNS, errors="ignore", inplace=True)
+        # profile="cprofile" or "pyinstrument" profiles the whole run
+        with profiled(profile, profile_output):
+            if EMA_DAYS or MACD_DAYS or RSI_DAYS:
+                with self.report.stage("indicators"):
+                    self.calculate_indicators(EMA_DAYS, MACD_DAYS, RSI_DAYS)
+
+            # A pluggable strategy replaces the built-in entry rules; its signals
+            # are always simulated by the array engine
+            self.strategy = strategy
+            self.ledger = None
+            if fill_model == "intrabar":
+                # Always array based: high/low checks with finer data for
+                # ambiguous bars
+                self._run_intrabar_backtest(fine_data)
+            elif engine == "vectorized" or strategy is not None:
+                self._run_vectorized_backtest()
+            else:
+                with self.report.stage("backtest_loop"):
+                    self._run_legacy_backtest()
+                    self.ledger = ledger_from_columns(
+                        self.data["close"].to_numpy(),
+                        self.data["Position"].to_numpy(),
+                        self.data["Trade_Result"].to_numpy(),
+                        self.data["side"].to_numpy(),
+                        self.data["Liquidated"].to_numpy(),
+                    )
+            # The array engines only record the trades; the legacy per-candle
+            # result columns are added on request
+            if candle_columns and "Position" not in self.data:
+                with self.report.stage("candle_columns"):
+                    self.add_candle_columns()
+            with self.report.stage("export"):
+                self.export_results(export, output_path, output_format, dataset_path)
+        self.report.count(
+            engine=(
+                engine if strategy is None and fill_model == "close" else "vectorized"
+            ),
+            fill_model=fill_model,
+            candles=len(self.data),
+            # Entries as the legacy Position == 1 marks count them: a trade
+            # closed on its entry candle shows only the exit
+            trades=int((self.ledger["exit_index"] != self.ledger["entry_index"]).sum()),
+            open_trades=int((self.ledger["exit_index"] < 0).sum()),
+            liquidations=int(self.ledger["liquidated"].sum()),
+        )
+        logger.info("Backtest finished\n%s", self.report)
+
+    def export_results(
+        self,
+        export: Optional[str] = "ledger",
+        output_path: str = "backtest_results.csv",
+        output_format: Optional[str] = None,
+        dataset_path: Optional[str] = None,
+    ):
+        # export=None skips writing entirely (e.g. inside sweep workers);
+        # "candles" writes the whole annotated frame like the original loop did
+        if export == "candles":
+            if "Position" not in self.data:
+                self.add_candle_columns()
+            frame = self.data
+        elif export == "ledger":
+            frame = self.trade_ledger()
+        else:
+            return None
+        if dataset_path:
+            # Many runs into one dataset, partitioned by market
+            partition = {
+                "symbol": self.symbol or "unknown",
+                "interval": self.interval or "unknown",
+            }
+            frame = frame.assign(
+                tp_percent=self.tp_percent * 100,
+                sl_percent=self.sl_percent * 100,
+                leverage=self.leverage,
+            )
+            return append_to_dataset(frame, dataset_path, partition, output_format)
+        return write_frame(frame, output_path, output_format)
+
+    def add_candle_columns(self):
+        for column, values in candle_columns(self.ledger, len(self.data)).items():
+            self.data[column] = values
+
+    def trade_ledger(self) -> pd.DataFrame:
+        # One row per trade with the candle times and readable sides
+        ledger = pd.DataFrame(self.ledger)
+        open_time = self.data["open_time"].to_numpy()
+        ledger.insert(1, "entry_time", open_time[ledger["entry_index"]])
+        closed = ledger["exit_index"] >= 0
+        exit_time = pd.Series(open_time[ledger["exit_index"]]).where(closed)
+        ledger.insert(3, "exit_time", exit_time)
+        ledger["side"] = ledger["side"].map(SIDE_NAMES)
+        return ledger
+
+    def _entry_signals(self):
+        # (close, long_mask, short_mask, exit_mask, start)
+        close = self.data["close"].to_numpy(dtype="float64")
+        if self.strategy is not None:
+            dataset = Dataset(
+                self.data, self.indicator_cache, self.symbol, self.interval
+            )
+            return (close,) + self.strategy.signals(dataset)
+        long_mask, short_mask = entry_signals(
+            close,
+            self.data["EMA"].to_numpy(),
+            self.data["MACD"].to_numpy(),
+            self.data["Signal_Line"].to_numpy(),
+            self.data["RSI"].to_numpy(),
+        )
+        return close, long_mask, short_mask, None, 1
+
+    def _run_vectorized_backtest(self):
+        with self.report.stage("signals"):
+            close, long_mask, short_mask, exit_mask, start = self._entry_signals()
+        with self.report.stage("simulate"):
+            self.ledger = self._simulate(close, long_mask, short_mask, exit_mask, start)
+
+    def _simulate(self, close, long_mask, short_mask, exit_mask, start):
+        return simulate(
+            close,
+            long_mask,
+            short_mask,
+            self.tp_percent,
+            self.sl_percent,
+            self.leverage,
+            self.initial_margin,
+            self.maintenance_margin,
+            start=start,
+            exit_mask=exit_mask,
+        )
+
+    def _run_intrabar_backtest(self, fine_data=None):
+        with self.report.stage("signals"):
+            close, long_mask, short_mask, exit_mask, start = self._entry_signals()
+        with self.report.stage("simulate"):
+            self.ledger = self._simulate_intrabar(
+                close, long_mask, short_mask, exit_mask, start, fine_data
+            )
+
+    def _simulate_intrabar(
+        self, close, long_mask, short_mask, exit_mask, start, fine_data
     ):
-        if EMA_DAYS or MACD_DAYS or RSI_DAYS:
-            self.calculate_indicators(EMA_DAYS, MACD_DAYS, RSI_DAYS)
+        open_time = _to_ms(self.data["open_time"])
+        if self.interval in INTERVAL_MS:
+            interval_ms = INTERVAL_MS[self.interval]
+        else:
+            interval_ms = int(np.median(np.diff(open_time)))
+        return simulate_intrabar(
+            open_time,
+            self.data["open"].to_numpy(dtype="float64"),
+            self.data["high"].to_numpy(dtype="float64"),
+            self.data["low"].to_numpy(dtype="float64"),
+            close,
+            long_mask,
+            short_mask,
+            self.tp_percent,
+            self.sl_percent,
+            self.leverage,
+            self.initial_margin,
+            self.maintenance_margin,
+            interval_ms,
+            fine_loader=lambda: self._fine_candles(fine_data, interval_ms),
+            start=start,
+            exit_mask=exit_mask,
+        )
 
+    def _fine_candles(self, fine_data, interval_ms):
+        # Only called when a candle touched both TP and SL. Without explicit data,
+        # use the finest interval stored under data/ for this symbol.
+        if fine_data is None and self.symbol:
+            finer = sorted(
+                (ms, interval)
+                for interval, ms in INTERVAL_MS.items()
+                if ms < interval_ms
+            )
+            for _, interval in finer:
+                if find_candle_files(self.symbol, interval):
+                    fine_data = load_candles(
+                        self.symbol,
+                        interval,
+                        self.data["open_time"].iloc[0],
+                        self.data["open_time"].iloc[-1]
+                        + pd.Timedelta(milliseconds=interval_ms),
+                        columns=["open_time", "open", "high", "low"],
+                    )
+                    break
+        if fine_data is None or fine_data.empty:
+            return None
+        return (
+            _to_ms(fine_data["open_time"]),
+            fine_data["open"].to_numpy(dtype="float64"),
+            fine_data["high"].to_numpy(dtype="float64"),
+            fine_data["low"].to_numpy(dtype="float64"),
+        )
+
+    def _run_legacy_backtest(self):
         self.data["Position"] = 0  # to filter later to check results
         self.data["Trade_Result"] = 0.0  # To store profit or loss for each trade
         self.data["Trade_Type"] = None  # To store type of trade ('buy' or 'sell')
@@ -131,7 +376,7 @@ class BacktestStrategy:
                 # Calculate stop loss and take profit prices considering leverage
                 stop_loss_price = buy_price * (1 - (self.sl_percent / self.leverage))
                 take_profit_price = buy_price * (1 + (self.tp_percent / self.leverage))
-                print(f"Bought at index {i}, price {buy_price} - Long")
+                logger.info("Bought at index %s, price %s - Long", i, buy_price)
 
             # Buy condition Short Position
             if (
@@ -155,7 +400,7 @@ class BacktestStrategy:
                 take_profit_price = buy_price * (
                     1 - (self.tp_percent / self.leverage)
                 )  # Take profit below entry for short
-                print(f"Sold at index {i}, price {buy_price} - Short")
+                logger.info("Sold at index %s, price %s - Short", i, buy_price)
 
             if buy_price is not None:
                 current_price = self.data["close"].iloc[i]
@@ -184,7 +429,7 @@ class BacktestStrategy:
                     self.data.loc[self.data.index[i], "Trade_Result"] = trade_result
                     self.data.loc[self.data.index[i], "Trade_Type"] = "Liquidated"
                     buy_price = None  # Reset buy_price after liquidation
-                    print(f"Liquidated at index {i}, price {sell_price}")
+                    logger.info("Liquidated at index %s, price %s", i, sell_price)
 
                 # Otherwise, check for TP/SL
                 elif (
@@ -208,155 +453,57 @@ class BacktestStrategy:
                     else:
                         self.data.loc[self.data.index[i], "Trade_Type"] = "sell"
                         self.data.loc[self.data.index[i], "side"] = "Long"
-                    print(f"Closed at index {i}, price {sell_price}")
+                    logger.info("Closed at index %s, price %s", i, sell_price)
                     buy_price = None  # Reset buy_price after closing the position
                     stop_loss_price = None  # Reset stop loss
                     take_profit_price = None  # Reset Take profit
-                    # Save the results to a new CSV file
-        output_csv_path = "backtest_results.csv"
-        self.data.to_csv(output_csv_path, index=False)
-
-    def plot_results(self):
-        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 10), sharex=True)
-        # First subplot: Close Price, EMA, Buy/Sell trades
-        ax1.plot(
-            self.data.index,
-            self.data["close"],
-            label="Close Price",
-            color="green",
-            alpha=0.7,
-        )
-        ax1.plot(self.data.index, self.data["EMA"], label="EMA", color="yellow")
-
-        # Plot long position entries (buys)
-        long_entries = self.data[
-            (self.data["Position"] == 1) & (self.data["side"] == "Long")
-        ]
-        ax1.scatter(
-            long_entries.index,
-            long_entries["close"],
-            color="brown",
-            marker="^",
-            label="Long Entry",
-        )
-
-        # Plot short position entries (sells)
-        short_entries = self.data[
-            (self.data["Position"] == 1) & (self.data["side"] == "Short")
-        ]
-        ax1.scatter(
-            short_entries.index,
-            short_entries["close"],
-            color="purple",
-            marker="v",
-            label="Short Entry",
-        )
 
-        # Plot lost trades for Long positions (negative result is a loss for Long)
-        lost_long_trades = self.data[
-            (self.data["Trade_Result"] < 0) & (self.data["side"] == "Long")
-        ]
-        ax1.scatter(
-            lost_long_trades.index,
-            lost_long_trades["close"],
-            color="red",
-            marker="x",
-            label="Lost Long Trades",
-        )
+    def plot_results(self, output: Optional[str] = None, width: int = DEFAULT_WIDTH):
+        # Lines are decimated to `width` points and the markers come from the
+        # ledger. With `output` the chart is written to that file without opening
+        # a window (works on headless machines); otherwise it is shown.
+        figure = plot_backtest(self.data, self.ledger, output, width)
+        if output is None:
+            plt.show()
+        return figure
 
-        # Plot lost trades for Short positions (positive result is a loss for Short)
-        lost_short_trades = self.data[
-            (self.data["Trade_Result"] > 0) & (self.data["side"] == "Short")
-        ]
-        ax1.scatter(
-            lost_short_trades.index,
-            lost_short_trades["close"],
-            color="red",
-            marker="x",
-            label="Lost Short Trades",
-        )
+    def calculate_win_rate(self):
+        return win_rate(self.ledger["trade_result"])
 
-        # Plot successful trades for Long positions (positive result is a win for Long)
-        successful_long_trades = self.data[
-            (self.data["Trade_Result"] > 0) & (self.data["side"] == "Long")
-        ]
-        ax1.scatter(
-            successful_long_trades.index,
-            successful_long_trades["close"],
-            color="blue",
-            marker="^",
-            label="Successful Long Trades",
-            edgecolor="black",  # Add an edge color for visibility
-        )
+    def calculate_total_profit_loss(self):
+        trade_result = self.ledger["trade_result"]
+        liquidated = self.ledger["liquidated"]
+        if liquidated.any():
+            logger.warning("You got liquidated at the following prices:")
+            for row in self.ledger["exit_index"][liquidated]:
+                logger.warning(
+                    " - Price: %.5f at index %s",
+                    self.data["close"].iloc[row],
+                    self.data.index[row],
+                )
+        return total_profit_loss(trade_result, liquidated, self.initial_margin)
 
-        # Plot successful trades for Short positions (negative result is a win for Short)
-        successful_short_trades = self.data[
-            (self.data["Trade_Result"] < 0) & (self.data["side"] == "Short")
-        ]
-        ax1.scatter(
-            successful_short_trades.index,
-            successful_short_trades["close"],
-            color="blue",
-            marker="v",
-            label="Successful Short Trades",
-            edgecolor="black",  # Add an edge color for visibility
-        )
-        # Identify and annotate liquidation events
-        liquidated_trades = self.data[self.data["Liquidated"] == True]
-        for idx, row in liquidated_trades.iterrows():
-            ax1.text(
-                idx,
-                row["close"],
-                f'Liqudation {row["close"]:.2f}',
-                color="black",
-                fontsize=14,
-                verticalalignment="bottom",
-                horizontalalignment="left",
-            )
-        ax1.set_ylabel("Price")
-        ax1.legend(loc="upper left")
-        ax1.set_title("Close Price, EMA, and Trades")
-
-        # Second subplot: MACD and Signal Line
-        ax2.plot(self.data.index, self.data["MACD"], label="MACD", color="blue")
-        ax2.plot(
-            self.data.index, self.data["Signal_Line"], label="MACD Signal", color="red"
+    def calculate_metrics(self, initial_capital=None, fraction: float = 1.0):
+        # Compounding mark-to-market risk metrics (see metrics.risk_metrics),
+        # starting from one trade's margin unless a capital is given
+        return risk_metrics(
+            self.data["close"].to_numpy(dtype="float64"),
+            self.ledger,
+            self.leverage,
+            initial_capital or self.initial_margin,
+            fraction,
+            open_time=self.data["open_time"].to_numpy(),
         )
-        ax2.axhline(y=0, color="gray", linestyle="--", label="0 Line")
 
-        ax2.set_ylabel("MACD")
-        ax2.legend(loc="upper left")
-        ax2.set_title("MACD and MACD Signal Line")
-
-        # Third subplot: RSI
-        ax3.plot(
-            self.data.index, self.data["RSI"], label="RSI", color="orange", alpha=0.7
+    def equity_curve(self, initial_capital=None, fraction: float = 1.0):
+        return pd.Series(
+            equity_curve(
+                self.data["close"].to_numpy(dtype="float64"),
+                self.ledger,
+                self.leverage,
+                initial_capital or self.initial_margin,
+                fraction,
+            ),
+            index=self.data["open_time"],
+            name="equity",
         )
-        ax3.axhline(y=70, color="red", linestyle="--", alpha=0.5)
-        ax3.axhline(y=30, color="green", linestyle="--", alpha=0.5)
-
-        ax3.set_ylabel("RSI")
-        ax3.set_xlabel("Time")
-        ax3.legend(loc="upper left")
-        ax3.set_title("RSI")
-
-        plt.tight_layout()
-        plt.show()
-
-    def calculate_win_rate(self):
-        trades = self.data[self.data["Trade_Result"] != 0.0]
-        if len(trades) == 0:
-            return 0
-        wins = trades[trades["Trade_Result"] > 0]
-        win_rate = len(wins) / len(trades) * 100
-        return win_rate
-
-    def calculate_total_profit_loss(self):
-        total_return = self.data["Trade_Result"].sum()
-        liquidated_trades = self.data[self.data["Liquidated"] == True]
-        if not liquidated_trades.empty:
-            print(f"You got liquidated at the following prices:")
-            for idx, row in liquidated_trades.iterrows():
-                print(f" - Price: {row['close']:.5f} at index {idx}")
-            return 0
-        return self.initial_margin + total_return
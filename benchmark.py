@@ -0,0 +1,384 @@
+import argparse
+import contextlib
+import functools
+import gc
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from app import process_data
+from async_stream import loads, parse_kline
+from backtesting import BacktestStrategy
+from candle_store import load_frame, write_store
+from indicators import IndicatorCache, ema, macd, rsi
+from streaming import StreamingStrategy
+from web_socket_utility import WebSocketHandler
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+DEFAULT_SIZES = ["10k", "100k", "1M"]
+# The per-candle legacy loop and the per-event paths are capped so a run over
+# the large sizes still finishes in reasonable time
+LEGACY_LIMIT = 10_000
+EVENT_LIMIT = 200_000
+BACKTEST_ARGS = {
+    "tp_percent": 5,
+    "sl_percent": 2.5,
+    "leverage": 5,
+    "initial_margin": 100,
+}
+
+
+def parse_size(size: str) -> int:
+    if size in SIZES:
+        return SIZES[size]
+    return int(float(size))
+
+
+def synthetic_candles(
+    n: int, seed: int = 42, interval_ms: int = 60_000
+) -> pd.DataFrame:
+    # Geometric random walk in the process_data layout, reproducible per seed
+    rng = np.random.default_rng(seed)
+    close = 30_000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.0007, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.gamma(2.0, 50.0, n)
+    open_time = 1_704_067_200_000 + np.arange(n, dtype=np.int64) * interval_ms
+    return pd.DataFrame(
+        {
+            "open_time": pd.to_datetime(open_time, unit="ms"),
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+            "close_time": pd.to_datetime(open_time + interval_ms - 1, unit="ms"),
+            "quote_volume": volume * close,
+            "count": rng.integers(100, 5000, n),
+            "taker_buy_volume": volume / 2,
+            "taker_buy_quote_volume": volume * close / 2,
+            "ignore": np.zeros(n, dtype=np.int64),
+        }
+    )
+
+
+def kline_messages(candles: pd.DataFrame, symbol: str = "BTCUSDT"):
+    # Closed-kline websocket payloads as the exchange sends them
+    open_time = candles["open_time"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    columns = [
+        candles[name].to_numpy()
+        for name in (
+            "open",
+            "high",
+            "low",
+            "close",
+            "volume",
+            "quote_volume",
+            "count",
+            "taker_buy_volume",
+            "taker_buy_quote_volume",
+        )
+    ]
+    messages = []
+    for t, o, h, l, c, v, q, n, tv, tq in zip(open_time, *columns):
+        messages.append(
+            json.dumps(
+                {
+                    "e": "kline",
+                    "E": int(t) + 60_000,
+                    "s": symbol,
+                    "k": {
+                        "t": int(t),
+                        "T": int(t) + 59_999,
+                        "s": symbol,
+                        "i": "1m",
+                        "o": f"{o:.2f}",
+                        "c": f"{c:.2f}",
+                        "h": f"{h:.2f}",
+                        "l": f"{l:.2f}",
+                        "v": f"{v:.3f}",
+                        "n": int(n),
+                        "x": True,
+                        "q": f"{q:.2f}",
+                        "V": f"{tv:.3f}",
+                        "Q": f"{tq:.2f}",
+                        "B": "0",
+                    },
+                }
+            )
+        )
+    return messages
+
+
+@contextlib.contextmanager
+def _quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(func, repeat: int = 1, memory: bool = True) -> dict:
+    # Best wall time over `repeat` runs; peak traced memory from one extra run
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        with _quiet():
+            func()
+        timings.append(time.perf_counter() - started)
+    result = {"wall_s": min(timings)}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with _quiet():
+                func()
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _stages(candles: pd.DataFrame, workdir: str):
+    # (stage, items, unit, prepare) for one dataset. prepare() does the setup a
+    # stage needs, such as writing the input files, and returns the timed
+    # function; it only runs for the stages selected, and setup shared by
+    # several stages is built once.
+    n = len(candles)
+    close = candles["close"].to_numpy(dtype=np.float64)
+    events = min(n, EVENT_LIMIT)
+
+    def indicators():
+        cache = IndicatorCache()
+        ema(close, 200, cache=cache)
+        macd(close, cache=cache)
+        rsi(close, 14, cache=cache)
+
+    def backtest(engine):
+        def run():
+            strategy = BacktestStrategy(
+                candles.copy(), indicator_cache=IndicatorCache(), **BACKTEST_ARGS
+            )
+            strategy.run_backtest(engine=engine, export=None)
+
+        return run
+
+    @functools.lru_cache(maxsize=None)
+    def files():
+        csv_path = os.path.join(workdir, f"candles-{n}.csv")
+        store = os.path.join(workdir, f"candles-{n}.candles")
+        frame = candles.copy()
+        for column in ("open_time", "close_time"):
+            frame[column] = (
+                frame[column].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+            )
+        frame.to_csv(csv_path, index=False)
+        write_store(store, frame)
+        return csv_path, store
+
+    def load_csv():
+        csv_path, _ = files()
+        return lambda: process_data(csv_path)
+
+    def load_store():
+        _, store = files()
+
+        def run():
+            frame = load_frame(store)
+            # Touch the mapped pages so the read is actually measured
+            float(frame["close"].to_numpy().sum())
+
+        return run
+
+    @functools.lru_cache(maxsize=None)
+    def messages():
+        return kline_messages(candles.iloc[:events])
+
+    def streaming():
+        strategy = StreamingStrategy(
+            BACKTEST_ARGS["tp_percent"],
+            BACKTEST_ARGS["sl_percent"],
+            BACKTEST_ARGS["leverage"],
+            BACKTEST_ARGS["initial_margin"],
+        )
+        for value in close[:events]:
+            strategy.on_closed_kline(value)
+
+    def on_message():
+        batch = messages()
+        # Message handling only: the handler never opens its socket
+        handler = WebSocketHandler(connect=False)
+
+        def run():
+            for message in batch:
+                handler.on_message(message)
+
+        return run
+
+    def parse_messages():
+        batch = messages()
+
+        def run():
+            for message in batch:
+                parse_kline(loads(message))
+
+        return run
+
+    stages = [
+        ("indicators", n, "candles/s", lambda: indicators),
+        ("backtest_vectorized", n, "candles/s", lambda: backtest("vectorized")),
+    ]
+    if n <= LEGACY_LIMIT:
+        stages.append(("backtest_legacy", n, "candles/s", lambda: backtest("legacy")))
+    stages += [
+        ("load_csv", n, "candles/s", load_csv),
+        ("load_store", n, "candles/s", load_store),
+        ("streaming_strategy", events, "candles/s", lambda: streaming),
+        ("websocket_on_message", events, "messages/s", on_message),
+        ("async_stream_parse", events, "messages/s", parse_messages),
+    ]
+    return stages
+
+
+def run_benchmarks(
+    sizes=None,
+    bundled: bool = True,
+    repeat: int = 1,
+    memory: bool = True,
+    stages=None,
+    seed: int = 42,
+) -> dict:
+    datasets = [
+        (
+            f"synthetic-{size}",
+            lambda size=size: synthetic_candles(parse_size(size), seed),
+        )
+        for size in (sizes or DEFAULT_SIZES)
+    ]
+    if bundled:
+        data_directory = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data"
+        )
+        for path in sorted(glob.glob(os.path.join(data_directory, "*", "*.csv"))):
+            name = os.path.relpath(path, data_directory)
+            datasets.append((name, lambda path=path: _quiet_load(path)))
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        for name, load in datasets:
+            candles = load()
+            for stage, items, unit, prepare in _stages(candles, workdir):
+                if stages and stage not in stages:
+                    continue
+                result = measure(prepare(), repeat, memory)
+                result.update(
+                    {
+                        "stage": stage,
+                        "dataset": name,
+                        "items": items,
+                        "throughput": (
+                            items / result["wall_s"] if result["wall_s"] else None
+                        ),
+                        "unit": unit,
+                    }
+                )
+                results.append(result)
+                print(
+                    f"{name:<40} {stage:<22} {result['wall_s']:>9.4f}s "
+                    f"{result['throughput']:>14,.0f} {unit}"
+                    + (f" {result['peak_mb']:>9.1f} MB" if memory else "")
+                )
+            shutil.rmtree(workdir, ignore_errors=True)
+            os.makedirs(workdir, exist_ok=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def _quiet_load(path):
+    with _quiet():
+        return process_data(path)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    # Stages that got slower than the baseline by more than `tolerance`
+    reference = {
+        (row["dataset"], row["stage"]): row for row in baseline.get("results", [])
+    }
+    regressions = []
+    for row in results["results"]:
+        previous = reference.get((row["dataset"], row["stage"]))
+        if previous is None or not previous["wall_s"]:
+            continue
+        ratio = row["wall_s"] / previous["wall_s"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                {
+                    "dataset": row["dataset"],
+                    "stage": row["stage"],
+                    "baseline_s": previous["wall_s"],
+                    "wall_s": row["wall_s"],
+                    "ratio": ratio,
+                }
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmark.py --sizes 10k,100k --output results.json --baseline baseline.json
+    parser = argparse.ArgumentParser(description="Benchmark the backtest pipeline")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES))
+    parser.add_argument("--stages", default=None, help="comma separated stage names")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-bundled", action="store_true")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        sizes=[size for size in args.sizes.split(",") if size],
+        bundled=not args.no_bundled,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        stages=args.stages.split(",") if args.stages else None,
+    )
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['dataset']} {regression['stage']}: "
+                f"{regression['baseline_s']:.4f}s -> {regression['wall_s']:.4f}s "
+                f"({regression['ratio']:.2f}x)"
+            )
+        if regressions:
+            sys.exit(1)
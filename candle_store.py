@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Binance kline layout with fixed dtypes: timestamps stay int64 milliseconds and
+# prices/volumes are float64, one raw file per column
+CANDLE_COLUMNS = [
+    ("open_time", "int64"),
+    ("open", "float64"),
+    ("high", "float64"),
+    ("low", "float64"),
+    ("close", "float64"),
+    ("volume", "float64"),
+    ("close_time", "int64"),
+    ("quote_volume", "float64"),
+    ("count", "int64"),
+    ("taker_buy_volume", "float64"),
+    ("taker_buy_quote_volume", "float64"),
+    ("ignore", "int64"),
+]
+STORE_SUFFIX = ".candles"
+SCHEMA_FILE = "schema.json"
+
+
+def store_path(csv_path: str) -> str:
+    root, _ = os.path.splitext(csv_path)
+    return root + STORE_SUFFIX
+
+
+def is_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+
+def resolve(csv_path: str) -> str:
+    # Prefer the binary store next to a CSV unless the CSV was rewritten after it
+    path = store_path(csv_path)
+    if not is_store(path):
+        return csv_path
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(
+        os.path.join(path, SCHEMA_FILE)
+    ):
+        return csv_path
+    return path
+
+
+def _column_file(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+
+def _typed_columns(frame: pd.DataFrame) -> dict:
+    names = [name for name, _ in CANDLE_COLUMNS]
+    if set(names).issubset(frame.columns):
+        frame = frame[names]
+    else:
+        # Raw CSV layout: drop the unnamed index column if any and rename in order
+        frame = frame.loc[:, ~frame.columns.astype(str).str.contains("^Unnamed")]
+        frame.columns = names
+    columns = {}
+    for name, dtype in CANDLE_COLUMNS:
+        values = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            # Accept frames that already went through process_data
+            values = values.astype("datetime64[ms]").astype("int64")
+        columns[name] = pd.to_numeric(values).to_numpy(dtype=dtype)
+    return columns
+
+
+def write_store(path: str, frame: pd.DataFrame) -> str:
+    columns = _typed_columns(frame)
+    # Build the store next to its final location and swap it in, so readers never
+    # see a half-written set of columns
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in columns.items():
+        values.tofile(_column_file(tmp_path, name))
+    with open(os.path.join(tmp_path, SCHEMA_FILE), "w") as file:
+        json.dump({"columns": CANDLE_COLUMNS}, file)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def append_to_store(path: str, frame: pd.DataFrame, fsync: bool = False) -> int:
+    if not is_store(path):
+        write_store(path, frame)
+        return len(frame)
+    columns = _typed_columns(frame)
+    # Trim any columns left longer than the others by an interrupted append
+    rows = store_rows(path)
+    for name, dtype in CANDLE_COLUMNS:
+        with open(_column_file(path, name), "r+b") as file:
+            file.truncate(rows * np.dtype(dtype).itemsize)
+            file.seek(0, os.SEEK_END)
+            file.write(columns[name].tobytes())
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+    return len(frame)
+
+
+def store_rows(path: str) -> int:
+    return min(
+        os.path.getsize(_column_file(path, name)) // np.dtype(dtype).itemsize
+        for name, dtype in CANDLE_COLUMNS
+    )
+
+
+def modified_time(path: str) -> float:
+    # When the rows of a store (appends included) or a CSV last changed
+    if is_store(path):
+        return os.path.getmtime(_column_file(path, CANDLE_COLUMNS[0][0]))
+    return os.path.getmtime(path)
+
+
+def load_store(path: str, columns=None) -> dict:
+    # Memory-mapped, read-only column arrays: nothing is parsed or copied up front
+    rows = store_rows(path)
+    selected = columns or [name for name, _ in CANDLE_COLUMNS]
+    dtypes = dict(CANDLE_COLUMNS)
+    arrays = {}
+    for name in selected:
+        if rows == 0:
+            arrays[name] = np.empty(0, dtype=dtypes[name])
+        else:
+            arrays[name] = np.memmap(
+                _column_file(path, name), dtype=dtypes[name], mode="r", shape=(rows,)
+            )
+    return arrays
+
+
+def load_frame(path: str, columns=None) -> pd.DataFrame:
+    # Same shape as app.process_data: datetime open/close times, every other
+    # column a zero-copy view of the mapped file
+    arrays = load_store(path, columns)
+    for name in ("open_time", "close_time"):
+        if name in arrays:
+            arrays[name] = pd.to_datetime(arrays[name], unit="ms")
+    return pd.DataFrame(arrays, copy=False)
+
+
+def csv_to_store(csv_path: str, path=None) -> str:
+    path = path or store_path(csv_path)
+    write_store(path, pd.read_csv(csv_path))
+    print(f"Converted {csv_path} to {path}")
+    return path
+
+
+def migrate(data_directory: str, remove_csv: bool = False):
+    converted = []
+    for directory, _, files in os.walk(data_directory):
+        for filename in sorted(files):
+            if not filename.endswith(".csv"):
+                continue
+            csv_path = os.path.join(directory, filename)
+            if resolve(csv_path) == csv_path:
+                csv_to_store(csv_path)
+                converted.append(csv_path)
+            if remove_csv:
+                os.remove(csv_path)
+    print(f"Migrated {len(converted)} CSV files under {data_directory}")
+    return converted
+
+
+if __name__ == "__main__":
+    # python candle_store.py migrate [data_directory] [--remove-csv]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python candle_store.py migrate [data_directory] [--remove-csv]")
+        sys.exit(1)
+    arguments = [argument for argument in sys.argv[2:] if not argument.startswith("--")]
+    data_directory = (
+        arguments[0]
+        if arguments
+        else os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    )
+    migrate(data_directory, remove_csv="--remove-csv" in sys.argv)
@@ -0,0 +1,351 @@
+import argparse
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    LEDGER_DTYPE,
+    MAINTENANCE_MARGIN,
+    SIDE_CODES,
+    SIDE_NAMES,
+    _find_exit,
+    entry_signals,
+    simulate,
+    total_profit_loss,
+    trade_levels,
+    win_rate,
+)
+from helper import load_candles
+from kernels import ewm_many
+
+logger = logging.getLogger(__name__)
+
+NAN = float("nan")
+
+
+class ChunkedEWM:
+    # pandas' ewm(adjust=False).mean() over a series fed in consecutive blocks.
+    # After an observation the recursion only depends on the last weighted value,
+    # so each block is run with that value prepended and the output matches a
+    # single run over the whole series bit for bit. Values may start with NaNs
+    # but can't have gaps once they started (true for closes and the MACD line).
+    def __init__(self, com: float, min_periods: int = 0):
+        self.com = com
+        self.min_periods = max(min_periods, 1)
+        self.weighted = NAN
+        self.nobs = 0
+
+    def update(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return values.copy()
+        observed = ~np.isnan(values)
+        first = int(np.argmax(observed)) if observed.any() else len(values)
+        if (self.nobs and first) or not observed[first:].all():
+            raise ValueError("ChunkedEWM values can't have gaps")
+        out = ewm_many(np.concatenate([[self.weighted], values]), self.com, 0)[0][1:]
+        nobs = self.nobs + np.cumsum(observed)
+        self.weighted = out[-1]
+        self.nobs = int(nobs[-1])
+        out[nobs < self.min_periods] = NAN
+        return out
+
+
+class ChunkedEMA:
+    def __init__(self, window: int = 200):
+        self.ewm = ChunkedEWM((window - 1) / 2, window)
+
+    def update(self, close):
+        return self.ewm.update(close)
+
+
+class ChunkedMACD:
+    def __init__(self, window_fast: int = 12, window_slow: int = 26, window_sign=9):
+        self.fast = ChunkedEWM((window_fast - 1) / 2, window_fast)
+        self.slow = ChunkedEWM((window_slow - 1) / 2, window_slow)
+        self.signal = ChunkedEWM((window_sign - 1) / 2, window_sign)
+
+    def update(self, close):
+        macd = self.fast.update(close) - self.slow.update(close)
+        return macd, self.signal.update(macd)
+
+
+class ChunkedRSI:
+    # Wilder smoothing (alpha = 1 / window) of gains and losses
+    def __init__(self, window: int = 14):
+        alpha = 1 / window
+        self.up = ChunkedEWM((1 - alpha) / alpha, window)
+        self.down = ChunkedEWM((1 - alpha) / alpha, window)
+        self.previous = NAN
+
+    def update(self, close):
+        close = np.asarray(close, dtype=np.float64)
+        if len(close) == 0:
+            return close.copy()
+        diff = np.diff(close, prepend=self.previous)
+        self.previous = close[-1]
+        # Like diff.where(...): the missing first difference counts as no move
+        up = np.where(diff > 0, diff, 0.0)
+        down = -np.where(diff < 0, diff, 0.0)
+        emaup = self.up.update(up)
+        emadn = self.down.update(down)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(emadn == 0, 100, 100 - (100 / (1 + emaup / emadn)))
+
+
+class ChunkedBacktest:
+    # BacktestStrategy.run_backtest(engine="vectorized") over candles fed in
+    # blocks, so only one block is held in memory. Indicator state and the open
+    # position (entry, side, TP/SL levels) carry over from block to block, and
+    # the trades are the same as an in-memory run over the whole history:
+    # indices count candles from the first row where the default indicators are
+    # all defined, like the frame left by dropna(). Custom windows follow
+    # calculate_indicators: EMA and RSI restart on those rows, MACD only when
+    # MACD_DAYS is given.
+    def __init__(
+        self,
+        tp_percent: float,
+        sl_percent: float,
+        leverage: float,
+        initial_margin: float,
+        EMA_DAYS: Optional[int] = None,
+        MACD_DAYS: Optional[Dict[str, int]] = None,
+        RSI_DAYS: Optional[int] = None,
+    ):
+        self.tp_percent = tp_percent / 100  # Convert to decimal
+        self.sl_percent = sl_percent / 100  # Convert to decimal
+        self.leverage = leverage
+        self.initial_margin = initial_margin
+        self.maintenance_margin = MAINTENANCE_MARGIN
+        self.custom = bool(EMA_DAYS or MACD_DAYS or RSI_DAYS)
+        self.ema_window = EMA_DAYS or 200
+        self.rsi_window = RSI_DAYS or 14
+        self.macd_days = MACD_DAYS
+        # Default indicators decide the rows dropped at the start
+        self.ema = ChunkedEMA(200)
+        self.macd = ChunkedMACD()
+        self.rsi = ChunkedRSI(14)
+        self.rows = 0  # candles fed so far
+        self.warm_up = None  # candles dropped before the first defined row
+        # Open position carried into the next block:
+        # (entry_index, entry_time, buy_price, side, take_profit, stop_loss)
+        self.position = None
+        self.trades = []
+        self.times = []
+
+    @property
+    def index(self):
+        # Index (after the dropped rows) of the next candle
+        return self.rows - (self.warm_up if self.warm_up is not None else self.rows)
+
+    def _indicators(self, close):
+        # Indicator values of the block rows from the first defined row on, and
+        # where that is in the block
+        if self.warm_up is not None:
+            return 0, (
+                self.ema.update(close),
+                *self.macd.update(close),
+                self.rsi.update(close),
+            )
+        ema = self.ema.update(close)
+        macd, signal_line = self.macd.update(close)
+        rsi = self.rsi.update(close)
+        defined = ~(np.isnan(ema) | np.isnan(macd) | np.isnan(signal_line))
+        defined &= ~np.isnan(rsi)
+        if not defined.any():
+            return len(close), None
+        begin = int(np.argmax(defined))
+        self.warm_up = self.rows + begin
+        values = [ema[begin:], macd[begin:], signal_line[begin:], rsi[begin:]]
+        if self.custom:
+            # calculate_indicators recomputes on the rows left after dropna()
+            self.ema = ChunkedEMA(self.ema_window)
+            self.rsi = ChunkedRSI(self.rsi_window)
+            values[0] = self.ema.update(close[begin:])
+            values[3] = self.rsi.update(close[begin:])
+            if self.macd_days:
+                self.macd = ChunkedMACD(
+                    self.macd_days.get("window_fast", 12),
+                    self.macd_days.get("window_slow", 26),
+                    self.macd_days.get("window_sign", 9),
+                )
+                values[1], values[2] = self.macd.update(close[begin:])
+        return begin, tuple(values)
+
+    def process(self, close, open_time=None) -> int:
+        # Feed the next block of candles; returns the number of trades closed
+        close = np.asarray(close, dtype=np.float64)
+        open_time = (
+            np.asarray(open_time)
+            if open_time is not None
+            else np.full(len(close), None)
+        )
+        begin, values = self._indicators(close)
+        base = self.index + begin
+        self.rows += len(close)
+        if values is None:
+            return 0
+        close = close[begin:]
+        open_time = open_time[begin:]
+        closed = len(self.trades)
+
+        start = 0
+        if self.position is not None:
+            entry, entry_time, buy_price, side, take_profit, stop_loss = self.position
+            exit_index = _find_exit(close, 0, side, take_profit, stop_loss)
+            if exit_index < 0:
+                return 0
+            # Never the entry candle, so always the long formula (as in simulate)
+            result = (close[exit_index] - buy_price) / buy_price * self.leverage
+            self.trades.append(
+                (
+                    entry,
+                    base + exit_index,
+                    buy_price,
+                    close[exit_index],
+                    SIDE_CODES[side],
+                    result,
+                    False,
+                )
+            )
+            self.times.append((entry_time, open_time[exit_index]))
+            self.position = None
+            start = exit_index + 1
+
+        long_mask, short_mask = entry_signals(close, *values)
+        if base == 0:
+            # The batch loop starts at the second row left after dropna()
+            start = max(start, 1)
+        ledger = simulate(
+            close,
+            long_mask,
+            short_mask,
+            self.tp_percent,
+            self.sl_percent,
+            self.leverage,
+            self.initial_margin,
+            self.maintenance_margin,
+            start=start,
+            verbose=False,
+        )
+        for trade in ledger:
+            entry = int(trade["entry_index"])
+            if trade["exit_index"] < 0:
+                side = SIDE_NAMES[int(trade["side"])]
+                self.position = (
+                    base + entry,
+                    open_time[entry],
+                    float(trade["entry_price"]),
+                    side,
+                    *trade_levels(
+                        trade["entry_price"],
+                        side,
+                        self.tp_percent,
+                        self.sl_percent,
+                        self.leverage,
+                    ),
+                )
+                continue
+            exit_index = int(trade["exit_index"])
+            trade = trade.copy()
+            trade["entry_index"] += base
+            trade["exit_index"] += base
+            self.trades.append(trade.item())
+            self.times.append((open_time[entry], open_time[exit_index]))
+        return len(self.trades) - closed
+
+    @property
+    def ledger(self) -> np.ndarray:
+        # Closed trades plus the one still open, as engine.simulate returns them
+        trades = list(self.trades)
+        if self.position is not None:
+            entry, _, buy_price, side, _, _ = self.position
+            trades.append((entry, -1, buy_price, NAN, SIDE_CODES[side], 0.0, False))
+        return np.array(trades, dtype=LEDGER_DTYPE)
+
+    def trade_ledger(self) -> pd.DataFrame:
+        # Same layout as BacktestStrategy.trade_ledger
+        ledger = pd.DataFrame(self.ledger)
+        times = list(self.times)
+        if self.position is not None:
+            times.append((self.position[1], None))
+        entry_time, exit_time = zip(*times) if times else ((), ())
+        ledger.insert(1, "entry_time", pd.Series(entry_time))
+        ledger.insert(3, "exit_time", pd.Series(exit_time))
+        ledger["side"] = ledger["side"].map(SIDE_NAMES)
+        return ledger
+
+    def calculate_win_rate(self):
+        return win_rate(self.ledger["trade_result"])
+
+    def calculate_total_profit_loss(self):
+        ledger = self.ledger
+        return total_profit_loss(
+            ledger["trade_result"], ledger["liquidated"], self.initial_margin
+        )
+
+
+def run_chunked(
+    symbol: str,
+    interval: str,
+    tp_percent: float,
+    sl_percent: float,
+    leverage: float,
+    initial_margin: float,
+    start=None,
+    end=None,
+    chunksize: int = 1_000_000,
+    data_directory: Optional[str] = None,
+    **windows,
+) -> ChunkedBacktest:
+    # Backtest a stored history block by block; only open_time and close of one
+    # block are in memory at a time
+    backtest = ChunkedBacktest(
+        tp_percent, sl_percent, leverage, initial_margin, **windows
+    )
+    for chunk in load_candles(
+        symbol,
+        interval,
+        start=start,
+        end=end,
+        columns=["open_time", "close"],
+        chunksize=chunksize,
+        data_directory=data_directory,
+    ):
+        backtest.process(chunk["close"].to_numpy(), chunk["open_time"].to_numpy())
+        logger.info("%s candles, %s trades", f"{backtest.rows:,}", len(backtest.trades))
+    return backtest
+
+
+if __name__ == "__main__":
+    # python chunked.py BTCUSDT 1m --start 2021-01-01 --chunksize 500000
+    parser = argparse.ArgumentParser(description="Backtest a long history in blocks")
+    parser.add_argument("symbol")
+    parser.add_argument("interval")
+    parser.add_argument("--tp-percent", type=float, default=5)
+    parser.add_argument("--sl-percent", type=float, default=2.5)
+    parser.add_argument("--leverage", type=float, default=5)
+    parser.add_argument("--initial-margin", type=float, default=100)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--output", default="backtest_results.csv")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    backtest = run_chunked(
+        args.symbol,
+        args.interval,
+        args.tp_percent,
+        args.sl_percent,
+        args.leverage,
+        args.initial_margin,
+        start=args.start,
+        end=args.end,
+        chunksize=args.chunksize,
+    )
+    backtest.trade_ledger().to_csv(args.output, index=False)
+    print(f"Win Rate: {backtest.calculate_win_rate():.2f}%")
+    print(f"Total Profit/Loss: {backtest.calculate_total_profit_loss():.2f}")
@@ -1,11 +1,40 @@
 TEST_NET = {
     "web_socket": "wss://stream.binancefuture.com/ws",
+    "combined_stream": "wss://stream.binancefuture.com/stream",
     "base_url": "https://testnet.binancefuture.com",
 }
 FUTURES = {
     "web_socket": "wss://fstream.binance.com/ws",
+    "combined_stream": "wss://fstream.binance.com/stream",
     "base_url": "https://fapi.binance.com",
 }
 ENDPOINTS = {
     "hitorical_candle_enpoint": "/fapi/v1/klines",
 }
+# Kline interval lengths in milliseconds
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "2h": 2 * 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "6h": 6 * 60 * 60_000,
+    "8h": 8 * 60 * 60_000,
+    "12h": 12 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+    "3d": 3 * 24 * 60 * 60_000,
+    "1w": 7 * 24 * 60 * 60_000,
+}
+RATE_LIMITS = {
+    # Futures REST request weight allowed per minute per IP
+    "request_weight_per_minute": 2400,
+    "used_weight_header": "X-MBX-USED-WEIGHT-1M",
+}
+STREAM_LIMITS = {
+    # Streams one combined connection may carry and incoming messages per second
+    "streams_per_connection": 200,
+    "messages_per_second": 10,
+}
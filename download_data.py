@@ -1,72 +1,250 @@
+import json
+import os
+import threading
 import requests
 import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from helper import move_downloaded_file_to_required_folder, clean_and_save_data
-from configs.config import FUTURES, ENDPOINTS
+from configs.config import FUTURES, ENDPOINTS, INTERVAL_MS, RATE_LIMITS
+from candle_store import csv_to_store
 
+KLINE_COLUMNS = [
+    "open_time",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "close_time",
+    "quote_volume",
+    "count",
+    "taker_buy_volume",
+    "taker_buy_quote_volume",
+    "ignore",
+]
+MAX_LIMIT = 1500
 
-def get_historical_candles(symbol, interval, start_str, end_str):
-    # real futures api not testnet if u wanna retrive testnet data use https://testnet.binancefuture.com
-    base_url = FUTURES["base_url"]
-    endpoint = ENDPOINTS["hitorical_candle_enpoint"]
-    url = base_url + endpoint
 
-    start_ts = int(time.mktime(time.strptime(start_str, "%d/%m/%Y")) * 1000)
-    end_ts = int(time.mktime(time.strptime(end_str, "%d/%m/%Y")) * 1000)
+def request_weight(limit):
+    # /fapi/v1/klines weight depends on the requested limit
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightLimiter:
+    # Token bucket over Binance request weight. Tokens refill continuously at the
+    # per-minute budget and are corrected from the used-weight header the server
+    # returns, so other clients on the same IP are accounted for as well.
+    def __init__(self, weight_per_minute=None, safety=0.9):
+        weight_per_minute = (
+            weight_per_minute or RATE_LIMITS["request_weight_per_minute"]
+        )
+        self.capacity = weight_per_minute * safety
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def acquire(self, weight):
+        with self.condition:
+            while True:
+                now = self._refill()
+                if now < self.blocked_until:
+                    self.condition.wait(self.blocked_until - now)
+                    continue
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                self.condition.wait((weight - self.tokens) / self.rate)
+
+    def observe(self, headers):
+        used = headers.get(RATE_LIMITS["used_weight_header"])
+        if used is None:
+            return
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.tokens, self.capacity - int(used))
 
-    all_data = []
+    def back_off(self, seconds):
+        # 429/418 responses: stop every worker until Retry-After has passed
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.condition.notify_all()
 
-    while start_ts < end_ts:
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def split_windows(start_ts, end_ts, interval, limit=MAX_LIMIT):
+    # Windows of at most `limit` candles; startTime/endTime are both inclusive
+    step = INTERVAL_MS[interval] * limit
+    return [
+        (window_start, min(window_start + step, end_ts) - 1)
+        for window_start in range(start_ts, end_ts, step)
+    ]
+
+
+def fetch_window(
+    session, url, symbol, interval, window, limiter, limit=MAX_LIMIT, retries=5
+):
+    window_start, window_end = window
+    rows = []
+    while window_start <= window_end:
         params = {
             "symbol": symbol,
             "interval": interval,
-            "startTime": start_ts,
-            "endTime": end_ts,
-            "limit": 500,  # Maximum limit 1500
+            "startTime": window_start,
+            "endTime": window_end,
+            "limit": limit,
         }
-
-        response = requests.get(url, params=params)
+        for attempt in range(retries + 1):
+            limiter.acquire(request_weight(limit))
+            try:
+                response = session.get(url, params=params, timeout=30)
+            except requests.RequestException as e:
+                if attempt == retries:
+                    raise
+                print(f"Request failed for {symbol} {window}: {e}, retrying")
+                time.sleep(min(2**attempt, 30))
+                continue
+            limiter.observe(response.headers)
+            if response.status_code in (418, 429):
+                limiter.back_off(float(response.headers.get("Retry-After", 60)))
+                continue
+            if response.status_code >= 500 and attempt < retries:
+                time.sleep(min(2**attempt, 30))
+                continue
+            response.raise_for_status()
+            break
+        else:
+            raise RuntimeError(f"Rate limited too many times for {symbol} {window}")
         data = response.json()
-
         if not data:
             break
+        rows += data
+        # Only needed if the server returns fewer candles than the window holds
+        window_start = data[-1][6] + 1
+    return rows
+
+
+def _checkpoint_path(checkpoint_directory, window):
+    return os.path.join(checkpoint_directory, f"{window[0]}-{window[1]}.json")
+
+
+def _save_checkpoint(checkpoint_directory, window, rows):
+    path = _checkpoint_path(checkpoint_directory, window)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(rows, file)
+    os.replace(tmp_path, path)
+
+
+def _load_checkpoint(checkpoint_directory, window):
+    path = _checkpoint_path(checkpoint_directory, window)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def download_candles(
+    symbols,
+    interval,
+    start_str,
+    end_str,
+    workers=8,
+    base_url=None,
+    checkpoint_directory="download_checkpoints",
+    limiter=None,
+    keep_checkpoints=False,
+):
+    # Fetch [start, end) for many symbols at once. Every window is written to a
+    # checkpoint as soon as it completes, so a rerun after a crash only fetches
+    # the missing windows. Returns {symbol: csv filename}.
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    url = (base_url or FUTURES["base_url"]) + ENDPOINTS["hitorical_candle_enpoint"]
+    start_ts = int(time.mktime(time.strptime(start_str, "%d/%m/%Y")) * 1000)
+    end_ts = int(time.mktime(time.strptime(end_str, "%d/%m/%Y")) * 1000)
+    windows = split_windows(start_ts, end_ts, interval)
+    limiter = limiter or WeightLimiter()
+    session = make_session(workers)
+
+    results = {symbol: {} for symbol in symbols}
+    directories = {}
+    tasks = []
+    for symbol in symbols:
+        directory = os.path.join(
+            checkpoint_directory, f"{symbol}-{interval}-{start_ts}-{end_ts}"
+        )
+        os.makedirs(directory, exist_ok=True)
+        directories[symbol] = directory
+        for window in windows:
+            rows = _load_checkpoint(directory, window)
+            if rows is None:
+                tasks.append((symbol, window))
+            else:
+                results[symbol][window] = rows
+    resumed = sum(len(windows) for windows in results.values())
+    if resumed:
+        print(f"Resuming download, {resumed} windows already on disk.")
+
+    def run(symbol, window):
+        rows = fetch_window(session, url, symbol, interval, window, limiter)
+        _save_checkpoint(directories[symbol], window, rows)
+        return symbol, window, rows
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, symbol, window) for symbol, window in tasks]
+        for future in as_completed(futures):
+            symbol, window, rows = future.result()
+            results[symbol][window] = rows
+    session.close()
 
-        all_data += data
-
-        # Move the start time to the last timestamp retrieved + 1ms to avoid overlap
-        start_ts = data[-1][6] + 1
-
-        # Sleep to avoid hitting rate limits
-        time.sleep(1)
-
-    # Convert data to DataFrame for easier handling
-    df = pd.DataFrame(
-        all_data,
-        columns=[
-            "open_time",
-            "open",
-            "high",
-            "low",
-            "close",
-            "volume",
-            "close_time",
-            "quote_volume",
-            "count",
-            "taker_buy_volume",
-            "taker_buy_quote_volume",
-            "ignore",
-        ],
-    )
-    # Save DataFrame to CSV
     start_date_obj = time.strptime(start_str, "%d/%m/%Y")
     year = start_date_obj.tm_year
     month = time.strftime("%B", start_date_obj)
+    filenames = {}
+    for symbol in symbols:
+        all_data = [row for window in windows for row in results[symbol][window]]
+        df = pd.DataFrame(all_data, columns=KLINE_COLUMNS)
+        df = df.drop_duplicates("open_time").sort_values("open_time")
+        filename = f"{symbol}-{interval}-{year}-{month:02}.csv"
+        df.to_csv(filename, index=False)
+        print(f"Data saved to {filename} with {len(df)} rows.")
+        filenames[symbol] = filename
+        if not keep_checkpoints:
+            for window in windows:
+                os.remove(_checkpoint_path(directories[symbol], window))
+            os.rmdir(directories[symbol])
+    return filenames
 
-    filename = f"{symbol}-{interval}-{year}-{month:02}.csv"
-    df.to_csv(filename, index=False)
 
-    print(f"Data saved to {filename} with {len(df)} rows.")
-    return filename
+def get_historical_candles(symbol, interval, start_str, end_str, base_url=None):
+    # real futures api not testnet if u wanna retrive testnet data use https://testnet.binancefuture.com
+    return download_candles(symbol, interval, start_str, end_str, base_url=base_url)[
+        symbol
+    ]
 
 
 if __name__ == "__main__":
@@ -82,7 +260,10 @@ if __name__ == "__main__":
     cleaned_file_path = clean_and_save_data(file_path, start_str, end_str)
 
     # Move the cleaned file to the required folder
-    move_downloaded_file_to_required_folder(cleaned_file_path, symbol)
+    required_path = move_downloaded_file_to_required_folder(cleaned_file_path, symbol)
+
+    # Convert it to the binary candle store used by the backtester
+    csv_to_store(required_path)
 
 
 # to check if downloaded data is legit with excel
@@ -0,0 +1,518 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LONG = "Long"
+SHORT = "Short"
+# Side is stored as a small enum in the trade ledger
+SIDE_CODES = {LONG: 1, SHORT: -1}
+SIDE_NAMES = {1: LONG, -1: SHORT}
+# Liquidation if margin falls below 80%, in every engine
+MAINTENANCE_MARGIN = 0.8
+# Per-candle result columns of the legacy loop
+RESULT_COLUMNS = ["Position", "Trade_Result", "Trade_Type", "side", "Liquidated"]
+
+# One row per trade. exit_index is -1 (and exit_price NaN) for a trade still
+# open at the end of the data.
+LEDGER_DTYPE = np.dtype(
+    [
+        ("entry_index", np.int64),
+        ("exit_index", np.int64),
+        ("entry_price", np.float64),
+        ("exit_price", np.float64),
+        ("side", np.int8),
+        ("trade_result", np.float64),
+        ("liquidated", np.bool_),
+    ]
+)
+
+
+def entry_signals(close, ema, macd, signal_line, rsi, oversold=30, overbought=70):
+    # Same entry rules as BacktestStrategy.run_backtest, evaluated over whole arrays
+    long_mask = (
+        (macd > signal_line)
+        & (macd < 0)
+        & (signal_line < 0)
+        & (close < ema)
+        & (rsi < oversold)
+    )
+    short_mask = (
+        (macd < signal_line)
+        & (macd > 0)
+        & (signal_line > 0)
+        & (close > ema)
+        & (rsi > overbought)
+    )
+    return long_mask, short_mask
+
+
+def liquidation_price(buy_price, side, leverage, initial_margin, maintenance_margin):
+    if side == LONG:
+        return buy_price * (
+            1
+            - (initial_margin * (1 - maintenance_margin)) / (initial_margin * leverage)
+        )
+    elif side == SHORT:
+        return buy_price * (
+            1
+            + (initial_margin * (1 - maintenance_margin)) / (initial_margin * leverage)
+        )
+    return 0
+
+
+def _exit_hit(prices, side, take_profit_price, stop_loss_price):
+    if side == LONG:
+        return (prices >= take_profit_price) | (prices <= stop_loss_price)
+    return (prices <= take_profit_price) | (prices >= stop_loss_price)
+
+
+def _scan(n, start, hit, block=4096):
+    # First index >= start where hit(start, stop) is true. Scans forward in growing
+    # blocks so short trades don't pay for the whole tail.
+    while start < n:
+        stop = min(start + block, n)
+        hits = np.flatnonzero(hit(start, stop))
+        if hits.size:
+            return start + hits[0]
+        start = stop
+        block *= 2
+    return -1
+
+
+def _find_exit(close, start, side, take_profit_price, stop_loss_price, exit_mask=None):
+    if exit_mask is None:
+        return _scan(
+            len(close),
+            start,
+            lambda begin, end: _exit_hit(
+                close[begin:end], side, take_profit_price, stop_loss_price
+            ),
+        )
+    return _scan(
+        len(close),
+        start,
+        lambda begin, end: _exit_hit(
+            close[begin:end], side, take_profit_price, stop_loss_price
+        )
+        | exit_mask[begin:end],
+    )
+
+
+def trade_levels(buy_price, side, tp_percent, sl_percent, leverage):
+    # Take profit and stop loss prices considering leverage
+    if side == LONG:
+        stop_loss_price = buy_price * (1 - (sl_percent / leverage))
+        take_profit_price = buy_price * (1 + (tp_percent / leverage))
+    else:
+        stop_loss_price = buy_price * (1 + (sl_percent / leverage))
+        take_profit_price = buy_price * (1 - (tp_percent / leverage))
+    return take_profit_price, stop_loss_price
+
+
+def resolve_trade(
+    close,
+    j,
+    side,
+    tp_percent,
+    sl_percent,
+    leverage,
+    initial_margin,
+    maintenance_margin,
+    exit_mask=None,
+):
+    # Where a trade entered at the close of candle j ends: (exit_index, liquidated),
+    # exit_index is -1 while the trade is still open at the end of the data.
+    # exit_mask adds strategy exit signals, honoured from the candle after entry.
+    buy_price = close[j]
+    take_profit_price, stop_loss_price = trade_levels(
+        buy_price, side, tp_percent, sl_percent, leverage
+    )
+    # The legacy loop reads the side back from the current row, which is only
+    # set on the entry candle, so liquidation can only trigger there.
+    liq_price = liquidation_price(
+        buy_price, side, leverage, initial_margin, maintenance_margin
+    )
+    if (side == LONG and buy_price <= liq_price) or (
+        side == SHORT and buy_price >= liq_price
+    ):
+        return j, True
+    if _exit_hit(buy_price, side, take_profit_price, stop_loss_price):
+        return j, False
+    return (
+        _find_exit(close, j + 1, side, take_profit_price, stop_loss_price, exit_mask),
+        False,
+    )
+
+
+def simulate(
+    close,
+    long_mask,
+    short_mask,
+    tp_percent,
+    sl_percent,
+    leverage,
+    initial_margin,
+    maintenance_margin,
+    start=1,
+    verbose=True,
+    exit_mask=None,
+):
+    # Stateful position walk over plain arrays. Instead of visiting every candle it
+    # jumps from an entry straight to the first candle that hits TP/SL, then to the
+    # next entry signal, so the cost scales with the number of trades.
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    trades = []
+    # Trade messages go to the logger; decided once so a disabled logger costs
+    # nothing inside the loop
+    log_trades = verbose and logger.isEnabledFor(logging.INFO)
+
+    long_mask = np.asarray(long_mask, dtype=bool)
+    short_mask = np.asarray(short_mask, dtype=bool)
+    candidates = np.flatnonzero(long_mask | short_mask)
+    if exit_mask is not None:
+        exit_mask = np.asarray(exit_mask, dtype=bool)
+
+    i = start
+    while i < n:
+        k = np.searchsorted(candidates, i)
+        if k == len(candidates):
+            break
+        j = candidates[k]
+        buy_price = close[j]
+        current_side = LONG if long_mask[j] else SHORT
+        if log_trades:
+            if current_side == LONG:
+                logger.info("Bought at index %s, price %s - Long", j, buy_price)
+            else:
+                logger.info("Sold at index %s, price %s - Short", j, buy_price)
+
+        exit_index, was_liquidated = resolve_trade(
+            close,
+            j,
+            current_side,
+            tp_percent,
+            sl_percent,
+            leverage,
+            initial_margin,
+            maintenance_margin,
+            exit_mask,
+        )
+        if exit_index < 0:
+            # Still open at the end of the data
+            trades.append(
+                (j, -1, buy_price, np.nan, SIDE_CODES[current_side], 0.0, False)
+            )
+            break
+
+        current_price = close[exit_index]
+        # Same quirk as the legacy loop: the short formula is only used when the
+        # row still carries the "Short" side, i.e. when exiting on the entry
+        # candle (which is also the only candle a liquidation can happen on).
+        if current_side == SHORT and exit_index == j:
+            result = (buy_price - current_price) / buy_price * leverage
+        else:
+            result = (current_price - buy_price) / buy_price * leverage
+        trades.append(
+            (
+                j,
+                exit_index,
+                buy_price,
+                current_price,
+                SIDE_CODES[current_side],
+                result,
+                was_liquidated,
+            )
+        )
+        if log_trades:
+            if was_liquidated:
+                logger.info("Liquidated at index %s, price %s", j, current_price)
+            else:
+                logger.info("Closed at index %s, price %s", exit_index, current_price)
+        i = exit_index + 1
+
+    return np.array(trades, dtype=LEDGER_DTYPE)
+
+
+def candle_columns(ledger, n):
+    # Expand a ledger into the per-candle result columns of the legacy loop
+    # (Position, Trade_Result, Trade_Type, side, Liquidated)
+    position = np.zeros(n, dtype=np.int64)
+    trade_result = np.zeros(n, dtype=np.float64)
+    trade_type = np.full(n, None, dtype=object)
+    side = np.full(n, None, dtype=object)
+    liquidated = np.zeros(n, dtype=bool)
+
+    is_short = ledger["side"] == SIDE_CODES[SHORT]
+    names = np.where(is_short, SHORT, LONG).astype(object)
+    entry = ledger["entry_index"]
+    position[entry] = 1
+    side[entry] = names
+    trade_type[entry] = np.where(is_short, "sell", "buy")
+    # Exits are written after entries, so a trade closed on its entry candle
+    # shows the exit, as in the legacy loop
+    closed = ledger["exit_index"] >= 0
+    exit_index = ledger["exit_index"][closed]
+    position[exit_index] = -1
+    trade_result[exit_index] = ledger["trade_result"][closed]
+    side[exit_index] = names[closed]
+    trade_type[exit_index] = np.where(
+        ledger["liquidated"][closed],
+        "Liquidated",
+        np.where(is_short[closed], "buy", "sell"),
+    )
+    liquidated[exit_index] = ledger["liquidated"][closed]
+    return {
+        "Position": position,
+        "Trade_Result": trade_result,
+        "Trade_Type": trade_type,
+        "side": side,
+        "Liquidated": liquidated,
+    }
+
+
+def ledger_from_columns(close, position, trade_result, side, liquidated):
+    # The ledger behind a set of legacy result columns. A -1 without an open
+    # entry is a trade opened and closed on the same candle.
+    trades = []
+    entry = None
+    for i in np.flatnonzero(np.asarray(position) != 0):
+        if position[i] == 1:
+            entry = i
+            continue
+        j = i if entry is None else entry
+        trades.append(
+            (
+                j,
+                i,
+                close[j],
+                close[i],
+                SIDE_CODES[side[i]],
+                trade_result[i],
+                liquidated[i],
+            )
+        )
+        entry = None
+    if entry is not None:
+        trades.append(
+            (entry, -1, close[entry], np.nan, SIDE_CODES[side[entry]], 0.0, False)
+        )
+    return np.array(trades, dtype=LEDGER_DTYPE)
+
+
+def trade_returns(ledger, leverage):
+    # Return on margin of every closed trade with the real sign for both sides
+    # (unlike the legacy trade_result), recomputed from the fill prices so any
+    # leverage can be applied. A position can't lose more than its margin.
+    closed = ledger[ledger["exit_index"] >= 0]
+    returns = (
+        closed["side"]
+        * (closed["exit_price"] - closed["entry_price"])
+        / closed["entry_price"]
+        * leverage
+    )
+    returns[closed["liquidated"]] = -1.0
+    return np.maximum(returns, -1.0)
+
+
+def win_rate(trade_result):
+    trade_result = np.asarray(trade_result)
+    trades = trade_result[trade_result != 0.0]
+    if len(trades) == 0:
+        return 0
+    wins = trades[trades > 0]
+    return len(wins) / len(trades) * 100
+
+
+def total_profit_loss(trade_result, liquidated, initial_margin):
+    # Any liquidation wipes the margin
+    if np.any(liquidated):
+        return 0
+    return initial_margin + np.sum(trade_result)
+
+
+def _intrabar_levels(side, take_profit_price, stop_loss_price, liq_price):
+    # The adverse exit is whichever of stop loss and liquidation sits closer to
+    # the entry, since price has to cross it first
+    if side == LONG:
+        liquidated = liq_price > stop_loss_price
+        return max(stop_loss_price, liq_price), liquidated
+    liquidated = liq_price < stop_loss_price
+    return min(stop_loss_price, liq_price), liquidated
+
+
+def _touches(side, high, low, take_profit_price, adverse_price):
+    if side == LONG:
+        return high >= take_profit_price, low <= adverse_price
+    return low <= take_profit_price, high >= adverse_price
+
+
+def _fill_price(side, level, bar_open, favourable):
+    # A bar that opens beyond the level (a gap) fills at the open
+    if side == LONG:
+        return max(level, bar_open) if favourable else min(level, bar_open)
+    return min(level, bar_open) if favourable else max(level, bar_open)
+
+
+def _resolve_in_fine_bars(fine, bar_start, bar_end, side, take_profit_price, adverse):
+    # Walk the finer candles inside one ambiguous bar in time order. Returns
+    # (favourable, fine_open) or None when the fine data can't settle it either.
+    if fine is None:
+        return None
+    open_time, fine_open, fine_high, fine_low = fine
+    first = np.searchsorted(open_time, bar_start)
+    last = np.searchsorted(open_time, bar_end)
+    for k in range(first, last):
+        favourable, adverse_hit = _touches(
+            side, fine_high[k], fine_low[k], take_profit_price, adverse
+        )
+        if favourable and adverse_hit:
+            return None
+        if favourable or adverse_hit:
+            return favourable, fine_open[k]
+    return None
+
+
+def simulate_intrabar(
+    open_time,
+    open_,
+    high,
+    low,
+    close,
+    long_mask,
+    short_mask,
+    tp_percent,
+    sl_percent,
+    leverage,
+    initial_margin,
+    maintenance_margin,
+    interval_ms,
+    fine_loader=None,
+    start=1,
+    verbose=True,
+    exit_mask=None,
+):
+    # Fill model that checks TP, SL and liquidation against each candle's high/low
+    # instead of its close and fills at the level itself. Only when one candle
+    # touches both sides is the finer-interval data for that candle consulted (via
+    # fine_loader, called at most once); without it the adverse side is assumed to
+    # have been hit first. Trade results use the real P&L sign for both sides.
+    # Entries are taken at the signal candle's close, exits from the next candle.
+    # A strategy exit signal (exit_mask) without a TP/SL touch fills at the close.
+    open_time = np.asarray(open_time, dtype=np.int64)
+    open_ = np.asarray(open_, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    trades = []
+    # Trade messages go to the logger; decided once so a disabled logger costs
+    # nothing inside the loop
+    log_trades = verbose and logger.isEnabledFor(logging.INFO)
+
+    long_mask = np.asarray(long_mask, dtype=bool)
+    short_mask = np.asarray(short_mask, dtype=bool)
+    candidates = np.flatnonzero(long_mask | short_mask)
+    if exit_mask is None:
+        exit_mask = np.zeros(n, dtype=bool)
+    exit_mask = np.asarray(exit_mask, dtype=bool)
+    fine = {}
+
+    i = start
+    while i < n:
+        k = np.searchsorted(candidates, i)
+        if k == len(candidates):
+            break
+        j = candidates[k]
+        buy_price = close[j]
+        current_side = LONG if long_mask[j] else SHORT
+        if log_trades:
+            if current_side == LONG:
+                logger.info("Bought at index %s, price %s - Long", j, buy_price)
+            else:
+                logger.info("Sold at index %s, price %s - Short", j, buy_price)
+        take_profit_price, stop_loss_price = trade_levels(
+            buy_price, current_side, tp_percent, sl_percent, leverage
+        )
+
+        liq_price = liquidation_price(
+            buy_price, current_side, leverage, initial_margin, maintenance_margin
+        )
+        adverse, adverse_is_liquidation = _intrabar_levels(
+            current_side, take_profit_price, stop_loss_price, liq_price
+        )
+        exit_index = _scan(
+            n,
+            j + 1,
+            lambda begin, end: np.logical_or(
+                *_touches(
+                    current_side,
+                    high[begin:end],
+                    low[begin:end],
+                    take_profit_price,
+                    adverse,
+                )
+            )
+            | exit_mask[begin:end],
+        )
+        if exit_index < 0:
+            trades.append(
+                (j, -1, buy_price, np.nan, SIDE_CODES[current_side], 0.0, False)
+            )
+            break
+
+        favourable, adverse_hit = _touches(
+            current_side,
+            high[exit_index],
+            low[exit_index],
+            take_profit_price,
+            adverse,
+        )
+        bar_open = open_[exit_index]
+        if favourable and adverse_hit:
+            if "bars" not in fine:
+                fine["bars"] = fine_loader() if fine_loader else None
+            resolved = _resolve_in_fine_bars(
+                fine["bars"],
+                open_time[exit_index],
+                open_time[exit_index] + interval_ms,
+                current_side,
+                take_profit_price,
+                adverse,
+            )
+            # Unresolved: assume the worst case
+            favourable, bar_open = resolved if resolved else (False, bar_open)
+        if not favourable and not adverse_hit:
+            # Exit signal only
+            exit_price = close[exit_index]
+            adverse_is_liquidation = False
+        else:
+            level = take_profit_price if favourable else adverse
+            exit_price = _fill_price(current_side, level, bar_open, favourable)
+
+        if current_side == LONG:
+            result = (exit_price - buy_price) / buy_price * leverage
+        else:
+            result = (buy_price - exit_price) / buy_price * leverage
+        was_liquidated = not favourable and adverse_is_liquidation
+        trades.append(
+            (
+                j,
+                exit_index,
+                buy_price,
+                exit_price,
+                SIDE_CODES[current_side],
+                result,
+                was_liquidated,
+            )
+        )
+        if log_trades:
+            if was_liquidated:
+                logger.info("Liquidated at index %s, price %s", exit_index, exit_price)
+            else:
+                logger.info("Closed at index %s, price %s", exit_index, exit_price)
+        i = exit_index + 1
+
+    return np.array(trades, dtype=LEDGER_DTYPE)
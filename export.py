@@ -0,0 +1,108 @@
+import glob
+import itertools
+import os
+import time
+from typing import Dict, Optional
+
+import pandas as pd
+
+try:
+    # Optional: Parquet and Feather need pyarrow, CSV (plain or gzip) doesn't
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Format name -> file extension
+FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+DEFAULT_DATASET_FORMAT = "parquet" if HAS_PYARROW else "csv.gz"
+
+_part_counter = itertools.count()
+
+
+def format_for(path: str) -> str:
+    for fmt, extension in sorted(FORMATS.items(), key=lambda item: -len(item[1])):
+        if path.endswith(extension):
+            return fmt
+    raise ValueError(f"Can't tell the export format of {path}")
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt in ("parquet", "feather") and not HAS_PYARROW:
+        raise ImportError(f"Exporting to {fmt} requires pyarrow (pip install pyarrow)")
+
+
+def write_frame(frame: pd.DataFrame, path: str, fmt: Optional[str] = None) -> str:
+    fmt = fmt or format_for(path)
+    check_format(fmt)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write next to the target and swap it in, so concurrent readers (and runs
+    # racing on the same path) never see a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == "csv":
+        frame.to_csv(tmp_path, index=False)
+    elif fmt == "csv.gz":
+        frame.to_csv(tmp_path, index=False, compression="gzip")
+    elif fmt == "parquet":
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        frame.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_frame(path: str, fmt: Optional[str] = None) -> pd.DataFrame:
+    fmt = fmt or format_for(path)
+    check_format(fmt)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    if fmt == "feather":
+        return pd.read_feather(path)
+    return pd.read_csv(path)
+
+
+def append_to_dataset(
+    frame: pd.DataFrame,
+    root: str,
+    partition: Optional[Dict[str, object]] = None,
+    fmt: Optional[str] = None,
+) -> str:
+    # Hive-style layout (root/key=value/.../part-*.ext). Every call writes its own
+    # part file, so many runs or processes can append to one dataset without
+    # rewriting or locking anything.
+    fmt = fmt or DEFAULT_DATASET_FORMAT
+    check_format(fmt)
+    directory = os.path.join(
+        root, *(f"{key}={value}" for key, value in (partition or {}).items())
+    )
+    name = f"part-{time.time_ns()}-{os.getpid()}-{next(_part_counter)}{FORMATS[fmt]}"
+    return write_frame(frame, os.path.join(directory, name), fmt)
+
+
+def read_dataset(root: str, fmt: Optional[str] = None) -> pd.DataFrame:
+    # All parts under root, with the partition keys added back as columns
+    fmt = fmt or DEFAULT_DATASET_FORMAT
+    frames = []
+    for path in sorted(
+        glob.glob(os.path.join(root, "**", f"part-*{FORMATS[fmt]}"), recursive=True)
+    ):
+        frame = read_frame(path, fmt)
+        relative = os.path.relpath(os.path.dirname(path), root)
+        for part in relative.split(os.sep):
+            if "=" in part:
+                key, value = part.split("=", 1)
+                frame[key] = value
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -1,7 +1,19 @@
 import os
+import re
+import calendar
 import shutil
+import numpy as np
 import pandas as pd
 from datetime import timedelta
+from candle_store import CANDLE_COLUMNS, STORE_SUFFIX, is_store, load_store, resolve
+
+# Month part of the file names is not consistent ("july", "July", "June", "07")
+MONTHS = {
+    **{name.lower(): number for number, name in enumerate(calendar.month_name) if name},
+    **{name.lower(): number for number, name in enumerate(calendar.month_abbr) if name},
+    **{f"{number:02}": number for number in range(1, 13)},
+    **{str(number): number for number in range(1, 13)},
+}
 
 
 def get_data(symbol, timestamp, year, month):
@@ -12,7 +24,215 @@ def get_data(symbol, timestamp, year, month):
     # Create the file path
     csv_filename = f"{symbol}-{timestamp}-{year}-{month}.csv"
     csv_path = os.path.join(timestamp_directory, csv_filename)
-    return csv_path
+    if not os.path.exists(csv_path) and not is_store(resolve(csv_path)):
+        # Fall back to the same month spelled differently (e.g. "july" vs "July")
+        for file_year, file_month, path in find_candle_files(
+            symbol, timestamp, data_directory
+        ):
+            if file_year == int(year) and file_month == MONTHS.get(str(month).lower()):
+                return path
+    # Use the binary candle store when the file has been migrated
+    path = resolve(csv_path)
+    if not os.path.exists(path) and str(month).lower() in MONTHS:
+        # Not downloaded: build it from the 1m candles when there are any.
+        # Imported here because resample reads candles through this module.
+        from resample import derived_month
+
+        derived = derived_month(
+            symbol,
+            timestamp,
+            int(year),
+            MONTHS[str(month).lower()],
+            data_directory=data_directory,
+        )
+        if derived:
+            return derived
+    return path
+
+
+def find_candle_files(symbol, interval, data_directory=None):
+    # All monthly files for a symbol/interval as sorted (year, month, path) tuples,
+    # preferring the binary store over the CSV for the same month
+    if data_directory is None:
+        script_directory = os.path.dirname(os.path.abspath(__file__))
+        data_directory = os.path.join(script_directory, "data")
+    interval_directory = os.path.join(data_directory, interval)
+    if not os.path.isdir(interval_directory):
+        return []
+    pattern = re.compile(
+        rf"^{re.escape(symbol)}-{re.escape(interval)}-(\d{{4}})-(\w+?)"
+        rf"(\.csv|{re.escape(STORE_SUFFIX)})$",
+        re.IGNORECASE,
+    )
+    files = {}
+    for filename in os.listdir(interval_directory):
+        match = pattern.match(filename)
+        if not match or match.group(2).lower() not in MONTHS:
+            continue
+        key = (int(match.group(1)), MONTHS[match.group(2).lower()])
+        path = os.path.join(interval_directory, filename)
+        if match.group(3) == ".csv":
+            path = resolve(path)
+        elif not is_store(path):
+            continue
+        # A store always wins over a CSV of the same month
+        if key not in files or is_store(path):
+            files[key] = path
+    return [(year, month, files[(year, month)]) for year, month in sorted(files)]
+
+
+def _to_ms(value):
+    if value is None:
+        return None
+    if isinstance(value, str) and re.match(r"^\d{2}/\d{2}/\d{4}$", value):
+        # Same dd/mm/yyyy format as download_data.get_historical_candles
+        value = pd.to_datetime(value, format="%d/%m/%Y")
+    return int(pd.Timestamp(value).value // 1_000_000)
+
+
+def _month_range_ms(year, month):
+    start = pd.Timestamp(year=year, month=month, day=1)
+    return (
+        start.value // 1_000_000,
+        (start + pd.offsets.MonthBegin(1)).value // 1_000_000,
+    )
+
+
+def _read_chunks(path, columns, chunksize, start_ms=None, end_ms=None):
+    # Raw millisecond columns from either a store or a CSV, chunksize rows at a time
+    if is_store(path):
+        arrays = load_store(path, columns)
+        open_time = arrays["open_time"]
+        # Sorted timestamps: jump straight to the rows in range
+        first = 0 if start_ms is None else np.searchsorted(open_time, start_ms)
+        total = len(open_time) if end_ms is None else np.searchsorted(open_time, end_ms)
+        for begin in range(first, total, chunksize):
+            yield {
+                name: values[begin : begin + chunksize]
+                for name, values in arrays.items()
+            }
+        return
+    names = [name for name, _ in CANDLE_COLUMNS]
+    header = list(pd.read_csv(path, nrows=0).columns)
+    named = set(names).issubset(header)
+    reader = pd.read_csv(path, usecols=columns if named else None, chunksize=chunksize)
+    for chunk in reader:
+        if not named:
+            chunk = chunk.loc[:, ~chunk.columns.str.contains("^Unnamed")]
+            chunk.columns = names
+        yield {name: chunk[name].to_numpy() for name in columns}
+
+
+def _to_frame(arrays, columns):
+    frame = pd.DataFrame({name: arrays[name] for name in columns}, copy=False)
+    for name in ("open_time", "close_time"):
+        if name in frame:
+            frame[name] = pd.to_datetime(frame[name], unit="ms")
+    return frame
+
+
+def _iter_candles(symbol, interval, start, end, columns, chunksize, data_directory):
+    start_ms = _to_ms(start)
+    end_ms = _to_ms(end)
+    needed = list(dict.fromkeys(["open_time"] + columns))
+    last_open_time = None
+    pending = []
+    pending_rows = 0
+    for year, month, path in find_candle_files(symbol, interval, data_directory):
+        month_start, month_end = _month_range_ms(year, month)
+        # Skip whole files outside the range without opening them
+        if (end_ms is not None and month_start >= end_ms) or (
+            start_ms is not None and month_end <= start_ms
+        ):
+            continue
+        # Files can overlap at month boundaries; drop rows the previous file
+        # already covered (rows within one file are kept as they are)
+        boundary = last_open_time
+        for arrays in _read_chunks(path, needed, chunksize, start_ms, end_ms):
+            open_time = arrays["open_time"]
+            keep = np.ones(len(open_time), dtype=bool)
+            if start_ms is not None:
+                keep &= open_time >= start_ms
+            if end_ms is not None:
+                keep &= open_time < end_ms
+            if boundary is not None:
+                keep &= open_time > boundary
+            if not keep.any():
+                continue
+            if not keep.all():
+                arrays = {name: values[keep] for name, values in arrays.items()}
+            last_open_time = arrays["open_time"][-1]
+            pending.append(arrays)
+            pending_rows += len(arrays["open_time"])
+            while pending_rows >= chunksize:
+                merged = {
+                    name: np.concatenate([part[name] for part in pending])
+                    for name in needed
+                }
+                yield _to_frame(
+                    {name: values[:chunksize] for name, values in merged.items()},
+                    columns,
+                )
+                pending = [
+                    {name: values[chunksize:] for name, values in merged.items()}
+                ]
+                pending_rows -= chunksize
+    if pending_rows:
+        merged = {
+            name: np.concatenate([part[name] for part in pending]) for name in needed
+        }
+        yield _to_frame(merged, columns)
+
+
+def load_candles(
+    symbol,
+    interval,
+    start=None,
+    end=None,
+    columns=None,
+    chunksize=None,
+    data_directory=None,
+):
+    # Candles in [start, end) stitched across every monthly file that overlaps the
+    # range. With chunksize the frames are yielded lazily instead of concatenated.
+    columns = list(columns or [name for name, _ in CANDLE_COLUMNS])
+    chunks = _iter_candles(
+        symbol,
+        interval,
+        start,
+        end,
+        columns,
+        chunksize or 1_000_000,
+        data_directory,
+    )
+    if chunksize:
+        return chunks
+    frames = list(chunks)
+    if not frames:
+        return _to_frame(
+            {name: np.empty(0, dtype=dtype) for name, dtype in CANDLE_COLUMNS},
+            columns,
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def last_open_time(symbol, interval, data_directory=None):
+    # open_time (ms) of the newest stored candle, read from the latest monthly
+    # file only; None when there are no candles
+    files = find_candle_files(symbol, interval, data_directory)
+    if not files:
+        return None
+    year, month, _ = files[-1]
+    open_time = load_candles(
+        symbol,
+        interval,
+        start=pd.Timestamp(year=year, month=month, day=1),
+        columns=["open_time"],
+        data_directory=data_directory,
+    )["open_time"]
+    if open_time.empty:
+        return None
+    return int(open_time.iloc[-1].value // 1_000_000)
 
 
 def get_zipl_files_path(symbol, month, timestamp):
@@ -46,6 +266,7 @@ def move_downloaded_file_to_required_folder(file_path: str, symbol):
     shutil.move(csv_file_current_path, required_path)
 
     print(f"File moved to: {required_path}")
+    return required_path
 
 
 def clean_and_save_data(file_path: str, start_date: str, end_date: str):
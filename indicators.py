@@ -0,0 +1,152 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from kernels import ema_many, ewm_many, rsi_many
+
+
+def fingerprint(values) -> str:
+    # Content hash of the input series, so equal data hits the cache no matter
+    # which DataFrame (or process) it came from
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    digest = hashlib.blake2b(values.view(np.uint8), digest_size=16)
+    digest.update(str(len(values)).encode())
+    return digest.hexdigest()
+
+
+class IndicatorCache:
+    # In-memory LRU bounded by entry count and by the total size of the arrays
+    # held, so long series (and every sweep worker's own default_cache) can't
+    # grow it without limit. Evicted entries are reloaded from cache_dir, if set.
+    def __init__(
+        self,
+        max_entries: int = 256,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 256 * 2**20,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key, label):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        # symbol/interval only organise the files on disk; the key is what matches
+        directory = os.path.join(self.cache_dir, label) if label else self.cache_dir
+        return os.path.join(directory, f"{key[1]}-{name}.npy")
+
+    def get(self, key, label=None):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        if self.cache_dir:
+            path = self._path(key, label)
+            if os.path.exists(path):
+                values = np.load(path)
+                values.flags.writeable = False
+                self._store(key, values)
+                self.hits += 1
+                return values
+        self.misses += 1
+        return None
+
+    def put(self, key, values, label=None):
+        values = np.asarray(values, dtype=np.float64)
+        values.flags.writeable = False
+        self._store(key, values)
+        if self.cache_dir:
+            path = self._path(key, label)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so a crash never leaves a truncated entry
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, values)
+            os.replace(tmp_path, path)
+        return values
+
+    def _store(self, key, values):
+        if key in self._entries:
+            self.nbytes -= self._entries[key].nbytes
+        self._entries[key] = values
+        self._entries.move_to_end(key)
+        self.nbytes += values.nbytes
+        # An array larger than max_bytes on its own isn't kept at all
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def compute(self, close, indicator: str, params: tuple, func, label=None):
+        key = (fingerprint(close), indicator, params)
+        values = self.get(key, label)
+        if values is None:
+            values = self.put(key, func(), label)
+        return values
+
+
+default_cache = IndicatorCache()
+
+
+def _label(symbol, interval):
+    if symbol and interval:
+        return f"{symbol}-{interval}"
+    return symbol or interval
+
+
+def ema(close, window: int, cache=None, symbol=None, interval=None):
+    cache = cache or default_cache
+    return cache.compute(
+        close,
+        "ema",
+        (window,),
+        lambda: ema_many(close, [window])[0],
+        _label(symbol, interval),
+    )
+
+
+def rsi(close, window: int, cache=None, symbol=None, interval=None):
+    cache = cache or default_cache
+    return cache.compute(
+        close,
+        "rsi",
+        (window,),
+        lambda: rsi_many(close, [window])[0],
+        _label(symbol, interval),
+    )
+
+
+def macd(
+    close,
+    window_fast: int = 12,
+    window_slow: int = 26,
+    window_sign: int = 9,
+    cache=None,
+    symbol=None,
+    interval=None,
+):
+    # The signal line is derived from the MACD line, so both are cached together
+    cache = cache or default_cache
+    params = (window_fast, window_slow, window_sign)
+
+    def compute():
+        # One window per kernel call keeps the values identical to ta.trend.MACD
+        line = ema_many(close, [window_fast])[0] - ema_many(close, [window_slow])[0]
+        signal = ewm_many(line, (window_sign - 1) / 2, window_sign)[0]
+        return np.vstack([line, signal])
+
+    values = cache.compute(close, "macd", params, compute, _label(symbol, interval))
+    return values[0], values[1]
@@ -0,0 +1,109 @@
+import cProfile
+import logging
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class RunReport:
+    # Per-stage timings (and optionally allocation peaks) plus counters for one
+    # backtest. The caller can record its own stages (e.g. loading) into the
+    # same report before handing it to BacktestStrategy.
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {"stage": name, "seconds": time.perf_counter() - started}
+            if self.trace_memory:
+                entry["peak_mb"] = (
+                    tracemalloc.get_traced_memory()[1] - baseline
+                ) / 2**20
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(entry)
+            logger.debug("%s took %.4fs", name, entry["seconds"])
+
+    def count(self, **counters):
+        self.counters.update(counters)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(entry["seconds"] for entry in self.stages)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": list(self.stages),
+            "counters": dict(self.counters),
+            "total_seconds": self.total_seconds,
+        }
+
+    def __str__(self):
+        lines = []
+        for entry in self.stages:
+            line = f"{entry['stage']:<16} {entry['seconds']:>10.4f}s"
+            if "peak_mb" in entry:
+                line += f" {entry['peak_mb']:>9.1f} MB"
+            lines.append(line)
+        lines.append(f"{'total':<16} {self.total_seconds:>10.4f}s")
+        lines += [f"{key}: {value}" for key, value in self.counters.items()]
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiled(profiler: Optional[str] = None, output: Optional[str] = None, top=25):
+    # profiler=None is a no-op. cProfile dumps stats to `output` (or prints the
+    # top entries); pyinstrument is optional and writes HTML to `output`.
+    if profiler is None:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler}")
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if output:
+                profile.dump_stats(output)
+            else:
+                pstats.Stats(profile).sort_stats("cumulative").print_stats(top)
+        return
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        raise ImportError(
+            "Profiling with pyinstrument requires pip install pyinstrument"
+        )
+    profile = Profiler()
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+        if output:
+            with open(output, "w") as file:
+                file.write(profile.output_html())
+        else:
+            print(profile.output_text())
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+try:
+    # Optional: compiles the exact pandas recursion into one loop over the data.
+    # Without it a blocked NumPy closed form is used for several windows.
+    from numba import njit
+
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Largest power of 1 / (1 - alpha) a block may build up before it is folded back
+# into the running value
+_MAX_SCALE_DIGITS = 250
+_MAX_BLOCK = 256
+
+
+def _ewm_exact(values, com, min_periods):
+    # pandas' ewm(adjust=False).mean() recursion (the one `ta` relies on), for
+    # every row at once while walking the columns a single time
+    rows, n = values.shape
+    out = np.empty((rows, n))
+    alpha = 1.0 / (1.0 + com)
+    old_wt_factor = 1.0 - alpha
+    weighted = np.empty(rows)
+    old_wt = np.ones(rows)
+    nobs = np.zeros(rows, dtype=np.int64)
+    for r in range(rows):
+        weighted[r] = values[r, 0]
+        if weighted[r] == weighted[r]:
+            nobs[r] = 1
+        out[r, 0] = weighted[r] if nobs[r] >= max(min_periods[r], 1) else np.nan
+    for i in range(1, n):
+        for r in range(rows):
+            cur = values[r, i]
+            is_observation = cur == cur
+            if is_observation:
+                nobs[r] += 1
+            if weighted[r] == weighted[r]:
+                old_wt[r] *= old_wt_factor[r]
+                if is_observation:
+                    if weighted[r] != cur:
+                        weighted[r] = (old_wt[r] * weighted[r] + alpha[r] * cur) / (
+                            old_wt[r] + alpha[r]
+                        )
+                    old_wt[r] = 1.0
+            elif is_observation:
+                weighted[r] = cur
+            out[r, i] = weighted[r] if nobs[r] >= max(min_periods[r], 1) else np.nan
+    return out
+
+
+if HAS_NUMBA:
+    _ewm_exact = njit(cache=True)(_ewm_exact)
+
+
+def _ewm_blocked(values, alpha, out):
+    # y[k] = (1 - a) y[k-1] + a x[k], y[0] = x[0], for rows without NaNs, written
+    # into `out`; a 1-D `values` is shared by all rows. Within a block of B
+    # columns y[b+k] = f^(k+1) (y[b-1] + a sum_j x[b+j] f^-(j+1)) with f = 1 - a,
+    # so each block is one cumsum over all rows; B is kept small enough that
+    # f^-B stays far from overflowing.
+    rows, n = out.shape
+    shared = values.ndim == 1
+    factor = 1.0 - alpha
+    copy = factor == 0  # alpha == 1 (a window of 1) is the input itself
+    if copy.any():
+        out[copy] = values if shared else values[copy]
+    scaled = np.flatnonzero(~copy)
+    if not len(scaled) or n == 0:
+        return out
+    every_row = len(scaled) == rows
+    digits = np.max(-np.log10(factor[scaled]))
+    block = int(max(1, min(_MAX_BLOCK, _MAX_SCALE_DIGITS / digits)))
+    powers = factor[scaled, None] ** np.arange(1, block + 1)
+    weights = alpha[scaled, None] / powers
+    state = np.full(len(scaled), values[0]) if shared else values[scaled, 0]
+    # One small buffer reused for every block keeps the work in cache
+    buffer = np.empty((len(scaled), block))
+    for begin in range(0, n, block):
+        m = min(block, n - begin)
+        columns = slice(begin, begin + m)
+        y = buffer[:, :m]
+        np.multiply(
+            values[columns] if shared else values[scaled, columns],
+            weights[:, :m],
+            out=y,
+        )
+        np.cumsum(y, axis=1, out=y)
+        y += state[:, None]
+        y *= powers[:, :m]
+        if every_row:
+            out[:, columns] = y
+        else:
+            out[scaled, columns] = y
+        state = y[:, -1].copy()
+    return out
+
+
+def ewm_many(values, com, min_periods) -> np.ndarray:
+    # ewm(com=com[r], min_periods=min_periods[r], adjust=False).mean() of every
+    # row of `values` (a 1-D series is shared by all rows), as a (rows, n) array
+    com = np.atleast_1d(np.asarray(com, dtype=np.float64))
+    rows = len(com)
+    min_periods = np.broadcast_to(
+        np.asarray(min_periods, dtype=np.int64), com.shape
+    ).copy()
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    if HAS_NUMBA:
+        return _ewm_exact(np.broadcast_to(values, (rows, n)).copy(), com, min_periods)
+
+    missing = np.isnan(np.atleast_2d(values))
+    starts = np.where(missing.all(axis=1), n, np.argmax(~missing, axis=1))
+    if rows == 1 or missing.sum() != starts.sum():
+        # A single window (pandas is exact and as fast) or NaNs after the start
+        return np.vstack(
+            [
+                pd.Series(row)
+                .ewm(com=c, min_periods=int(p), adjust=False)
+                .mean()
+                .to_numpy()
+                for row, c, p in zip(
+                    np.broadcast_to(values, (rows, n)), com, min_periods
+                )
+            ]
+        )
+
+    out = np.full((rows, n), np.nan)
+    alpha = 1.0 / (1.0 + com)
+    if values.ndim == 1:
+        start = starts[0]
+        if start < n:
+            _ewm_blocked(values[start:], alpha, out[:, start:])
+    else:
+        # Rows share their leading NaN run (e.g. MACD lines of one slow window),
+        # so each group is computed from its first value on
+        for start in np.unique(starts):
+            if start >= n:
+                continue
+            group = np.flatnonzero(starts == start)
+            out[group, start:] = _ewm_blocked(
+                values[group, start:], alpha[group], np.empty((len(group), n - start))
+            )
+    # min_periods counts observations, i.e. candles since the first value
+    starts = np.broadcast_to(starts, (rows,))
+    for row in range(rows):
+        out[row, : starts[row] + max(min_periods[row], 1) - 1] = np.nan
+    return out
+
+
+def ema_many(close, windows) -> np.ndarray:
+    # (len(windows), n): ta.trend.EMAIndicator(close, window).ema_indicator()
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    return ewm_many(close, (windows - 1) / 2, windows)
+
+
+def macd_many(close, window_fast, window_slow, window_sign):
+    # MACD and signal lines of every (fast, slow, sign) triple, as ta.trend.MACD.
+    # Each distinct EMA window is computed once.
+    fast, slow, sign = np.broadcast_arrays(
+        *(
+            np.atleast_1d(np.asarray(w, dtype=np.int64))
+            for w in (window_fast, window_slow, window_sign)
+        )
+    )
+    windows, inverse = np.unique(np.concatenate([fast, slow]), return_inverse=True)
+    emas = ema_many(close, windows)
+    lines = emas[inverse[: len(fast)]] - emas[inverse[len(fast) :]]
+    signals = ewm_many(lines, (sign - 1) / 2, sign)
+    return lines, signals
+
+
+def rsi_many(close, windows) -> np.ndarray:
+    # (len(windows), n): ta.momentum.RSIIndicator(close, window).rsi()
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.float64))
+    close = np.asarray(close, dtype=np.float64)
+    diff = np.empty(len(close))
+    diff[:1] = np.nan
+    diff[1:] = close[1:] - close[:-1]
+    # The missing first difference counts as no move, as in diff.where(...)
+    up = np.where(diff > 0, diff, 0.0)
+    down = -np.where(diff < 0, diff, 0.0)
+    alpha = 1 / windows
+    com = (1 - alpha) / alpha
+    up_direction = ewm_many(up, com, windows.astype(np.int64))
+    down_direction = ewm_many(down, com, windows.astype(np.int64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_strength = up_direction / down_direction
+        return np.where(down_direction == 0, 100, 100 - (100 / (1 + relative_strength)))
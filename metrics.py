@@ -0,0 +1,142 @@
+from typing import Optional
+
+import numpy as np
+
+from engine import trade_returns
+
+YEAR_MS = 365 * 24 * 60 * 60 * 1000  # Crypto trades every day of the year
+
+METRICS = [
+    "final_equity",
+    "total_return",
+    "max_drawdown",
+    "max_drawdown_duration",
+    "sharpe",
+    "sortino",
+    "exposure",
+    "avg_trade_duration",
+    "profit_factor",
+]
+
+
+def equity_curve(
+    close,
+    ledger,
+    leverage: float,
+    initial_capital: float = 100.0,
+    fraction: float = 1.0,
+) -> np.ndarray:
+    # Mark-to-market equity at every candle close. Each trade commits `fraction`
+    # of the equity it opens with as margin, so results compound; while a trade
+    # is open its unrealized return is marked at the close (never below the
+    # margin), and on its exit candle the realized return at the fill price.
+    # Trades in a ledger never overlap, so the whole curve is a few array ops.
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    equity = np.full(n, float(initial_capital))
+    if len(ledger) == 0 or n == 0:
+        return equity
+
+    entry = ledger["entry_index"]
+    # A trade still open at the end is marked until the last candle
+    exit_index = np.where(ledger["exit_index"] >= 0, ledger["exit_index"], n - 1)
+    closed = ledger["exit_index"] >= 0
+    realized = np.zeros(len(ledger))
+    realized[closed] = trade_returns(ledger, leverage)
+    growth = np.maximum(1 + fraction * realized, 0)
+    # Equity each trade opens with, and the equity after it
+    before = initial_capital * np.concatenate([[1.0], np.cumprod(growth)[:-1]])
+    after = before * growth
+
+    bars = np.arange(n)
+    trade = np.searchsorted(entry, bars, side="right") - 1
+    has_trade = trade >= 0
+    trade = np.maximum(trade, 0)
+    in_trade = has_trade & (bars <= exit_index[trade])
+
+    # Flat candles carry the equity left by the last closed trade
+    equity[has_trade] = after[trade[has_trade]]
+    k = trade[in_trade]
+    unrealized = (
+        ledger["side"][k]
+        * (close[in_trade] - ledger["entry_price"][k])
+        / ledger["entry_price"][k]
+        * leverage
+    )
+    on_exit = bars[in_trade] == exit_index[k]
+    unrealized = np.where(on_exit & closed[k], realized[k], unrealized)
+    equity[in_trade] = before[k] * np.maximum(1 + fraction * unrealized, 0)
+    return equity
+
+
+def bars_per_year(open_time):
+    if open_time is None or len(open_time) < 2:
+        return None
+    open_time = np.asarray(open_time)
+    if np.issubdtype(open_time.dtype, np.datetime64):
+        open_time = open_time.astype("datetime64[ms]").astype(np.int64)
+    step = np.median(np.diff(open_time.astype(np.int64)))
+    return YEAR_MS / step if step > 0 else None
+
+
+def risk_metrics(
+    close,
+    ledger,
+    leverage: float,
+    initial_capital: float = 100.0,
+    fraction: float = 1.0,
+    open_time=None,
+    periods_per_year: Optional[float] = None,
+) -> dict:
+    # Risk metrics of one run from a single equity curve. Sharpe and Sortino are
+    # annualised from the candle interval when `open_time` (or
+    # `periods_per_year`) is given, otherwise they are per candle. Durations are
+    # in candles.
+    equity = equity_curve(close, ledger, leverage, initial_capital, fraction)
+    n = len(equity)
+    if periods_per_year is None:
+        periods_per_year = bars_per_year(open_time)
+
+    # Per-candle returns; nothing moves once the equity is wiped out
+    returns = np.zeros(n)
+    if n > 1:
+        previous = equity[:-1]
+        np.divide(np.diff(equity), previous, out=returns[1:], where=previous > 0)
+    mean = returns.mean() if n else 0.0
+    std = returns.std() if n else 0.0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) if n else 0.0
+    scale = np.sqrt(periods_per_year) if periods_per_year else 1.0
+
+    peak = np.maximum.accumulate(equity)
+    drawdown = 1 - equity / peak
+    # Longest stretch below a previous high
+    underwater = drawdown > 0
+    starts = np.flatnonzero(
+        np.diff(np.concatenate([[0], underwater.astype(np.int8)])) == 1
+    )
+    ends = np.flatnonzero(
+        np.diff(np.concatenate([underwater.astype(np.int8), [0]])) == -1
+    )
+
+    is_closed = ledger["exit_index"] >= 0
+    realized = trade_returns(ledger, leverage)
+    exit_index = np.where(is_closed, ledger["exit_index"], n - 1)
+    durations = exit_index - ledger["entry_index"]
+    gains = realized[realized > 0].sum()
+    losses = -realized[realized < 0].sum()
+
+    return {
+        "final_equity": float(equity[-1]) if n else float(initial_capital),
+        "total_return": float(equity[-1] / initial_capital - 1) if n else 0.0,
+        "max_drawdown": float(drawdown.max()) if n else 0.0,
+        "max_drawdown_duration": int((ends - starts + 1).max()) if len(starts) else 0,
+        "sharpe": float(mean / std * scale) if std > 0 else 0.0,
+        "sortino": float(mean / downside * scale) if downside > 0 else 0.0,
+        "exposure": float((durations + 1).sum() / n) if n else 0.0,
+        "avg_trade_duration": (
+            float(durations[is_closed].mean()) if is_closed.any() else 0.0
+        ),
+        "profit_factor": (
+            float(gains / losses) if losses > 0 else float("inf") if gains > 0 else 0.0
+        ),
+    }
@@ -0,0 +1,153 @@
+from multiprocessing import Pool
+from typing import Optional
+
+import numpy as np
+
+from engine import trade_returns
+
+METHODS = ("shuffle", "bootstrap", "slippage")
+
+
+def resample(
+    returns: np.ndarray,
+    paths: int,
+    rng: np.random.Generator,
+    method: str = "shuffle",
+    block_size: int = 10,
+) -> np.ndarray:
+    # (paths, trades) matrix of per-trade returns
+    #  shuffle:   every path is a random permutation of the trades
+    #  bootstrap: moving-block bootstrap, keeps short runs of consecutive trades
+    #  slippage:  the original order (only the slippage is randomised)
+    n = len(returns)
+    if method == "shuffle":
+        return rng.permuted(np.broadcast_to(returns, (paths, n)), axis=1)
+    if method == "bootstrap" and n:
+        block_size = max(1, min(block_size, n))
+        blocks = -(-n // block_size)
+        starts = rng.integers(0, n - block_size + 1, size=(paths, blocks))
+        index = (starts[:, :, None] + np.arange(block_size)).reshape(paths, -1)
+        return returns[index[:, :n]]
+    if method in METHODS:
+        return np.array(np.broadcast_to(returns, (paths, n)))
+    raise ValueError(f"Unknown Monte Carlo method: {method}")
+
+
+def simulate_paths(
+    returns: np.ndarray,
+    paths: int,
+    rng: np.random.Generator,
+    method: str = "shuffle",
+    block_size: int = 10,
+    slippage: float = 0.0,
+    leverage: float = 1.0,
+    fraction: float = 1.0,
+    initial_capital: float = 100.0,
+) -> np.ndarray:
+    # Equity after each trade for every path, shape (paths, trades + 1). Each
+    # trade commits `fraction` of the current equity as margin, so gains and
+    # losses compound.
+    sampled = resample(returns, paths, rng, method, block_size)
+    if slippage:
+        # Adverse fill up to `slippage` (a price fraction) on entry and exit,
+        # amplified by leverage
+        sampled -= rng.uniform(0, 2 * slippage, sampled.shape) * leverage
+        np.maximum(sampled, -1.0, out=sampled)
+    growth = np.maximum(1 + fraction * sampled, 0)
+    equity = np.empty((paths, len(returns) + 1))
+    equity[:, 0] = initial_capital
+    np.cumprod(growth, axis=1, out=equity[:, 1:])
+    equity[:, 1:] *= initial_capital
+    return equity
+
+
+def _path_statistics(equity, ruin_level):
+    # The running peak starts at the (positive) initial capital, so the ratio
+    # is always defined
+    peak = np.maximum.accumulate(equity, axis=1)
+    np.divide(equity, peak, out=peak)
+    return {
+        "final_equity": equity[:, -1].copy(),
+        "max_drawdown": 1 - peak.min(axis=1),
+        "ruined": equity.min(axis=1) <= ruin_level,
+    }
+
+
+def _run_chunk(task):
+    returns, paths, seed, options, ruin_level, keep_paths = task
+    equity = simulate_paths(returns, paths, np.random.default_rng(seed), **options)
+    statistics = _path_statistics(equity, ruin_level)
+    if keep_paths:
+        statistics["equity"] = equity
+    return statistics
+
+
+def monte_carlo(
+    returns,
+    paths: int = 10_000,
+    method: str = "shuffle",
+    block_size: int = 10,
+    slippage: float = 0.0,
+    leverage: float = 1.0,
+    fraction: float = 1.0,
+    initial_capital: float = 100.0,
+    ruin_threshold: float = 0.5,
+    seed: Optional[int] = None,
+    processes: int = 1,
+    chunk_size: int = 2_000,
+    keep_paths: bool = False,
+) -> dict:
+    # Robustness of a trade sequence: resampled equity curves, their max
+    # drawdown, and the probability of equity falling to `ruin_threshold` of the
+    # starting capital. Paths are generated chunk by chunk (bounded memory), and
+    # the chunks can be spread over processes; results depend only on `seed`
+    # and `chunk_size`.
+    if method not in METHODS:
+        raise ValueError(f"Unknown Monte Carlo method: {method}")
+    if paths <= 0:
+        raise ValueError("Monte Carlo needs at least one path")
+    returns = np.asarray(returns, dtype=np.float64)
+    options = {
+        "method": method,
+        "block_size": block_size,
+        "slippage": slippage,
+        "leverage": leverage,
+        "fraction": fraction,
+        "initial_capital": initial_capital,
+    }
+    sizes = [min(chunk_size, paths - start) for start in range(0, paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    ruin_level = initial_capital * ruin_threshold
+    tasks = [
+        (returns, size, chunk_seed, options, ruin_level, keep_paths)
+        for size, chunk_seed in zip(sizes, seeds)
+    ]
+    if processes > 1 and len(tasks) > 1:
+        with Pool(min(processes, len(tasks))) as pool:
+            chunks = pool.map(_run_chunk, tasks)
+    else:
+        chunks = [_run_chunk(task) for task in tasks]
+
+    result = {
+        key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]
+    }
+    final_equity = result["final_equity"]
+    max_drawdown = result["max_drawdown"]
+    result["summary"] = {
+        "paths": paths,
+        "trades": len(returns),
+        "method": method,
+        "initial_capital": initial_capital,
+        "median_final_equity": float(np.median(final_equity)),
+        "final_equity_p5": float(np.percentile(final_equity, 5)),
+        "final_equity_p95": float(np.percentile(final_equity, 95)),
+        "median_max_drawdown": float(np.median(max_drawdown)),
+        "max_drawdown_p95": float(np.percentile(max_drawdown, 95)),
+        "ruin_probability": float(result["ruined"].mean()),
+    }
+    return result
+
+
+def monte_carlo_ledger(ledger, leverage: float, **kwargs) -> dict:
+    # Returns of the ledger's closed trades at `leverage`, then monte_carlo
+    return monte_carlo(trade_returns(ledger, leverage), leverage=leverage, **kwargs)
@@ -0,0 +1,562 @@
+import argparse
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from async_stream import Kline, KlineStreamClient
+from configs.config import ENDPOINTS, FUTURES, INTERVAL_MS
+from download_data import MAX_LIMIT, WeightLimiter, fetch_window, make_session
+from engine import LONG
+from helper import last_open_time, load_candles
+from recorder import rest_row
+from streaming import StreamingStrategy
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    # Fixed log-spaced buckets (in microseconds), so recording is O(log buckets)
+    # with constant memory however long the session runs. Percentiles are
+    # reported as the upper edge of their bucket.
+    def __init__(self, low_us=1.0, high_us=10_000_000.0, buckets_per_decade=20):
+        decades = math.log10(high_us / low_us)
+        count = int(math.ceil(decades * buckets_per_decade)) + 1
+        self.edges = np.geomspace(low_us, high_us, count).tolist()
+        # One extra bucket for samples above high_us
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def record(self, nanoseconds):
+        value = nanoseconds / 1000
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total_us += value
+        self.max_us = max(self.max_us, value)
+
+    def percentile(self, q) -> float:
+        if not self.count:
+            return math.nan
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.edges[bucket] if bucket < len(self.edges) else self.max_us
+        return self.max_us
+
+    def as_dict(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_us": self.total_us / self.count,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": self.max_us,
+        }
+
+    def buckets(self) -> pd.DataFrame:
+        # Non-empty buckets as (upper edge, count) rows
+        edges = self.edges + [math.inf]
+        return pd.DataFrame(
+            [(edge, count) for edge, count in zip(edges, self.counts) if count],
+            columns=["le_us", "count"],
+        )
+
+
+def candle_klines(symbol: str, interval: str, frame: pd.DataFrame) -> List[Kline]:
+    # Closed klines from stored candles (the process_data / load_candles layout)
+    open_time = pd.Series(frame["open_time"])
+    if pd.api.types.is_datetime64_any_dtype(open_time):
+        open_time = open_time.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    else:
+        open_time = open_time.to_numpy(dtype=np.int64)
+    interval_ms = INTERVAL_MS[interval]
+    columns = [
+        frame[name].to_numpy()
+        for name in (
+            "open",
+            "high",
+            "low",
+            "close",
+            "volume",
+            "quote_volume",
+            "count",
+            "taker_buy_volume",
+            "taker_buy_quote_volume",
+        )
+    ]
+    return [
+        Kline(
+            symbol,
+            interval,
+            int(t),
+            int(t) + interval_ms - 1,
+            float(o),
+            float(h),
+            float(l),
+            float(c),
+            float(v),
+            float(q),
+            int(n),
+            float(tv),
+            float(tq),
+            True,
+            int(t) + interval_ms,
+        )
+        for t, o, h, l, c, v, q, n, tv, tq in zip(open_time, *columns)
+    ]
+
+
+async def replay(klines: Dict[str, List[Kline]], speed: Optional[float] = None):
+    # Recorded klines of several symbols merged by close time and delivered as a
+    # live stream would, `speed` times faster than real time (None: as fast as
+    # possible). Each kline is stamped with its delivery time.
+    merged = heapq.merge(
+        *klines.values(), key=lambda kline: (kline.close_time, kline.symbol)
+    )
+    previous = None
+    delivered = 0
+    for kline in merged:
+        if speed and previous is not None and kline.close_time > previous:
+            await asyncio.sleep((kline.close_time - previous) / 1000 / speed)
+        elif delivered % 1000 == 0:
+            # Let other tasks run during an unthrottled replay
+            await asyncio.sleep(0)
+        previous = kline.close_time
+        delivered += 1
+        yield kline._replace(received_ns=time.perf_counter_ns())
+
+
+def replay_candles(
+    symbols: Iterable[str],
+    interval: str,
+    start=None,
+    end=None,
+    speed: Optional[float] = None,
+    data_directory: Optional[str] = None,
+):
+    # Replay of the candles on disk (e.g. written by recorder.CandleRecorder)
+    klines = {
+        symbol: candle_klines(
+            symbol,
+            interval,
+            load_candles(symbol, interval, start, end, data_directory=data_directory),
+        )
+        for symbol in symbols
+    }
+    return replay(klines, speed)
+
+
+class PaperTrader:
+    # Runs the BacktestStrategy rules forward on live (or replayed) closed klines
+    # with virtual positions. Every symbol has its own StreamingStrategy, warmed
+    # up from the candles on disk; positions draw `initial_margin` from a shared
+    # virtual `capital` (one margin per symbol by default) and an entry is
+    # skipped when it isn't available. Candles missing between the last one seen
+    # and a live kline (the end of the data on disk, or a reconnect) are fetched
+    # over REST and run first, like CandleRecorder does. Kline receive-to-
+    # decision latency goes into a histogram.
+    def __init__(
+        self,
+        symbols: Iterable[str],
+        interval: str,
+        tp_percent: float,
+        sl_percent: float,
+        leverage: float,
+        initial_margin: float,
+        capital: Optional[float] = None,
+        ema_window: int = 200,
+        macd_windows: Optional[Dict[str, int]] = None,
+        rsi_window: int = 14,
+        warm_up_candles: Optional[int] = 10_000,
+        data_directory: Optional[str] = None,
+        backfill: bool = True,
+        max_backfill: int = 10 * MAX_LIMIT,
+        base_url: Optional[str] = None,
+        limiter: Optional[WeightLimiter] = None,
+    ):
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.leverage = leverage
+        self.initial_margin = initial_margin
+        self.capital = (
+            capital if capital is not None else initial_margin * len(self.symbols)
+        )
+        self.cash = self.capital
+        self.warm_up_candles = warm_up_candles
+        self.data_directory = data_directory
+        self.backfill_enabled = backfill
+        self.max_backfill = max_backfill
+        self.url = (base_url or FUTURES["base_url"]) + ENDPOINTS[
+            "hitorical_candle_enpoint"
+        ]
+        self.limiter = limiter
+        self.session = None
+        self.backfilled = 0
+        self.strategies = {
+            symbol: StreamingStrategy(
+                tp_percent,
+                sl_percent,
+                leverage,
+                initial_margin,
+                ema_window,
+                macd_windows,
+                rsi_window,
+            )
+            for symbol in self.symbols
+        }
+        self.last_open_time: Dict[str, Optional[int]] = {
+            symbol: None for symbol in self.symbols
+        }
+        self.last_close: Dict[str, float] = {}
+        self.positions: Dict[str, dict] = {}
+        self.trades: List[dict] = []
+        self.skipped = 0
+        self.latency = LatencyHistogram()
+
+    def warm_up(self, until=None):
+        # Feed the last `warm_up_candles` stored candles before `until` (default:
+        # the end of the data on disk; None for all of them) through each
+        # strategy. Only that time span is read. Positions the rules would have
+        # opened during the history are dropped; trading starts flat.
+        end = None if until is None else pd.Timestamp(until)
+        span = pd.Timedelta(milliseconds=(self.warm_up_candles or 0) * self.interval_ms)
+        for symbol, strategy in self.strategies.items():
+            start = None
+            if self.warm_up_candles and end is not None:
+                start = end - span
+            elif self.warm_up_candles:
+                last = last_open_time(symbol, self.interval, self.data_directory)
+                if last is not None:
+                    start = pd.Timestamp(last + self.interval_ms, unit="ms") - span
+            history = load_candles(
+                symbol,
+                self.interval,
+                start,
+                end,
+                columns=["open_time", "close"],
+                data_directory=self.data_directory,
+            )
+            if self.warm_up_candles:
+                history = history.iloc[-self.warm_up_candles :]
+            strategy.warm_up(history["close"].to_numpy())
+            strategy.reset_position()
+            if len(history):
+                self.last_open_time[symbol] = int(
+                    history["open_time"].iloc[-1].value // 10**6
+                )
+                self.last_close[symbol] = float(history["close"].iloc[-1])
+            logger.info("Warmed up %s on %s candles", symbol, len(history))
+
+    def missing(self, kline: Kline):
+        # [start, end) open_time range between the last candle seen for the
+        # symbol and this kline, or None when it follows on directly
+        last = self.last_open_time.get(kline.symbol)
+        if not kline.closed or last is None:
+            return None
+        if kline.open_time <= last + self.interval_ms:
+            return None
+        return last + self.interval_ms, kline.open_time
+
+    def backfill(self, symbol: str, start_ms: int, end_ms: int) -> List[Kline]:
+        # The candles in [start_ms, end_ms) over REST, as closed klines
+        if end_ms - start_ms > self.max_backfill * self.interval_ms:
+            logger.warning(
+                "%s gap of %s candles, backfilling the last %s only",
+                symbol,
+                (end_ms - start_ms) // self.interval_ms,
+                self.max_backfill,
+            )
+            start_ms = end_ms - self.max_backfill * self.interval_ms
+        if self.session is None:
+            self.session = make_session(1)
+            self.limiter = self.limiter or WeightLimiter()
+        rows = fetch_window(
+            self.session,
+            self.url,
+            symbol,
+            self.interval,
+            (start_ms, end_ms - 1),
+            self.limiter,
+        )
+        klines = []
+        for row in rows:
+            (
+                open_time,
+                open_price,
+                high,
+                low,
+                close,
+                volume,
+                close_time,
+                quote_volume,
+                count,
+                taker_buy_volume,
+                taker_buy_quote_volume,
+                _,
+            ) = rest_row(row)
+            if not start_ms <= open_time < end_ms:
+                continue
+            klines.append(
+                Kline(
+                    symbol,
+                    self.interval,
+                    open_time,
+                    close_time,
+                    open_price,
+                    high,
+                    low,
+                    close,
+                    volume,
+                    quote_volume,
+                    count,
+                    taker_buy_volume,
+                    taker_buy_quote_volume,
+                    closed=True,
+                    event_time=close_time,
+                )
+            )
+        self.backfilled += len(klines)
+        logger.info(
+            "Backfilled %s %s candles for %s", len(klines), self.interval, symbol
+        )
+        return klines
+
+    def on_kline(self, kline: Kline) -> List[dict]:
+        # Decide on one kline; returns the trades it opened or closed
+        started = time.perf_counter_ns()
+        strategy = self.strategies.get(kline.symbol)
+        if strategy is None or not kline.closed:
+            return []
+        last = self.last_open_time[kline.symbol]
+        if last is not None and kline.open_time <= last:
+            # Already seen (warm-up overlap or a repeated message)
+            return []
+        if last is not None and kline.open_time > last + self.interval_ms:
+            logger.warning(
+                "%s missed %s candles before %s",
+                kline.symbol,
+                (kline.open_time - last) // self.interval_ms - 1,
+                kline.open_time,
+            )
+        self.last_open_time[kline.symbol] = kline.open_time
+        self.last_close[kline.symbol] = kline.close
+
+        changed = []
+        for signal in strategy.on_closed_kline(kline.close):
+            position = self.positions.get(kline.symbol)
+            if position is None:
+                if self.cash < self.initial_margin:
+                    # Not enough virtual capital: the strategy stays flat too
+                    self.skipped += 1
+                    strategy.reset_position()
+                    break
+                self.cash -= self.initial_margin
+                position = {
+                    "symbol": kline.symbol,
+                    "side": signal.side,
+                    "entry_index": signal.index,
+                    "entry_time": kline.open_time,
+                    "entry_price": signal.price,
+                    "exit_index": -1,
+                    "exit_time": -1,
+                    "exit_price": np.nan,
+                    "margin": self.initial_margin,
+                    "trade_result": np.nan,
+                    "pnl": np.nan,
+                    "liquidated": False,
+                }
+                self.positions[kline.symbol] = position
+                self.trades.append(position)
+                logger.info("%s %s at %s", kline.symbol, signal.side, signal.price)
+            else:
+                self._close(position, signal, kline)
+            changed.append(position)
+
+        received = kline.received_ns if kline.received_ns is not None else started
+        self.latency.record(time.perf_counter_ns() - received)
+        return changed
+
+    def _close(self, position, signal, kline):
+        del self.positions[kline.symbol]
+        position["exit_index"] = signal.index
+        position["exit_time"] = kline.open_time
+        position["exit_price"] = signal.price
+        if signal.action == "Liquidated":
+            position["liquidated"] = True
+            position["trade_result"] = -1.0
+        else:
+            # Real sign for both sides; isolated margin caps the loss
+            direction = 1 if position["side"] == LONG else -1
+            position["trade_result"] = max(
+                direction
+                * (signal.price - position["entry_price"])
+                / position["entry_price"]
+                * self.leverage,
+                -1.0,
+            )
+        position["pnl"] = position["margin"] * position["trade_result"]
+        self.cash += position["margin"] + position["pnl"]
+        logger.info(
+            "%s closed %s at %s, pnl %.2f",
+            kline.symbol,
+            position["side"],
+            signal.price,
+            position["pnl"],
+        )
+
+    async def run(self, source):
+        # Consume a KlineStreamClient consumer (anything with `await get()`) or an
+        # async iterator of klines such as replay(); ends with the iterator or
+        # when cancelled
+        if hasattr(source, "get"):
+            while True:
+                kline = await source.get()
+                # Live klines only; a replay runs exactly the stored candles
+                gap = self.missing(kline) if self.backfill_enabled else None
+                if gap:
+                    for missed in await asyncio.to_thread(
+                        self.backfill, kline.symbol, *gap
+                    ):
+                        self.on_kline(missed)
+                self.on_kline(kline)
+        async for kline in source:
+            self.on_kline(kline)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def equity(self) -> float:
+        # Cash plus open positions marked at the last close of their symbol
+        value = self.cash
+        for symbol, position in self.positions.items():
+            direction = 1 if position["side"] == LONG else -1
+            change = (
+                direction
+                * (self.last_close[symbol] - position["entry_price"])
+                / position["entry_price"]
+                * self.leverage
+            )
+            value += position["margin"] * max(1 + change, 0)
+        return value
+
+    def trades_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(
+            self.trades,
+            columns=[
+                "symbol",
+                "side",
+                "entry_index",
+                "entry_time",
+                "entry_price",
+                "exit_index",
+                "exit_time",
+                "exit_price",
+                "margin",
+                "trade_result",
+                "pnl",
+                "liquidated",
+            ],
+        )
+        frame["entry_time"] = pd.to_datetime(frame["entry_time"], unit="ms")
+        frame["exit_time"] = pd.to_datetime(
+            frame["exit_time"].where(frame["exit_index"] >= 0), unit="ms"
+        )
+        frame["liquidated"] = frame["liquidated"].astype(bool)
+        return frame
+
+    def summary(self) -> dict:
+        closed = [trade for trade in self.trades if trade["exit_index"] >= 0]
+        equity = self.equity()
+        return {
+            "symbols": len(self.symbols),
+            "capital": self.capital,
+            "equity": equity,
+            "return_percent": (equity / self.capital - 1) * 100,
+            "cash": self.cash,
+            "trades": len(self.trades),
+            "open_trades": len(self.positions),
+            "win_rate": (
+                sum(trade["pnl"] > 0 for trade in closed) / len(closed) * 100
+                if closed
+                else 0
+            ),
+            "liquidations": sum(trade["liquidated"] for trade in closed),
+            "skipped_entries": self.skipped,
+            "backfilled_candles": self.backfilled,
+            "latency": self.latency.as_dict(),
+        }
+
+
+async def _main(trader, args):
+    if args.replay_start:
+        # Warm up on the history before the replayed range, then replay it
+        trader.warm_up(until=args.replay_start)
+        await trader.run(
+            replay_candles(
+                trader.symbols,
+                trader.interval,
+                args.replay_start,
+                args.replay_end,
+                args.speed,
+            )
+        )
+        return
+    trader.warm_up()
+    client = KlineStreamClient.for_symbols(trader.symbols, trader.interval)
+    consumer = client.add_consumer(closed_only=True, policy="block")
+    try:
+        await asyncio.gather(client.run(), trader.run(consumer))
+    finally:
+        client.stop()
+        trader.close()
+
+
+if __name__ == "__main__":
+    # python paper_trading.py BTCUSDT ETHUSDT --interval 1m
+    # python paper_trading.py BTCUSDT --interval 15m --replay-start 2024-07-01 --speed 3600
+    parser = argparse.ArgumentParser(description="Paper trade the strategy live")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--tp-percent", type=float, default=5)
+    parser.add_argument("--sl-percent", type=float, default=2.5)
+    parser.add_argument("--leverage", type=float, default=5)
+    parser.add_argument("--initial-margin", type=float, default=100)
+    parser.add_argument("--capital", type=float, default=None)
+    parser.add_argument("--warm-up", type=int, default=10_000)
+    parser.add_argument("--replay-start", default=None)
+    parser.add_argument("--replay-end", default=None)
+    parser.add_argument("--speed", type=float, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    trader = PaperTrader(
+        args.symbols,
+        args.interval,
+        args.tp_percent,
+        args.sl_percent,
+        args.leverage,
+        args.initial_margin,
+        capital=args.capital,
+        warm_up_candles=args.warm_up,
+    )
+    try:
+        asyncio.run(_main(trader, args))
+    except KeyboardInterrupt:
+        pass
+    print(trader.trades_frame())
+    print(trader.summary())
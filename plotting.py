@@ -0,0 +1,213 @@
+import math
+import os
+from multiprocessing import Pool
+from typing import Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from engine import LONG, SHORT, SIDE_CODES
+from sweep import PARAMETERS, _init_local, combination_ledger, prepare_arrays
+
+# Points kept per line: about one min/max pair per horizontal pixel of the
+# default 14in figure at 100 dpi
+DEFAULT_WIDTH = 1400
+
+
+def decimate(values, width: int = DEFAULT_WIDTH) -> np.ndarray:
+    # Positions to draw so a line keeps its shape at `width` pixels: the first and
+    # last point plus the min and max of every bucket, in order. Short series are
+    # returned whole.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= 2 * width:
+        return np.arange(n)
+    size = math.ceil(n / width)
+    buckets = n // size
+    full = values[: buckets * size].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    # NaNs never win a bucket (unless the whole bucket is NaN)
+    lows = np.where(np.isnan(full), np.inf, full).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(full), -np.inf, full).argmax(axis=1) + offsets
+    keep = [[0], lows, highs, [n - 1]]
+    tail = values[buckets * size :]
+    if len(tail) and not np.isnan(tail).all():
+        keep += [
+            [buckets * size + np.nanargmin(tail)],
+            [buckets * size + np.nanargmax(tail)],
+        ]
+    return np.unique(np.concatenate(keep).astype(np.int64))
+
+
+def _line(ax, x, values, width, **kwargs):
+    keep = decimate(values, width)
+    ax.plot(x[keep], np.asarray(values)[keep], **kwargs)
+
+
+def _markers(ax, x, close, ledger):
+    # Entry and exit markers straight from the ledger. A trade counts as won when
+    # it moved in its direction (real sign for both sides); exits are drawn at
+    # their fill price.
+    side = ledger["side"]
+    entry = ledger["entry_index"]
+    for code, marker, label, color in (
+        (SIDE_CODES[LONG], "^", "Long Entry", "brown"),
+        (SIDE_CODES[SHORT], "v", "Short Entry", "purple"),
+    ):
+        rows = entry[side == code]
+        ax.scatter(x[rows], close[rows], color=color, marker=marker, label=label)
+
+    closed = ledger[ledger["exit_index"] >= 0]
+    won = closed["side"] * (closed["exit_price"] - closed["entry_price"]) > 0
+    lost = ~won
+    exit_x = x[closed["exit_index"]]
+    ax.scatter(
+        exit_x[lost],
+        closed["exit_price"][lost],
+        color="red",
+        marker="x",
+        label="Lost Trades",
+    )
+    for code, marker, label in (
+        (SIDE_CODES[LONG], "^", "Successful Long Trades"),
+        (SIDE_CODES[SHORT], "v", "Successful Short Trades"),
+    ):
+        rows = won & (closed["side"] == code)
+        ax.scatter(
+            exit_x[rows],
+            closed["exit_price"][rows],
+            color="blue",
+            marker=marker,
+            label=label,
+            edgecolor="black",  # Add an edge color for visibility
+        )
+    # Liquidations are rare, so annotating them one by one is cheap
+    liquidated = closed[closed["liquidated"]]
+    for position, price in zip(liquidated["exit_index"], liquidated["exit_price"]):
+        ax.text(
+            x[position],
+            price,
+            f"Liquidation {price:.2f}",
+            color="black",
+            fontsize=14,
+            verticalalignment="bottom",
+            horizontalalignment="left",
+        )
+
+
+def plot_backtest(
+    data,
+    ledger,
+    output: Optional[str] = None,
+    width: int = DEFAULT_WIDTH,
+    x=None,
+    title: Optional[str] = None,
+    dpi: int = 100,
+):
+    # Close/EMA with trades, MACD and RSI panels. `data` is a DataFrame (or dict
+    # of arrays) with close, EMA, MACD, Signal_Line and RSI; `x` defaults to its
+    # index. Every line is decimated to `width` points. With `output` the chart is
+    # rendered off-screen straight to the file (format from the extension) and
+    # the path is returned; otherwise a pyplot figure is returned for display.
+    close = np.asarray(data["close"], dtype=np.float64)
+    if x is None:
+        x = data.index if isinstance(data, pd.DataFrame) else np.arange(len(close))
+    x = np.asarray(x)
+
+    if output is None:
+        fig = plt.figure(figsize=(14, 10), dpi=dpi)
+    else:
+        # A bare Figure isn't registered with pyplot, so no GUI backend is
+        # involved and many charts can be rendered side by side
+        fig = Figure(figsize=(14, 10), dpi=dpi)
+    ax1, ax2, ax3 = fig.subplots(3, 1, sharex=True)
+    # First subplot: Close Price, EMA, Buy/Sell trades
+    _line(ax1, x, close, width, label="Close Price", color="green", alpha=0.7)
+    _line(ax1, x, data["EMA"], width, label="EMA", color="yellow")
+    if ledger is not None and len(ledger):
+        _markers(ax1, x, close, ledger)
+    ax1.set_ylabel("Price")
+    ax1.legend(loc="upper left")
+    ax1.set_title(title or "Close Price, EMA, and Trades")
+
+    # Second subplot: MACD and Signal Line
+    _line(ax2, x, data["MACD"], width, label="MACD", color="blue")
+    _line(ax2, x, data["Signal_Line"], width, label="MACD Signal", color="red")
+    ax2.axhline(y=0, color="gray", linestyle="--", label="0 Line")
+    ax2.set_ylabel("MACD")
+    ax2.legend(loc="upper left")
+    ax2.set_title("MACD and MACD Signal Line")
+
+    # Third subplot: RSI
+    _line(ax3, x, data["RSI"], width, label="RSI", color="orange", alpha=0.7)
+    ax3.axhline(y=70, color="red", linestyle="--", alpha=0.5)
+    ax3.axhline(y=30, color="green", linestyle="--", alpha=0.5)
+    ax3.set_ylabel("RSI")
+    ax3.set_xlabel("Time")
+    ax3.legend(loc="upper left")
+    ax3.set_title("RSI")
+
+    fig.tight_layout()
+    if output is None:
+        return fig
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(output)
+    return output
+
+
+def _params(row):
+    # Sweep rows back into run_sweep parameters; pandas turns a column mixing
+    # None and windows into floats with NaN
+    params = {}
+    for key in PARAMETERS:
+        value = row[key]
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            value = None
+        elif key in ("EMA_DAYS", "RSI_DAYS"):
+            value = int(value)
+        params[key] = value
+    return params
+
+
+def _render_one(task):
+    params, output, width = task
+    ledger, data = combination_ledger(params)
+    title = ", ".join(
+        f"{key}={params[key]}" for key in PARAMETERS if params[key] is not None
+    )
+    return plot_backtest(data, ledger, output, width, title=title)
+
+
+def render_sweep(
+    data: pd.DataFrame,
+    results: pd.DataFrame,
+    directory: str,
+    initial_margin: int = 100,
+    top: Optional[int] = None,
+    width: int = DEFAULT_WIDTH,
+    fmt: str = "png",
+    processes: Optional[int] = None,
+) -> list:
+    # One chart per run_sweep result row (the first `top` rows, i.e. the best
+    # ones), re-simulated and rendered on a process pool. Returns the file paths
+    # in row order.
+    rows = results if top is None else results.head(top)
+    tasks = [
+        (_params(row), os.path.join(directory, f"sweep-{rank:04d}.{fmt}"), width)
+        for rank, (_, row) in enumerate(rows.iterrows())
+    ]
+    os.makedirs(directory, exist_ok=True)
+    arrays = prepare_arrays(data)
+    processes = min(processes or os.cpu_count() or 1, max(len(tasks), 1))
+    if processes == 1:
+        _init_local(arrays, initial_margin, None)
+        return [_render_one(task) for task in tasks]
+    # Workers receive the trimmed arrays once, then only small tasks
+    with Pool(
+        processes, initializer=_init_local, initargs=(arrays, initial_margin, None)
+    ) as pool:
+        return pool.map(_render_one, tasks, chunksize=1)
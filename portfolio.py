@@ -0,0 +1,321 @@
+import heapq
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from engine import LONG, MAINTENANCE_MARGIN, SHORT, entry_signals, resolve_trade
+from helper import load_candles
+from indicators import IndicatorCache, ema, macd, rsi
+
+# Event kinds, ordered so exits at a timestamp release margin before entries use it
+EXIT = 0
+ENTRY = 1
+
+
+def _to_ms(values):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    return values.to_numpy(dtype=np.int64)
+
+
+class _SymbolState:
+    # Array-backed view of one symbol: trimmed candles, entry signals and a cursor
+    # into the entry candidates
+    def __init__(self, symbol, open_time, close, long_mask, short_mask):
+        self.symbol = symbol
+        self.open_time = open_time
+        self.close = close
+        self.long_mask = long_mask
+        self.candidates = np.flatnonzero(long_mask | short_mask)
+
+    def next_candidate(self, start):
+        k = np.searchsorted(self.candidates, start)
+        if k == len(self.candidates):
+            return -1
+        return self.candidates[k]
+
+
+class PortfolioBacktest:
+    # Several symbols on one merged open_time index sharing one pool of capital.
+    # Each symbol follows the BacktestStrategy entry/exit rules; an entry only
+    # opens when the pool still holds `initial_margin`, otherwise it is skipped.
+    def __init__(
+        self,
+        data: Dict[str, pd.DataFrame],
+        tp_percent: float,
+        sl_percent: float,
+        leverage: float,
+        initial_margin: float,
+        capital: float,
+        ema_window: int = 200,
+        macd_windows: Optional[Dict[str, int]] = None,
+        rsi_window: int = 14,
+        indicator_cache: Optional[IndicatorCache] = None,
+        interval: Optional[str] = None,
+    ):
+        self.tp_percent = tp_percent / 100  # Convert to decimal
+        self.sl_percent = sl_percent / 100  # Convert to decimal
+        self.leverage = leverage
+        self.initial_margin = initial_margin  # Margin allocated per trade
+        self.capital = capital  # Shared pool every trade draws its margin from
+        self.maintenance_margin = MAINTENANCE_MARGIN
+        macd_windows = macd_windows or {}
+        self.symbols = []
+        for symbol, frame in data.items():
+            self.symbols.append(
+                self._prepare(
+                    symbol,
+                    frame,
+                    ema_window,
+                    macd_windows,
+                    rsi_window,
+                    indicator_cache,
+                    interval,
+                )
+            )
+        self.trades = None
+        self.equity = None
+
+    @classmethod
+    def from_candles(
+        cls,
+        symbols: Iterable[str],
+        interval: str,
+        start=None,
+        end=None,
+        data_directory: Optional[str] = None,
+        **kwargs,
+    ):
+        data = {
+            symbol: load_candles(
+                symbol,
+                interval,
+                start,
+                end,
+                columns=["open_time", "close"],
+                data_directory=data_directory,
+            )
+            for symbol in symbols
+        }
+        return cls(data, interval=interval, **kwargs)
+
+    def _prepare(
+        self, symbol, frame, ema_window, macd_windows, rsi_window, cache, interval
+    ):
+        close = frame["close"].to_numpy(dtype=np.float64)
+        cache_args = {"cache": cache, "symbol": symbol, "interval": interval}
+        ema_values = ema(close, ema_window, **cache_args)
+        macd_values, signal_line = macd(
+            close,
+            window_fast=macd_windows.get("window_fast", 12),
+            window_slow=macd_windows.get("window_slow", 26),
+            window_sign=macd_windows.get("window_sign", 9),
+            **cache_args,
+        )
+        rsi_values = rsi(close, rsi_window, **cache_args)
+        # Same trimming as BacktestStrategy: drop warm-up rows, then the first
+        # remaining candle is never an entry
+        valid = ~(
+            np.isnan(close)
+            | np.isnan(ema_values)
+            | np.isnan(macd_values)
+            | np.isnan(signal_line)
+            | np.isnan(rsi_values)
+        )
+        long_mask, short_mask = entry_signals(
+            close[valid],
+            ema_values[valid],
+            macd_values[valid],
+            signal_line[valid],
+            rsi_values[valid],
+        )
+        long_mask[:1] = False
+        short_mask[:1] = False
+        return _SymbolState(
+            symbol,
+            _to_ms(frame["open_time"])[valid],
+            close[valid],
+            long_mask,
+            short_mask,
+        )
+
+    def _trade_return(self, buy_price, exit_price, side):
+        if side == LONG:
+            return (exit_price - buy_price) / buy_price * self.leverage
+        return (buy_price - exit_price) / buy_price * self.leverage
+
+    def run(self) -> dict:
+        cash = self.capital
+        events = []
+        for order, state in enumerate(self.symbols):
+            j = state.next_candidate(0)
+            if j >= 0:
+                events.append((state.open_time[j], ENTRY, order, j))
+        heapq.heapify(events)
+
+        trades = []
+        open_trades = {}
+        skipped = 0
+        max_open = 0
+        while events:
+            time, kind, order, index = heapq.heappop(events)
+            state = self.symbols[order]
+            if kind == EXIT:
+                trade = open_trades.pop(order)
+                trade["exit_index"] = index
+                trade["exit_time"] = time
+                trade["exit_price"] = state.close[index]
+                if trade["liquidated"]:
+                    trade["trade_result"] = -1.0
+                else:
+                    # Isolated margin: a position can't lose more than its margin
+                    trade["trade_result"] = max(
+                        self._trade_return(
+                            trade["entry_price"], trade["exit_price"], trade["side"]
+                        ),
+                        -1.0,
+                    )
+                trade["pnl"] = trade["margin"] * trade["trade_result"]
+                cash += trade["margin"] + trade["pnl"]
+                j = state.next_candidate(index + 1)
+                if j >= 0:
+                    heapq.heappush(events, (state.open_time[j], ENTRY, order, j))
+                continue
+
+            if cash < self.initial_margin:
+                skipped += 1
+                j = state.next_candidate(index + 1)
+                if j >= 0:
+                    heapq.heappush(events, (state.open_time[j], ENTRY, order, j))
+                continue
+
+            side = LONG if state.long_mask[index] else SHORT
+            exit_index, liquidated = resolve_trade(
+                state.close,
+                index,
+                side,
+                self.tp_percent,
+                self.sl_percent,
+                self.leverage,
+                self.initial_margin,
+                self.maintenance_margin,
+            )
+            cash -= self.initial_margin
+            trade = {
+                "order": order,
+                "symbol": state.symbol,
+                "side": side,
+                "entry_index": index,
+                "entry_time": time,
+                "entry_price": state.close[index],
+                "exit_index": -1,
+                "exit_time": -1,
+                "exit_price": np.nan,
+                "margin": self.initial_margin,
+                "trade_result": np.nan,
+                "pnl": np.nan,
+                "liquidated": liquidated,
+            }
+            trades.append(trade)
+            open_trades[order] = trade
+            max_open = max(max_open, len(open_trades))
+            # A trade still open at the end of the data simply stays open and
+            # is valued at the last close in the equity curve
+            if exit_index >= 0:
+                heapq.heappush(
+                    events, (state.open_time[exit_index], EXIT, order, exit_index)
+                )
+
+        self.trades = self._trades_frame(trades)
+        self.equity = self._equity_curve(trades)
+        closed = self.trades[self.trades["exit_index"] >= 0]
+        final_equity = (
+            float(self.equity["equity"].iloc[-1]) if len(self.equity) else cash
+        )
+        return {
+            "trades": self.trades,
+            "equity": self.equity,
+            "summary": {
+                "symbols": len(self.symbols),
+                "capital": self.capital,
+                "final_equity": final_equity,
+                "return_percent": (final_equity / self.capital - 1) * 100,
+                "cash": float(cash),
+                "trades": len(self.trades),
+                "open_trades": len(open_trades),
+                "win_rate": (
+                    float((closed["pnl"] > 0).mean() * 100) if len(closed) else 0
+                ),
+                "liquidations": int(self.trades["liquidated"].sum()),
+                "skipped_entries": skipped,
+                "max_open_trades": max_open,
+            },
+        }
+
+    def _trades_frame(self, trades):
+        columns = [
+            "symbol",
+            "side",
+            "entry_index",
+            "entry_time",
+            "entry_price",
+            "exit_index",
+            "exit_time",
+            "exit_price",
+            "margin",
+            "trade_result",
+            "pnl",
+            "liquidated",
+        ]
+        frame = pd.DataFrame(trades, columns=columns)
+        frame["entry_time"] = pd.to_datetime(frame["entry_time"], unit="ms")
+        frame["exit_time"] = pd.to_datetime(
+            frame["exit_time"].where(frame["exit_index"] >= 0), unit="ms"
+        )
+        frame["liquidated"] = frame["liquidated"].astype(bool)
+        return frame
+
+    def _equity_curve(self, trades):
+        # Mark-to-market on the merged index: cash from realised flows plus the
+        # value of every open position at each symbol's last known close
+        if not self.symbols:
+            return pd.DataFrame(columns=["open_time", "cash", "equity"])
+        times = np.unique(np.concatenate([state.open_time for state in self.symbols]))
+        flows = np.zeros(len(times), dtype=np.float64)
+        positions = np.zeros(len(times), dtype=np.float64)
+        closes = {}
+        for trade in trades:
+            order = trade["order"]
+            if order not in closes:
+                state = self.symbols[order]
+                # Forward-filled close of this symbol on the merged index
+                rows = np.searchsorted(state.open_time, times, side="right") - 1
+                closes[order] = np.where(
+                    rows >= 0, state.close[np.maximum(rows, 0)], np.nan
+                )
+            close = closes[order]
+            begin = np.searchsorted(times, trade["entry_time"])
+            flows[begin] -= trade["margin"]
+            if trade["exit_index"] >= 0:
+                end = np.searchsorted(times, trade["exit_time"])
+                flows[end] += trade["margin"] + trade["pnl"]
+            else:
+                end = len(times)
+            if end > begin:
+                value = trade["margin"] * (
+                    1
+                    + self._trade_return(
+                        trade["entry_price"], close[begin:end], trade["side"]
+                    )
+                )
+                positions[begin:end] += np.maximum(value, 0)
+        cash = self.capital + np.cumsum(flows)
+        return pd.DataFrame(
+            {
+                "open_time": pd.to_datetime(times, unit="ms"),
+                "cash": cash,
+                "equity": cash + positions,
+            }
+        )
@@ -0,0 +1,293 @@
+import asyncio
+import calendar
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from async_stream import Kline, KlineConsumer
+from candle_store import (
+    CANDLE_COLUMNS,
+    append_to_store,
+    csv_to_store,
+    is_store,
+    store_path,
+)
+from configs.config import ENDPOINTS, FUTURES, INTERVAL_MS
+from download_data import MAX_LIMIT, WeightLimiter, fetch_window, make_session
+from helper import find_candle_files, last_open_time
+from resample import can_derive, derived_directory, update_derived
+
+logger = logging.getLogger(__name__)
+
+COLUMN_NAMES = [name for name, _ in CANDLE_COLUMNS]
+
+
+def kline_row(kline: Kline) -> tuple:
+    # A closed websocket kline in the candle store column order
+    return (
+        kline.open_time,
+        kline.open,
+        kline.high,
+        kline.low,
+        kline.close,
+        kline.volume,
+        kline.close_time,
+        kline.quote_volume,
+        kline.count,
+        kline.taker_buy_volume,
+        kline.taker_buy_quote_volume,
+        0,
+    )
+
+
+def rest_row(row) -> tuple:
+    # A /fapi/v1/klines row (prices come back as strings)
+    return (
+        int(row[0]),
+        float(row[1]),
+        float(row[2]),
+        float(row[3]),
+        float(row[4]),
+        float(row[5]),
+        int(row[6]),
+        float(row[7]),
+        int(row[8]),
+        float(row[9]),
+        float(row[10]),
+        int(row[11]),
+    )
+
+
+class CandleRecorder:
+    # Persists closed klines into the monthly candle stores under data/<interval>/
+    # that load_candles and the backtester read. Klines are buffered per symbol
+    # and appended in batches: when a symbol has `batch_size` rows, when
+    # `max_buffered` rows are held in total, or `flush_interval` seconds after
+    # the last flush. A kline that doesn't follow the last recorded candle of
+    # its symbol triggers a REST backfill of the missing range first, so the
+    # store stays gap free and rows are never written twice. Intervals in
+    # `derive` are kept up to date from the recorded candles after every flush
+    # (see resample.update_derived).
+    def __init__(
+        self,
+        interval: str,
+        data_directory: Optional[str] = None,
+        batch_size: int = 500,
+        max_buffered: int = 10_000,
+        flush_interval: float = 60.0,
+        fsync: bool = True,
+        backfill: bool = True,
+        max_backfill: int = 10 * MAX_LIMIT,
+        base_url: Optional[str] = None,
+        limiter: Optional[WeightLimiter] = None,
+        derive: Iterable[str] = (),
+    ):
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"Unknown interval: {interval}")
+        self.derive = list(derive)
+        for derived in self.derive:
+            if not can_derive(derived, interval):
+                raise ValueError(f"Cannot derive {derived} candles from {interval}")
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.data_directory = data_directory or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data"
+        )
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.backfill_enabled = backfill
+        self.max_backfill = max_backfill
+        self.url = (base_url or FUTURES["base_url"]) + ENDPOINTS[
+            "hitorical_candle_enpoint"
+        ]
+        self.limiter = limiter
+        self.session = None
+        self.buffers: Dict[str, List[tuple]] = {}
+        self.buffered = 0
+        # open_time of the newest candle recorded (or buffered) per symbol
+        self.last_open_time: Dict[str, Optional[int]] = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+        self.recorded = 0
+        self.backfilled = 0
+        self.flushes = 0
+        self.derived = 0
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "backfilled": self.backfilled,
+            "flushes": self.flushes,
+            "buffered": self.buffered,
+            "derived": self.derived,
+        }
+
+    def _last(self, symbol):
+        if symbol not in self.last_open_time:
+            self.last_open_time[symbol] = last_open_time(
+                symbol, self.interval, self.data_directory
+            )
+        return self.last_open_time[symbol]
+
+    def missing(self, kline: Kline):
+        # [start, end) open_time range between the last recorded candle and this
+        # kline, or None when it follows on directly
+        last = self._last(kline.symbol)
+        if last is None or kline.open_time <= last + self.interval_ms:
+            return None
+        return last + self.interval_ms, kline.open_time
+
+    def backfill(self, symbol: str, start_ms: int, end_ms: int) -> int:
+        # Fetch the candles in [start_ms, end_ms) over REST into the buffer
+        if end_ms - start_ms > self.max_backfill * self.interval_ms:
+            logger.warning(
+                "%s gap of %s candles, backfilling the last %s only",
+                symbol,
+                (end_ms - start_ms) // self.interval_ms,
+                self.max_backfill,
+            )
+            start_ms = end_ms - self.max_backfill * self.interval_ms
+        if self.session is None:
+            self.session = make_session(1)
+            self.limiter = self.limiter or WeightLimiter()
+        rows = fetch_window(
+            self.session,
+            self.url,
+            symbol,
+            self.interval,
+            (start_ms, end_ms - 1),
+            self.limiter,
+        )
+        rows = [rest_row(row) for row in rows if start_ms <= int(row[0]) < end_ms]
+        logger.info("Backfilled %s %s candles for %s", len(rows), self.interval, symbol)
+        with self.lock:
+            added = self._buffer(symbol, rows)
+            self.backfilled += added
+            # Even if the exchange has no candles for part of the range, don't
+            # ask for it again on the next kline
+            self.last_open_time[symbol] = max(
+                self.last_open_time[symbol] or 0, end_ms - self.interval_ms
+            )
+        return added
+
+    def _buffer(self, symbol, rows):
+        last = self._last(symbol)
+        rows = [row for row in rows if last is None or row[0] > last]
+        if not rows:
+            return 0
+        self.buffers.setdefault(symbol, []).extend(rows)
+        self.buffered += len(rows)
+        self.last_open_time[symbol] = rows[-1][0]
+        if len(self.buffers[symbol]) >= self.batch_size:
+            self._flush_symbol(symbol)
+        if self.buffered >= self.max_buffered:
+            self.flush()
+        return len(rows)
+
+    def add(self, kline: Kline) -> bool:
+        # Buffer one kline without gap checks; only closed klines are recorded
+        if not kline.closed:
+            return False
+        with self.lock:
+            added = self._buffer(kline.symbol, [kline_row(kline)])
+            self.recorded += added
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        return bool(added)
+
+    def on_kline(self, kline: Kline) -> bool:
+        # Synchronous entry point (e.g. from WebSocketHandler): backfills inline
+        if not kline.closed:
+            return False
+        gap = self.missing(kline) if self.backfill_enabled else None
+        if gap:
+            self.backfill(kline.symbol, *gap)
+        return self.add(kline)
+
+    def _target(self, symbol, year, month):
+        # The store of that month, converting an existing CSV first so the
+        # recorded rows extend it instead of shadowing it
+        for file_year, file_month, path in find_candle_files(
+            symbol, self.interval, self.data_directory
+        ):
+            if (file_year, file_month) == (year, month):
+                if is_store(path):
+                    return path
+                return csv_to_store(path)
+        filename = f"{symbol}-{self.interval}-{year}-{calendar.month_name[month]}.csv"
+        return store_path(os.path.join(self.data_directory, self.interval, filename))
+
+    def _flush_symbol(self, symbol):
+        rows = self.buffers.pop(symbol, [])
+        if not rows:
+            return 0
+        self.buffered -= len(rows)
+        frame = pd.DataFrame(rows, columns=COLUMN_NAMES)
+        months = pd.to_datetime(frame["open_time"], unit="ms").dt.to_period("M")
+        for period, part in frame.groupby(months.to_numpy(), sort=True):
+            path = self._target(symbol, period.year, period.month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            append_to_store(path, part, fsync=self.fsync)
+        self.flushes += 1
+        for interval in self.derive:
+            self._derive(symbol, interval, len(rows))
+        return len(rows)
+
+    def _derive(self, symbol, interval, rows):
+        # An update after a flush only has to aggregate the buckets the new rows
+        # complete; more than that means derived months were rebuilt
+        existed = last_open_time(
+            symbol, interval, derived_directory(self.data_directory)
+        )
+        added = update_derived(symbol, interval, self.interval, self.data_directory)
+        self.derived += added
+        expected = rows * self.interval_ms // INTERVAL_MS[interval] + 1
+        if existed is not None and added > expected:
+            logger.warning(
+                "%s %s: flushing %s rows re-derived %s candles (expected at most %s)",
+                symbol,
+                interval,
+                rows,
+                added,
+                expected,
+            )
+
+    def flush(self) -> int:
+        with self.lock:
+            written = sum(self._flush_symbol(symbol) for symbol in list(self.buffers))
+            self.last_flush = time.monotonic()
+        return written
+
+    async def record(self, consumer: KlineConsumer):
+        # Drain a KlineStreamClient consumer (add it with closed_only=True) until
+        # cancelled. Backfills run in a worker thread so the event loop keeps
+        # serving the sockets, and idle periods still flush on time.
+        try:
+            while True:
+                try:
+                    kline = await asyncio.wait_for(
+                        consumer.get(), timeout=self.flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self.flush)
+                    continue
+                if not kline.closed:
+                    continue
+                gap = self.missing(kline) if self.backfill_enabled else None
+                if gap:
+                    await asyncio.to_thread(self.backfill, kline.symbol, *gap)
+                self.add(kline)
+        finally:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
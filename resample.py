@@ -0,0 +1,361 @@
+import calendar
+import json
+import logging
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from candle_store import (
+    CANDLE_COLUMNS,
+    append_to_store,
+    is_store,
+    modified_time,
+    store_path,
+)
+from configs.config import INTERVAL_MS
+from helper import find_candle_files, last_open_time, load_candles
+
+logger = logging.getLogger(__name__)
+
+BASE_INTERVAL = "1m"
+# Derived series are cached apart from the downloads, so a derived month never
+# shadows a downloaded file of the same interval
+DERIVED_DIRECTORY = "derived"
+# How each kline column combines over the candles of a bucket
+AGGREGATIONS = {
+    "open_time": "first",
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+    "close_time": "last",
+    "quote_volume": "sum",
+    "count": "sum",
+    "taker_buy_volume": "sum",
+    "taker_buy_quote_volume": "sum",
+    "ignore": "last",
+}
+# Binance weekly candles open on Monday 00:00 UTC; the epoch was a Thursday
+INTERVAL_OFFSET_MS = {"1w": 4 * INTERVAL_MS["1d"]}
+
+
+def can_derive(interval: str, base_interval: str = BASE_INTERVAL) -> bool:
+    return (
+        interval in INTERVAL_MS
+        and base_interval in INTERVAL_MS
+        and INTERVAL_MS[interval] > INTERVAL_MS[base_interval]
+        and INTERVAL_MS[interval] % INTERVAL_MS[base_interval] == 0
+    )
+
+
+def bucket_start(open_time, interval: str):
+    # Open time (ms) of the `interval` candle each open time falls into
+    open_time = np.asarray(open_time, dtype=np.int64)
+    size = INTERVAL_MS[interval]
+    offset = INTERVAL_OFFSET_MS.get(interval, 0)
+    return (open_time - offset) // size * size + offset
+
+
+def resample_arrays(arrays: dict, interval: str) -> dict:
+    # Aggregate sorted base candles (millisecond column arrays) into `interval`
+    # candles, one per bucket that has any rows. The close time is the bucket's
+    # end, as on the exchange, even when base candles are missing.
+    buckets = bucket_start(arrays["open_time"], interval)
+    if len(buckets) == 0:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in CANDLE_COLUMNS}
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    reducers = {
+        "first": lambda values: values[starts],
+        "last": lambda values: values[ends],
+        "max": lambda values: np.maximum.reduceat(values, starts),
+        "min": lambda values: np.minimum.reduceat(values, starts),
+        "sum": lambda values: np.add.reduceat(values, starts),
+    }
+    result = {}
+    for name, dtype in CANDLE_COLUMNS:
+        values = np.asarray(arrays[name], dtype=dtype)
+        result[name] = reducers[AGGREGATIONS[name]](values)
+    result["open_time"] = buckets[starts]
+    result["close_time"] = buckets[starts] + INTERVAL_MS[interval] - 1
+    return result
+
+
+def resample_candles(frame: pd.DataFrame, interval: str) -> pd.DataFrame:
+    # Same as resample_arrays for a candle DataFrame (millisecond or datetime
+    # open/close times); datetimes come back as datetimes
+    arrays = {}
+    for name, dtype in CANDLE_COLUMNS:
+        values = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype("datetime64[ms]").astype("int64")
+        arrays[name] = np.asarray(values, dtype=dtype)
+    result = pd.DataFrame(resample_arrays(arrays, interval))
+    for name in ("open_time", "close_time"):
+        if pd.api.types.is_datetime64_any_dtype(frame[name]):
+            result[name] = pd.to_datetime(result[name], unit="ms")
+    return result
+
+
+def _data_directory(data_directory):
+    return data_directory or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data"
+    )
+
+
+def derived_directory(data_directory: Optional[str] = None) -> str:
+    return os.path.join(_data_directory(data_directory), DERIVED_DIRECTORY)
+
+
+def _month_start_ms(year, month):
+    return pd.Timestamp(year=year, month=month, day=1).value // 1_000_000
+
+
+def _build_path(path):
+    # How far into the base candles a derived month was built, kept next to it:
+    # the base rows in [base_start, base_end) its candles were aggregated from
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _read_build(path):
+    try:
+        with open(_build_path(path)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _record_build(path, open_time, rows, interval, new):
+    build = None if new else _read_build(path)
+    build = build or {"base_start": int(open_time[0]), "base_rows": 0}
+    build["base_end"] = int(open_time[-1]) + INTERVAL_MS[interval]
+    build["base_rows"] += int(rows)
+    tmp_path = f"{_build_path(path)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(build, file)
+    os.replace(tmp_path, _build_path(path))
+
+
+def _remove_month(path):
+    if is_store(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+    if os.path.exists(_build_path(path)):
+        os.remove(_build_path(path))
+
+
+def _drop_stale_months(symbol, interval, base_interval, data_directory, directory):
+    # Remove the derived months whose base rows changed after they were built (a
+    # hole filled by a download or a backfill), and every month after the first
+    # of them, so the update rebuilds them. Rows appended after the last derived
+    # candle don't count: the update only derives the buckets after it. A
+    # derived month is only checked when a base file it was built from was
+    # modified since, and then by counting its base rows again.
+    derived = {
+        (year, month): path
+        for year, month, path in find_candle_files(symbol, interval, directory)
+    }
+    if not derived:
+        return
+    base_files = find_candle_files(symbol, base_interval, data_directory)
+    stale = None
+    for key in sorted(derived):
+        path = derived[key]
+        build = _read_build(path)
+        if build is None:
+            # Built before builds were recorded
+            stale = key
+            break
+        built_at = os.path.getmtime(_build_path(path))
+        changed = False
+        for year, month, base_path in base_files:
+            month_start = _month_start_ms(year, month)
+            month_end = _month_start_ms(year + month // 12, month % 12 + 1)
+            if month_start >= build["base_end"] or month_end <= build["base_start"]:
+                continue
+            changed = changed or modified_time(base_path) > built_at
+        if not changed:
+            continue
+        rows = len(
+            load_candles(
+                symbol,
+                base_interval,
+                start=pd.Timestamp(build["base_start"], unit="ms"),
+                end=pd.Timestamp(build["base_end"], unit="ms"),
+                columns=["open_time"],
+                data_directory=data_directory,
+            )
+        )
+        if rows != build["base_rows"]:
+            stale = key
+            break
+    # A whole base month added before the last derived candle has no derived
+    # month of its own to compare against
+    for year, month, _ in base_files:
+        if (year, month) > max(derived) or (stale and (year, month) >= stale):
+            break
+        first = pd.Timestamp(
+            int(bucket_start(_month_start_ms(year, month), interval)), unit="ms"
+        )
+        if not any(
+            (first.year, first.month) <= key <= (year, month) for key in derived
+        ):
+            stale = (first.year, first.month)
+            break
+    if stale is None:
+        return
+    for key, path in derived.items():
+        if key >= stale:
+            _remove_month(path)
+    logger.info("Rebuilding %s %s candles from %s-%02d", symbol, interval, *stale)
+
+
+def _bucket_rows(open_time, interval):
+    # Number of base rows in each bucket, in order
+    return np.unique(bucket_start(open_time, interval), return_counts=True)[1]
+
+
+def _append_months(symbol, interval, arrays, rows, directory):
+    # Append derived candles to the monthly stores of their open time, with the
+    # number of base rows behind each candle
+    frame = pd.DataFrame(arrays)
+    months = pd.to_datetime(frame["open_time"], unit="ms").dt.to_period("M")
+    for period, part in frame.groupby(months.to_numpy(), sort=True):
+        filename = (
+            f"{symbol}-{interval}-{period.year}-{calendar.month_name[period.month]}.csv"
+        )
+        path = store_path(os.path.join(directory, interval, filename))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new = not is_store(path)
+        append_to_store(path, part)
+        _record_build(
+            path,
+            part["open_time"].to_numpy(),
+            rows[part.index.to_numpy()].sum(),
+            interval,
+            new,
+        )
+
+
+def update_derived(
+    symbol: str,
+    interval: str,
+    base_interval: str = BASE_INTERVAL,
+    data_directory: Optional[str] = None,
+    chunksize: int = 1_000_000,
+) -> int:
+    # Bring the cached `interval` series of a symbol up to date with its base
+    # candles under data/<base_interval>/. Only base rows after the last derived
+    # candle are read, chunk by chunk, and a bucket is written once it is
+    # complete: a later base candle exists, or its last base candle is in. The
+    # still-forming bucket is picked up by the next update. Derived months whose
+    # base rows changed after they were built are rebuilt first. Returns the
+    # number of candles added.
+    if not can_derive(interval, base_interval):
+        raise ValueError(f"Cannot derive {interval} candles from {base_interval}")
+    data_directory = _data_directory(data_directory)
+    directory = derived_directory(data_directory)
+    _drop_stale_months(symbol, interval, base_interval, data_directory, directory)
+    last = last_open_time(symbol, interval, directory)
+    start = None
+    if last is not None:
+        start = pd.Timestamp(last + INTERVAL_MS[interval], unit="ms")
+    names = [name for name, _ in CANDLE_COLUMNS]
+    added = 0
+    carry = None
+    for chunk in load_candles(
+        symbol,
+        base_interval,
+        start=start,
+        columns=names,
+        chunksize=chunksize,
+        data_directory=data_directory,
+    ):
+        arrays = {name: chunk[name].to_numpy() for name in names}
+        for name in ("open_time", "close_time"):
+            arrays[name] = arrays[name].astype("datetime64[ms]").astype(np.int64)
+        if carry is not None:
+            arrays = {
+                name: np.concatenate([carry[name], arrays[name]]) for name in names
+            }
+        # Rows of the last bucket may continue in the next chunk
+        buckets = bucket_start(arrays["open_time"], interval)
+        split = int(np.searchsorted(buckets, buckets[-1]))
+        carry = {name: values[split:] for name, values in arrays.items()}
+        if split:
+            done = {name: values[:split] for name, values in arrays.items()}
+            candles = resample_arrays(done, interval)
+            _append_months(
+                symbol,
+                interval,
+                candles,
+                _bucket_rows(done["open_time"], interval),
+                directory,
+            )
+            added += len(candles["open_time"])
+    if carry is not None:
+        final = resample_arrays(carry, interval)
+        bucket_end = final["open_time"][0] + INTERVAL_MS[interval]
+        if carry["open_time"][-1] + INTERVAL_MS[base_interval] >= bucket_end:
+            _append_months(
+                symbol,
+                interval,
+                final,
+                np.array([len(carry["open_time"])]),
+                directory,
+            )
+            added += 1
+    if added:
+        logger.info("Derived %s %s candles for %s", added, interval, symbol)
+    return added
+
+
+def load_resampled(
+    symbol: str,
+    interval: str,
+    start=None,
+    end=None,
+    columns=None,
+    base_interval: str = BASE_INTERVAL,
+    data_directory: Optional[str] = None,
+) -> pd.DataFrame:
+    # load_candles for an interval derived from the base candles, updating the
+    # cache first
+    update_derived(symbol, interval, base_interval, data_directory)
+    return load_candles(
+        symbol,
+        interval,
+        start=start,
+        end=end,
+        columns=columns,
+        data_directory=derived_directory(data_directory),
+    )
+
+
+def derived_month(
+    symbol: str,
+    interval: str,
+    year: int,
+    month: int,
+    base_interval: str = BASE_INTERVAL,
+    data_directory: Optional[str] = None,
+) -> Optional[str]:
+    # Path of the derived store for one month, or None when there are no base
+    # candles to build it from
+    data_directory = _data_directory(data_directory)
+    if not can_derive(interval, base_interval) or not find_candle_files(
+        symbol, base_interval, data_directory
+    ):
+        return None
+    update_derived(symbol, interval, base_interval, data_directory)
+    for file_year, file_month, path in find_candle_files(
+        symbol, interval, derived_directory(data_directory)
+    ):
+        if (file_year, file_month) == (int(year), int(month)):
+            return path
+    return None
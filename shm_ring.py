@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from async_stream import Kline, KlineConsumer, KlineStreamClient
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "klines"
+VERSION = 1
+# Header slots (int64): layout version, capacity, candles started, writes
+HEADER = 8
+_VERSION, _CAPACITY, _HEAD, _WRITES = range(4)
+# One candle per slot; an in-progress kline overwrites its candle's slot until
+# the next candle opens
+RECORD_DTYPE = np.dtype(
+    [
+        ("index", np.int64),  # candle number since the ring was created
+        ("open_time", np.int64),
+        ("close_time", np.int64),
+        ("event_time", np.int64),
+        ("open", np.float64),
+        ("high", np.float64),
+        ("low", np.float64),
+        ("close", np.float64),
+        ("volume", np.float64),
+        ("quote_volume", np.float64),
+        ("count", np.int64),
+        ("taker_buy_volume", np.float64),
+        ("taker_buy_quote_volume", np.float64),
+        ("closed", np.bool_),
+    ]
+)
+
+
+def ring_name(symbol: str, interval: str, prefix: str = PREFIX) -> str:
+    return f"{prefix}_{symbol.upper()}_{interval}"
+
+
+# Rings created by this process; their tracker entry belongs to the owner
+_created = set()
+
+
+def _attach(name):
+    # Readers must not unlink the segment when they exit, which the resource
+    # tracker does for every segment a process opens before Python 3.13
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class KlineRing:
+    # Fixed-size ring of the latest candles of one symbol/interval in shared
+    # memory: one writer (the ingest process) and any number of readers in other
+    # processes, none of which take a lock. Every slot has a sequence number the
+    # writer makes odd while it writes the slot and even again once done (a
+    # seqlock), so a reader that copies a slot between two equal, even reads of
+    # it got a consistent candle and otherwise retries. The header's candle
+    # count is bumped after a new candle's slot is written. This relies on
+    # stores becoming visible in program order, as on x86-64.
+    def __init__(self, shm, owner: bool = False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER, dtype=np.int64, buffer=shm.buf)
+        if self.header[_VERSION] != VERSION:
+            raise ValueError(f"{shm.name} is not a version {VERSION} kline ring")
+        self.capacity = int(self.header[_CAPACITY])
+        self.seqs = np.ndarray(
+            self.capacity, dtype=np.int64, buffer=shm.buf, offset=HEADER * 8
+        )
+        self.records = np.ndarray(
+            self.capacity,
+            dtype=RECORD_DTYPE,
+            buffer=shm.buf,
+            offset=(HEADER + self.capacity) * 8,
+        )
+
+    @classmethod
+    def create(
+        cls, symbol: str, interval: str, capacity: int = 4096, prefix: str = PREFIX
+    ) -> "KlineRing":
+        size = (HEADER + capacity) * 8 + capacity * RECORD_DTYPE.itemsize
+        name = ring_name(symbol, interval, prefix)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by an ingest process that didn't shut down cleanly
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(name)
+        header = np.ndarray(HEADER, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_VERSION] = VERSION
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, symbol: str, interval: str, prefix: str = PREFIX) -> "KlineRing":
+        return cls(_attach(ring_name(symbol, interval, prefix)))
+
+    @property
+    def head(self) -> int:
+        # Number of candles written so far; the newest is head - 1
+        return int(self.header[_HEAD])
+
+    @property
+    def writes(self) -> int:
+        return int(self.header[_WRITES])
+
+    def publish(self, kline: Kline):
+        # Writer side: update the current candle or start the next one
+        head = self.head
+        slot = (head - 1) % self.capacity
+        new = head == 0 or self.records[slot]["open_time"] != kline.open_time
+        if new:
+            slot = head % self.capacity
+        index = head if new else head - 1
+        self.seqs[slot] += 1
+        self.records[slot] = (
+            index,
+            kline.open_time,
+            kline.close_time,
+            kline.event_time,
+            kline.open,
+            kline.high,
+            kline.low,
+            kline.close,
+            kline.volume,
+            kline.quote_volume,
+            kline.count,
+            kline.taker_buy_volume,
+            kline.taker_buy_quote_volume,
+            kline.closed,
+        )
+        self.seqs[slot] += 1
+        if new:
+            self.header[_HEAD] = head + 1
+        self.header[_WRITES] += 1
+
+    def read(self, index: int, timeout: float = 1.0):
+        # Candle `index` as a consistent record copy, or None once it has been
+        # overwritten (or doesn't exist yet)
+        slot = index % self.capacity
+        deadline = None
+        while self.head - self.capacity <= index < self.head:
+            before = self.seqs[slot]
+            record = self.records[slot].copy()
+            if before % 2 == 0 and self.seqs[slot] == before:
+                return record if record["index"] == index else None
+            # The writer is inside this slot; let it finish
+            deadline = deadline or time.monotonic() + timeout
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Candle {index} stayed mid-write for {timeout}s")
+            time.sleep(0)
+        return None
+
+    def latest(self):
+        # Newest candle, closed or still forming
+        head = self.head
+        while head:
+            record = self.read(head - 1)
+            if record is not None:
+                return record
+            head = self.head
+        return None
+
+    def since(self, cursor: int = 0, closed_only: bool = True):
+        # Candles from number `cursor` on that are still in the ring, as a record
+        # array, and the cursor to pass next time. With closed_only the forming
+        # newest candle is left for a later call. Candles overwritten before they were
+        # read are skipped (see the index field).
+        head = self.head
+        first = max(cursor, head - self.capacity)
+        if first >= head:
+            return np.empty(0, dtype=RECORD_DTYPE), max(cursor, head)
+        slots = np.arange(first, head) % self.capacity
+        before = self.seqs[slots]
+        records = self.records[slots]
+        after = self.seqs[slots]
+        expected = np.arange(first, head)
+        torn = (before != after) | (before % 2 == 1) | (records["index"] != expected)
+        for position in np.flatnonzero(torn):
+            record = self.read(int(expected[position]))
+            if record is not None:
+                records[position] = record
+                torn[position] = False
+        # Lost to the writer lapping the reader
+        records = records[~torn]
+        if closed_only:
+            # A candle is over once the next one opened, even if its closing
+            # kline never arrived; only the newest can still be forming
+            records = records[(records["index"] < head - 1) | records["closed"]]
+        next_cursor = int(records["index"][-1]) + 1 if len(records) else first
+        return records, next_cursor
+
+    def close(self):
+        self.header = self.seqs = self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            _created.discard(self.shm.name.lstrip("/"))
+
+
+class RingPublisher:
+    # Ingest side: one ring per symbol, created on the first kline of a symbol
+    # (or up front), fed from WebSocketHandler or a KlineStreamClient consumer
+    def __init__(
+        self,
+        symbols: Optional[Iterable[str]] = None,
+        interval: str = "1m",
+        capacity: int = 4096,
+        prefix: str = PREFIX,
+    ):
+        self.interval = interval
+        self.capacity = capacity
+        self.prefix = prefix
+        self.rings: Dict[str, KlineRing] = {}
+        for symbol in symbols or []:
+            self._ring(symbol.upper())
+
+    def _ring(self, symbol):
+        ring = self.rings.get(symbol)
+        if ring is None:
+            ring = KlineRing.create(symbol, self.interval, self.capacity, self.prefix)
+            self.rings[symbol] = ring
+            logger.info(
+                "Publishing %s %s klines to %s", symbol, self.interval, ring.shm.name
+            )
+        return ring
+
+    def publish(self, kline: Kline):
+        if kline.interval != self.interval:
+            return
+        self._ring(kline.symbol).publish(kline)
+
+    async def run(self, consumer: KlineConsumer):
+        # Drain a KlineStreamClient consumer until cancelled
+        while True:
+            self.publish(await consumer.get())
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings.clear()
+
+
+async def _ingest(symbols, interval, capacity, prefix):
+    client = KlineStreamClient.for_symbols(symbols, interval=interval)
+    consumer = client.add_consumer(maxsize=10_000)
+    publisher = RingPublisher(symbols, interval, capacity, prefix)
+    try:
+        await asyncio.gather(client.run(), publisher.run(consumer))
+    finally:
+        client.stop()
+        publisher.close()
+
+
+if __name__ == "__main__":
+    # python shm_ring.py BTCUSDT ETHUSDT --interval 1m
+    parser = argparse.ArgumentParser(
+        description="Publish live klines to shared-memory rings"
+    )
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--prefix", default=PREFIX)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        asyncio.run(
+            _ingest(
+                [symbol.upper() for symbol in args.symbols],
+                args.interval,
+                args.capacity,
+                args.prefix,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,234 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    MAINTENANCE_MARGIN,
+    entry_signals,
+    simulate,
+    total_profit_loss,
+    trade_returns,
+    win_rate,
+)
+from indicators import IndicatorCache, ema, macd, rsi
+
+# Indicator functions a strategy can declare by name. macd returns the MACD and
+# signal lines together.
+INDICATORS = {"ema": ema, "macd": macd, "rsi": rsi}
+
+
+class Dataset:
+    # One load of candles. Indicators are computed on first use and shared by
+    # every strategy evaluated on it (and memoized in the indicator cache).
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        cache: Optional[IndicatorCache] = None,
+        symbol: Optional[str] = None,
+        interval: Optional[str] = None,
+    ):
+        self.data = data
+        self.close = data["close"].to_numpy(dtype=np.float64)
+        self.cache = cache
+        self.symbol = symbol
+        self.interval = interval
+        self._values = {}
+
+    def __len__(self):
+        return len(self.close)
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._values:
+            self._values[name] = self.data[name].to_numpy(dtype=np.float64)
+        return self._values[name]
+
+    def indicator(self, name: str, *params):
+        key = (name, params)
+        if key not in self._values:
+            if name not in INDICATORS:
+                raise ValueError(f"Unknown indicator: {name}")
+            self._values[key] = INDICATORS[name](
+                self.close,
+                *params,
+                cache=self.cache,
+                symbol=self.symbol,
+                interval=self.interval,
+            )
+        return self._values[key]
+
+
+class Strategy(ABC):
+    # A strategy declares the indicators it needs as {name: (indicator, *params)}
+    # and turns them into entry (and optionally exit) masks with array
+    # expressions. The engine evaluates the masks once over the whole dataset.
+    name = "strategy"
+    indicators: Dict[str, tuple] = {}
+
+    @abstractmethod
+    def entries(self, close, values):
+        # (long_mask, short_mask) over the candles
+        ...
+
+    def exits(self, close, values):
+        # No exit signal: trades only close on TP/SL or liquidation
+        return None
+
+    def signals(self, dataset: Dataset):
+        values = {
+            name: dataset.indicator(*spec) for name, spec in self.indicators.items()
+        }
+        long_mask, short_mask = self.entries(dataset.close, values)
+        exit_mask = self.exits(dataset.close, values)
+        # Like dropna() in BacktestStrategy: start after the warm-up rows of every
+        # declared indicator, skipping the first complete candle
+        warm_up = 0
+        for value in values.values():
+            for series in value if isinstance(value, tuple) else (value,):
+                valid = np.flatnonzero(~np.isnan(series))
+                warm_up = max(warm_up, valid[0] if len(valid) else len(series))
+        return (
+            np.asarray(long_mask, dtype=bool),
+            np.asarray(short_mask, dtype=bool),
+            exit_mask if exit_mask is None else np.asarray(exit_mask, dtype=bool),
+            warm_up + 1,
+        )
+
+
+class MacdEmaRsiStrategy(Strategy):
+    # The rules hard-wired into BacktestStrategy.run_backtest
+    def __init__(
+        self,
+        ema_window: int = 200,
+        macd_windows: Optional[Dict[str, int]] = None,
+        rsi_window: int = 14,
+        oversold: float = 30,
+        overbought: float = 70,
+        name: Optional[str] = None,
+    ):
+        macd_windows = macd_windows or {}
+        self.indicators = {
+            "EMA": ("ema", ema_window),
+            "MACD": (
+                "macd",
+                macd_windows.get("window_fast", 12),
+                macd_windows.get("window_slow", 26),
+                macd_windows.get("window_sign", 9),
+            ),
+            "RSI": ("rsi", rsi_window),
+        }
+        self.oversold = oversold
+        self.overbought = overbought
+        self.name = name or (
+            f"macd_ema_rsi(ema={ema_window}, rsi={rsi_window}, "
+            f"{oversold}/{overbought})"
+        )
+
+    def entries(self, close, values):
+        macd_values, signal_line = values["MACD"]
+        return entry_signals(
+            close,
+            values["EMA"],
+            macd_values,
+            signal_line,
+            values["RSI"],
+            self.oversold,
+            self.overbought,
+        )
+
+
+class RuleStrategy(Strategy):
+    # Ad-hoc variant from plain functions: long/short/exit take (close, values)
+    # and return boolean arrays
+    def __init__(
+        self,
+        name: str,
+        indicators: Dict[str, tuple],
+        long: Optional[Callable] = None,
+        short: Optional[Callable] = None,
+        exit: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.indicators = indicators
+        self.long = long
+        self.short = short
+        self.exit = exit
+
+    def entries(self, close, values):
+        no_signal = np.zeros(len(close), dtype=bool)
+        return (
+            self.long(close, values) if self.long else no_signal,
+            self.short(close, values) if self.short else no_signal,
+        )
+
+    def exits(self, close, values):
+        return self.exit(close, values) if self.exit else None
+
+
+def run_strategy(
+    dataset: Dataset,
+    strategy: Strategy,
+    tp_percent: float,
+    sl_percent: float,
+    leverage: float,
+    initial_margin: float,
+    verbose: bool = False,
+) -> np.ndarray:
+    long_mask, short_mask, exit_mask, start = strategy.signals(dataset)
+    return simulate(
+        dataset.close,
+        long_mask,
+        short_mask,
+        tp_percent / 100,
+        sl_percent / 100,
+        leverage,
+        initial_margin,
+        MAINTENANCE_MARGIN,
+        start=start,
+        verbose=verbose,
+        exit_mask=exit_mask,
+    )
+
+
+def evaluate_strategies(
+    data,
+    strategies: Iterable[Strategy],
+    tp_percent: float,
+    sl_percent: float,
+    leverage: float,
+    initial_margin: float,
+    cache: Optional[IndicatorCache] = None,
+    symbol: Optional[str] = None,
+    interval: Optional[str] = None,
+) -> pd.DataFrame:
+    # Many rule variants over one load of candles, best first: indicators shared
+    # by several strategies are computed once. Trades are scored by their real
+    # return (engine.trade_returns), not the legacy trade_result whose sign is
+    # flipped for shorts.
+    dataset = (
+        data if isinstance(data, Dataset) else Dataset(data, cache, symbol, interval)
+    )
+    rows = []
+    for strategy in strategies:
+        ledger = run_strategy(
+            dataset, strategy, tp_percent, sl_percent, leverage, initial_margin
+        )
+        returns = trade_returns(ledger, leverage)
+        liquidated = ledger["liquidated"][ledger["exit_index"] >= 0]
+        rows.append(
+            {
+                "strategy": strategy.name,
+                "trades": len(returns),
+                "win_rate": win_rate(returns),
+                "total_profit_loss": total_profit_loss(
+                    returns, liquidated, initial_margin
+                ),
+            }
+        )
+    results = pd.DataFrame(
+        rows, columns=["strategy", "trades", "win_rate", "total_profit_loss"]
+    )
+    return results.sort_values(
+        ["total_profit_loss", "win_rate"], ascending=False, kind="stable"
+    ).reset_index(drop=True)
@@ -0,0 +1,228 @@
+import math
+import time
+from collections import deque, namedtuple
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from engine import (
+    LONG,
+    MAINTENANCE_MARGIN,
+    SHORT,
+    _exit_hit,
+    entry_signals,
+    liquidation_price,
+    trade_levels,
+)
+
+NAN = float("nan")
+
+# One decision taken on a closed candle. index counts candles from the first one
+# with every indicator warmed up, like the row index after dropna() in the batch
+# backtest.
+Signal = namedtuple("Signal", ["index", "action", "side", "price", "trade_result"])
+
+
+class EWM:
+    # Same recursion as pandas' ewm(adjust=False).mean(), which `ta` uses, step by
+    # step so the streaming values match the batch ones bit for bit
+    def __init__(self, span=None, alpha=None, min_periods=0):
+        com = (span - 1) / 2 if span is not None else (1 - alpha) / alpha
+        self.alpha = 1.0 / (1.0 + com)
+        self.old_wt_factor = 1.0 - self.alpha
+        self.min_periods = max(min_periods, 1)
+        self.weighted = NAN
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, value):
+        is_observation = value == value
+        self.nobs += is_observation
+        weighted = self.weighted
+        if weighted == weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if weighted != value:
+                    weighted = self.old_wt * weighted + self.alpha * value
+                    weighted /= self.old_wt + self.alpha
+                    self.weighted = weighted
+                self.old_wt = 1.0
+        elif is_observation:
+            self.weighted = weighted = value
+        return weighted if self.nobs >= self.min_periods else NAN
+
+
+class IncrementalEMA:
+    def __init__(self, window: int = 200):
+        self.ewm = EWM(span=window, min_periods=window)
+
+    def update(self, close):
+        return self.ewm.update(close)
+
+
+class IncrementalMACD:
+    def __init__(self, window_fast: int = 12, window_slow: int = 26, window_sign=9):
+        self.fast = EWM(span=window_fast, min_periods=window_fast)
+        self.slow = EWM(span=window_slow, min_periods=window_slow)
+        self.signal = EWM(span=window_sign, min_periods=window_sign)
+
+    def update(self, close):
+        macd = self.fast.update(close) - self.slow.update(close)
+        return macd, self.signal.update(macd)
+
+
+class IncrementalRSI:
+    # Wilder smoothing (alpha = 1 / window) of gains and losses
+    def __init__(self, window: int = 14):
+        self.up = EWM(alpha=1 / window, min_periods=window)
+        self.down = EWM(alpha=1 / window, min_periods=window)
+        self.previous = None
+
+    def update(self, close):
+        diff = NAN if self.previous is None else close - self.previous
+        self.previous = close
+        # Like diff.where(...): the missing first difference counts as no move
+        up = diff if diff > 0 else 0.0
+        down = -(diff if diff < 0 else 0.0)
+        emaup = self.up.update(up)
+        emadn = self.down.update(down)
+        if emadn == 0:
+            return 100.0
+        if math.isnan(emaup) or math.isnan(emadn):
+            return NAN
+        return 100 - (100 / (1 + emaup / emadn))
+
+
+class StreamingStrategy:
+    # Online version of BacktestStrategy: O(1) indicator updates per closed candle
+    # and the same entry, TP/SL and liquidation rules as engine.simulate
+    def __init__(
+        self,
+        tp_percent: float,
+        sl_percent: float,
+        leverage: float,
+        initial_margin: float,
+        ema_window: int = 200,
+        macd_windows: Optional[Dict[str, int]] = None,
+        rsi_window: int = 14,
+        latency_samples: int = 100_000,
+    ):
+        self.tp_percent = tp_percent / 100  # Convert to decimal
+        self.sl_percent = sl_percent / 100  # Convert to decimal
+        self.leverage = leverage
+        self.initial_margin = initial_margin
+        self.maintenance_margin = MAINTENANCE_MARGIN
+        macd_windows = macd_windows or {}
+        self.ema = IncrementalEMA(ema_window)
+        self.macd = IncrementalMACD(
+            macd_windows.get("window_fast", 12),
+            macd_windows.get("window_slow", 26),
+            macd_windows.get("window_sign", 9),
+        )
+        self.rsi = IncrementalRSI(rsi_window)
+        self.index = -1  # candles seen since warm-up
+        self.buy_price = None
+        self.side = None
+        self.take_profit_price = None
+        self.stop_loss_price = None
+        self.indicators = (NAN, NAN, NAN, NAN)
+        self.latencies_ns = deque(maxlen=latency_samples)
+
+    def warm_up(self, closes):
+        # Feed history without collecting latency samples
+        signals = []
+        for close in closes:
+            signals += self._update(float(close))
+        return signals
+
+    def reset_position(self):
+        # Forget the open position (e.g. one opened while warming up, or an
+        # entry the caller didn't take); indicators are kept
+        self.buy_price = None
+        self.side = None
+        self.take_profit_price = None
+        self.stop_loss_price = None
+
+    def on_closed_kline(self, close) -> List[Signal]:
+        started = time.perf_counter_ns()
+        signals = self._update(float(close))
+        self.latencies_ns.append(time.perf_counter_ns() - started)
+        return signals
+
+    def _update(self, close) -> List[Signal]:
+        ema = self.ema.update(close)
+        macd, signal_line = self.macd.update(close)
+        rsi = self.rsi.update(close)
+        self.indicators = (ema, macd, signal_line, rsi)
+        if ema != ema or macd != macd or signal_line != signal_line or rsi != rsi:
+            return []
+        self.index += 1
+        # The batch loop starts at the second row left after dropna()
+        if self.index == 0:
+            return []
+
+        signals = []
+        if self.buy_price is None:
+            is_long, is_short = entry_signals(close, ema, macd, signal_line, rsi)
+            if is_long or is_short:
+                signals += self._enter(close, LONG if is_long else SHORT)
+                if self.buy_price is None:
+                    return signals
+                entry_candle = True
+            else:
+                return signals
+        else:
+            entry_candle = False
+
+        if _exit_hit(close, self.side, self.take_profit_price, self.stop_loss_price):
+            # Mirrors the batch result formula: the short formula only applies
+            # when the trade is closed on its entry candle
+            if self.side == SHORT and entry_candle:
+                trade_result = (self.buy_price - close) / self.buy_price * self.leverage
+            else:
+                trade_result = (close - self.buy_price) / self.buy_price * self.leverage
+            signals.append(
+                Signal(
+                    self.index,
+                    "buy" if self.side == SHORT else "sell",
+                    self.side,
+                    close,
+                    trade_result,
+                )
+            )
+            self.buy_price = None
+            self.take_profit_price = None
+            self.stop_loss_price = None
+        return signals
+
+    def _enter(self, close, side) -> List[Signal]:
+        self.buy_price = close
+        self.side = side
+        self.take_profit_price, self.stop_loss_price = trade_levels(
+            close, side, self.tp_percent, self.sl_percent, self.leverage
+        )
+        signals = [
+            Signal(self.index, "buy" if side == LONG else "sell", side, close, 0.0)
+        ]
+        # Liquidation is only evaluated on the entry candle, as in the batch loop
+        liq_price = liquidation_price(
+            close, side, self.leverage, self.initial_margin, self.maintenance_margin
+        )
+        if (side == LONG and close <= liq_price) or (
+            side == SHORT and close >= liq_price
+        ):
+            signals.append(Signal(self.index, "Liquidated", side, close, 0.0))
+            self.buy_price = None
+        return signals
+
+    def latency_stats(self) -> Dict[str, float]:
+        if not self.latencies_ns:
+            return {"count": 0}
+        samples = np.fromiter(self.latencies_ns, dtype=np.int64) / 1000
+        return {
+            "count": len(samples),
+            "mean_us": float(samples.mean()),
+            "p50_us": float(np.percentile(samples, 50)),
+            "p99_us": float(np.percentile(samples, 99)),
+            "max_us": float(samples.max()),
+        }
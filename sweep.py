@@ -0,0 +1,201 @@
+import os
+from itertools import product
+from multiprocessing import Pool, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    MAINTENANCE_MARGIN,
+    entry_signals,
+    simulate,
+    win_rate,
+    total_profit_loss,
+)
+from indicators import ema, macd, rsi
+from metrics import METRICS, bars_per_year, risk_metrics
+
+# Columns shared with the workers. OHLCV plus the default indicators that
+# BacktestStrategy.__init__ computes, already trimmed the same way (dropna).
+SHARED_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "EMA",
+    "MACD",
+    "Signal_Line",
+    "RSI",
+]
+PARAMETERS = [
+    "tp_percent",
+    "sl_percent",
+    "leverage",
+    "EMA_DAYS",
+    "MACD_DAYS",
+    "RSI_DAYS",
+]
+
+# Per-process views onto the shared block, set by _init_worker
+_shared = {}
+
+
+def expand_grid(grid: Dict[str, list]) -> List[dict]:
+    unknown = set(grid) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    keys = list(grid)
+    combinations = []
+    for values in product(*(grid[key] for key in keys)):
+        params = {"EMA_DAYS": None, "MACD_DAYS": None, "RSI_DAYS": None}
+        params.update(zip(keys, values))
+        combinations.append(params)
+    return combinations
+
+
+def prepare_arrays(data: pd.DataFrame) -> np.ndarray:
+    # Mirror BacktestStrategy.__init__: default indicators on the full history,
+    # then drop every row that has a NaN anywhere
+    frame = data.copy()
+    close = frame["close"]
+    frame["EMA"] = ema(close, 200)
+    frame["MACD"], frame["Signal_Line"] = macd(close)
+    frame["RSI"] = rsi(close, 14)
+    frame.dropna(inplace=True)
+    return np.ascontiguousarray(frame[SHARED_COLUMNS].to_numpy(dtype=np.float64).T)
+
+
+def _init_worker(name, shape, initial_margin, periods_per_year):
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _shared["shm"] = shm
+    _shared["initial_margin"] = initial_margin
+    _shared["periods_per_year"] = periods_per_year
+    for column, values in zip(SHARED_COLUMNS, arrays):
+        _shared[column] = values
+
+
+def _init_local(arrays, initial_margin, periods_per_year):
+    _shared.clear()
+    _shared["initial_margin"] = initial_margin
+    _shared["periods_per_year"] = periods_per_year
+    for column, values in zip(SHARED_COLUMNS, arrays):
+        _shared[column] = values
+
+
+def _indicators(params):
+    ema_values = _shared["EMA"]
+    macd_values = _shared["MACD"]
+    signal_line = _shared["Signal_Line"]
+    rsi_values = _shared["RSI"]
+    # Same rules as BacktestStrategy.calculate_indicators: EMA and RSI are always
+    # recomputed (with their defaults) once any window is given, MACD only on request
+    if params["EMA_DAYS"] or params["MACD_DAYS"] or params["RSI_DAYS"]:
+        # Each worker keeps its own indicator cache, so a window shared by many
+        # TP/SL/leverage combinations is only computed once per process
+        close = _shared["close"]
+        ema_values = ema(close, params["EMA_DAYS"] or 200)
+        rsi_values = rsi(close, params["RSI_DAYS"] or 14)
+        if params["MACD_DAYS"]:
+            macd_days = params["MACD_DAYS"]
+            macd_values, signal_line = macd(
+                close,
+                window_fast=macd_days.get("window_fast", 12),
+                window_slow=macd_days.get("window_slow", 26),
+                window_sign=macd_days.get("window_sign", 9),
+            )
+    return ema_values, macd_values, signal_line, rsi_values
+
+
+def combination_ledger(params):
+    # Trade ledger of one combination over the shared data, plus the close and
+    # indicator arrays it was run on
+    close = _shared["close"]
+    indicators = _indicators(params)
+    long_mask, short_mask = entry_signals(close, *indicators)
+    ledger = simulate(
+        close,
+        long_mask,
+        short_mask,
+        params["tp_percent"] / 100,
+        params["sl_percent"] / 100,
+        params["leverage"],
+        _shared["initial_margin"],
+        MAINTENANCE_MARGIN,
+        verbose=False,
+    )
+    columns = dict(zip(["EMA", "MACD", "Signal_Line", "RSI"], indicators))
+    columns["close"] = close
+    return ledger, columns
+
+
+def _run_one(params):
+    close = _shared["close"]
+    ledger, _ = combination_ledger(params)
+    row = dict(params)
+    row["trades"] = len(ledger)
+    row["win_rate"] = win_rate(ledger["trade_result"])
+    row["total_profit_loss"] = total_profit_loss(
+        ledger["trade_result"], ledger["liquidated"], _shared["initial_margin"]
+    )
+    # Compounding equity curve of the run, starting from one trade's margin
+    row.update(
+        risk_metrics(
+            close,
+            ledger,
+            params["leverage"],
+            _shared["initial_margin"],
+            periods_per_year=_shared["periods_per_year"],
+        )
+    )
+    return row
+
+
+def run_sweep(
+    data: pd.DataFrame,
+    grid: Dict[str, list],
+    initial_margin: int = 100,
+    processes: Optional[int] = None,
+    rank_by: Optional[List[str]] = None,
+    chunksize: Optional[int] = None,
+) -> pd.DataFrame:
+    combinations = expand_grid(grid)
+    arrays = prepare_arrays(data)
+    processes = processes or os.cpu_count() or 1
+    rank_by = rank_by or ["total_profit_loss", "win_rate"]
+    periods_per_year = (
+        bars_per_year(data["open_time"].to_numpy()) if "open_time" in data else None
+    )
+
+    if processes == 1:
+        _init_local(arrays, initial_margin, periods_per_year)
+        rows = [_run_one(params) for params in combinations]
+    else:
+        # Publish the trimmed arrays once; workers map them instead of receiving
+        # a pickled DataFrame with every task
+        shm = shared_memory.SharedMemory(create=True, size=max(arrays.nbytes, 1))
+        try:
+            shared = np.ndarray(arrays.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = arrays
+            del shared
+            if chunksize is None:
+                chunksize = max(1, len(combinations) // (processes * 4))
+            with Pool(
+                processes,
+                initializer=_init_worker,
+                initargs=(shm.name, arrays.shape, initial_margin, periods_per_year),
+            ) as pool:
+                rows = list(pool.imap(_run_one, combinations, chunksize))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    results = pd.DataFrame(
+        rows,
+        columns=PARAMETERS + ["trades", "win_rate", "total_profit_loss"] + METRICS,
+    )
+    return results.sort_values(rank_by, ascending=False, kind="stable").reset_index(
+        drop=True
+    )
@@ -0,0 +1,235 @@
+import os
+from multiprocessing import Pool, shared_memory
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    MAINTENANCE_MARGIN,
+    entry_signals,
+    simulate,
+    total_profit_loss,
+    trade_returns,
+    win_rate,
+)
+from kernels import ema_many, macd_many, rsi_many
+from sweep import PARAMETERS, expand_grid
+
+METRICS = ["trades", "win_rate", "total_profit_loss"]
+
+# Per-process views onto the shared block, set by _init_worker
+_shared = {}
+
+
+def _indicator_key(params):
+    macd_days = params["MACD_DAYS"] or {}
+    return (
+        params["EMA_DAYS"] or 200,
+        macd_days.get("window_fast", 12),
+        macd_days.get("window_slow", 26),
+        macd_days.get("window_sign", 9),
+        params["RSI_DAYS"] or 14,
+    )
+
+
+def _to_rows(open_time, size):
+    # Window sizes are given in candles or as a time span ("30D", Timedelta)
+    if isinstance(size, (int, np.integer)):
+        return int(size)
+    span = pd.Timedelta(size) // pd.Timedelta(milliseconds=1)
+    return int(np.searchsorted(open_time, open_time[0] + span))
+
+
+def split_windows(
+    open_time: np.ndarray,
+    train: Union[int, str, pd.Timedelta],
+    test: Union[int, str, pd.Timedelta],
+    step: Union[int, str, pd.Timedelta, None] = None,
+    start: int = 0,
+    anchored: bool = False,
+) -> List[tuple]:
+    # (train_start, train_end, test_start, test_end) row ranges. Rolling windows
+    # slide the train window forward; anchored ones keep it starting at `start`.
+    open_time = np.asarray(open_time[start:], dtype=np.int64)
+    train_rows = _to_rows(open_time, train)
+    test_rows = _to_rows(open_time, test)
+    step_rows = test_rows if step is None else _to_rows(open_time, step)
+    if train_rows <= 0 or test_rows <= 0 or step_rows <= 0:
+        raise ValueError("Walk-forward windows must span at least one candle")
+    windows = []
+    offset = 0
+    while offset + train_rows + test_rows <= len(open_time):
+        train_start = 0 if anchored else offset
+        train_end = offset + train_rows
+        windows.append(
+            (
+                start + train_start,
+                start + train_end,
+                start + train_end,
+                start + train_end + test_rows,
+            )
+        )
+        offset += step_rows
+    return windows
+
+
+def prepare_indicators(close: np.ndarray, combinations: List[dict]):
+    # Every distinct indicator setting is computed once over the whole history,
+    # so each window sees properly warmed-up values instead of restarting the
+    # EMAs at its first candle. Returns the stacked arrays, the row of each
+    # setting and the first candle where all of them are defined.
+    keys = list(dict.fromkeys(_indicator_key(params) for params in combinations))
+    ema_windows = sorted({key[0] for key in keys})
+    macd_settings = sorted({key[1:4] for key in keys})
+    rsi_windows = sorted({key[4] for key in keys})
+    # All windows of an indicator in one batched kernel call
+    ema_rows = dict(zip(ema_windows, ema_many(close, ema_windows)))
+    rsi_rows = dict(zip(rsi_windows, rsi_many(close, rsi_windows)))
+    macd_lines, signal_lines = macd_many(close, *zip(*macd_settings))
+    macd_rows = dict(zip(macd_settings, zip(macd_lines, signal_lines)))
+    rows = [close]
+    offsets = {}
+    for key in keys:
+        offsets[key] = len(rows)
+        rows.append(ema_rows[key[0]])
+        rows.extend(macd_rows[key[1:4]])
+        rows.append(rsi_rows[key[4]])
+    arrays = np.ascontiguousarray(np.vstack(rows), dtype=np.float64)
+    defined = ~np.isnan(arrays).any(axis=0)
+    warm_up = int(np.argmax(defined)) if defined.any() else len(close)
+    return arrays, offsets, warm_up
+
+
+def _init_worker(name, shape, offsets, initial_margin):
+    shm = shared_memory.SharedMemory(name=name)
+    _shared["shm"] = shm
+    _init_local(
+        np.ndarray(shape, dtype=np.float64, buffer=shm.buf), offsets, initial_margin
+    )
+
+
+def _init_local(arrays, offsets, initial_margin):
+    _shared["arrays"] = arrays
+    _shared["offsets"] = offsets
+    _shared["initial_margin"] = initial_margin
+
+
+def _evaluate(params, begin, end):
+    arrays = _shared["arrays"]
+    row = _shared["offsets"][_indicator_key(params)]
+    close = arrays[0, begin:end]
+    ema_values, macd_values, signal_line, rsi_values = arrays[row : row + 4, begin:end]
+    long_mask, short_mask = entry_signals(
+        close, ema_values, macd_values, signal_line, rsi_values
+    )
+    # Each window is a separate backtest: trades still open at its end are left
+    # open (no result), and nothing carries over into the next window
+    ledger = simulate(
+        close,
+        long_mask,
+        short_mask,
+        params["tp_percent"] / 100,
+        params["sl_percent"] / 100,
+        params["leverage"],
+        _shared["initial_margin"],
+        MAINTENANCE_MARGIN,
+        start=0,
+        verbose=False,
+    )
+    # Scored on the closed trades' real returns (the legacy trade_result has
+    # the wrong sign for shorts), like strategies.evaluate_strategies
+    returns = trade_returns(ledger, params["leverage"])
+    liquidated = ledger["liquidated"][ledger["exit_index"] >= 0]
+    return {
+        "trades": len(returns),
+        "win_rate": win_rate(returns),
+        "total_profit_loss": total_profit_loss(
+            returns, liquidated, _shared["initial_margin"]
+        ),
+    }
+
+
+def _run_window(task):
+    window, combinations, rank_by = task
+    train_start, train_end, test_start, test_end = window
+    scores = [_evaluate(params, train_start, train_end) for params in combinations]
+    # Best in-sample combination; ties keep the grid order like run_sweep
+    best = max(
+        range(len(combinations)),
+        key=lambda k: (tuple(scores[k][column] for column in rank_by), -k),
+    )
+    row = {
+        "train_start": train_start,
+        "train_end": train_end,
+        "test_start": test_start,
+        "test_end": test_end,
+    }
+    row.update(combinations[best])
+    row.update({f"train_{key}": value for key, value in scores[best].items()})
+    test = _evaluate(combinations[best], test_start, test_end)
+    row.update({f"test_{key}": value for key, value in test.items()})
+    return row
+
+
+def walk_forward(
+    data: pd.DataFrame,
+    grid: Dict[str, list],
+    train: Union[int, str, pd.Timedelta],
+    test: Union[int, str, pd.Timedelta],
+    step: Union[int, str, pd.Timedelta, None] = None,
+    anchored: bool = False,
+    initial_margin: int = 100,
+    processes: Optional[int] = None,
+    rank_by: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    # Optimise the grid on each train window and score the winner on the test
+    # window right after it. One row per window, in time order.
+    combinations = expand_grid(grid)
+    rank_by = rank_by or ["total_profit_loss", "win_rate"]
+    close = data["close"].to_numpy(dtype=np.float64)
+    open_time = pd.Series(data["open_time"])
+    if pd.api.types.is_datetime64_any_dtype(open_time):
+        open_time_ms = open_time.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    else:
+        open_time_ms = open_time.to_numpy(dtype=np.int64)
+
+    arrays, offsets, warm_up = prepare_indicators(close, combinations)
+    windows = split_windows(open_time_ms, train, test, step, warm_up, anchored)
+    tasks = [(window, combinations, rank_by) for window in windows]
+    processes = min(processes or os.cpu_count() or 1, max(len(tasks), 1))
+
+    if processes == 1:
+        _init_local(arrays, offsets, initial_margin)
+        rows = [_run_window(task) for task in tasks]
+    else:
+        # Publish the full-history arrays once; each worker maps them
+        shm = shared_memory.SharedMemory(create=True, size=max(arrays.nbytes, 1))
+        try:
+            shared = np.ndarray(arrays.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = arrays
+            del shared
+            with Pool(
+                processes,
+                initializer=_init_worker,
+                initargs=(shm.name, arrays.shape, offsets, initial_margin),
+            ) as pool:
+                rows = pool.map(_run_window, tasks, chunksize=1)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    results = pd.DataFrame(
+        rows,
+        columns=["train_start", "train_end", "test_start", "test_end"]
+        + PARAMETERS
+        + [f"train_{column}" for column in METRICS]
+        + [f"test_{column}" for column in METRICS],
+    )
+    # Row ranges are inclusive starts / exclusive ends; add the candle times
+    for column in ["train_start", "train_end", "test_start", "test_end"]:
+        positions = results[column].to_numpy(dtype=np.int64)
+        if column.endswith("_end"):
+            positions = positions - 1
+        results[f"{column}_time"] = pd.to_datetime(open_time_ms[positions], unit="ms")
+    return results
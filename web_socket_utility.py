@@ -3,17 +3,28 @@ import json
 from websockets.sync.client import connect
 from configs.config import FUTURES
 import time
+from async_stream import parse_kline
 
 
 class WebSocketHandler:
-    def __init__(self) -> None:
+    def __init__(self, recorder=None, publisher=None, connect: bool = True) -> None:
         self.kline_data = {}
+        # Optional recorder.CandleRecorder that persists every closed kline
+        self.recorder = recorder
+        # Optional shm_ring.RingPublisher that shares every kline (closed or
+        # not) with other processes on the host
+        self.publisher = publisher
         self.id = 1
         self.ws = None
         self.lock = threading.Lock()
         self.keep_running = True
         self.is_connected = False  # To track connection status
         self.subscriptions = []  # Store subscriptions to reapply on reconnect
+        # connect=False leaves the socket closed until start() is called
+        if connect:
+            self.start()
+
+    def start(self):
         t = threading.Thread(target=self.start_ws)
         t1 = threading.Thread(target=self.get_latest_data)
         t.daemon = True
@@ -71,6 +82,12 @@ class WebSocketHandler:
                 close_price = response["k"]["c"]
                 self.kline_data[symbol] = close_price
                 print(f"Kline Data: {self.kline_data}")
+                if self.publisher is not None or self.recorder is not None:
+                    kline = parse_kline(response)
+                    if self.publisher is not None:
+                        self.publisher.publish(kline)
+                    if self.recorder is not None and kline.closed:
+                        self.recorder.on_kline(kline)
             else:
                 print("Received a message that is not a kline event.")
         except Exception as e:
@@ -78,6 +95,10 @@ class WebSocketHandler:
 
     def stop(self):
         self.keep_running = False
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.publisher is not None:
+            self.publisher.close()
         print("WebSocket handler stopped.")
 
     def data_pulling_loop(self):